@@ -2,23 +2,52 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import sqlite3
-import bcrypt
 import smtplib
 from email.message import EmailMessage
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from sklearn.ensemble import RandomForestRegressor
-import numpy as np
-from fpdf import FPDF
 import logging
 import random
 import json
 import os
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk
+from graficos_tk import CanvasChart
+from configuracoes import get_setting, set_setting
+from senhas import (
+    hash_password, check_login, bcrypt_rounds, SETTING_BCRYPT_ROUNDS, MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS
+)
+from estoque_seguranca import (
+    stock_levels, dynamic_thresholds_enabled, recompute_thresholds,
+    close_of_day_due, SETTING_USE_DYNAMIC, SETTING_SERVICE_LEVEL, DEFAULT_SERVICE_LEVEL
+)
+from detector_demanda import DemandSurgeDetector
+from cubo_demanda import slice_cube, next_dimension, DIMENSIONS, MEASURES
+from esquema import create_schema
+from alteracoes import prune_changes
+from eventos import ChangeBus, is_reload
+import operacoes
+from operacoes import OperationError
+from importar_usuarios import read_users, validate_users, hash_passwords, insert_users
+from importar_doacoes import read_rows, validate_rows, insert_rows
+from unidades import register_units, shipment_units, scan_in, scan_out, UnitCache, UnitError, ScanSession
+from dados_relatorio import analytics_dataset, stock_demand_dataset, MIN_HISTORY_DAYS
+from copia_leitura import ReadOnlySnapshot, enable_wal, SETTING_REFRESH_SECONDS, DEFAULT_REFRESH_SECONDS
+from fila_relatorios import ReportQueue, SETTING_OUTPUT_DIR, DEFAULT_OUTPUT_DIR, STATUS_LABELS as REPORT_STATUS_LABELS
 
 # Configurações iniciais
 DB_NAME = 'blood_bank.db'
+CLOSE_OF_DAY_CHECK_MS = 10 * 60 * 1000  # Verifica o fechamento do dia a cada 10 minutos
+DETECTOR_FLUSH_MS = 60 * 1000  # Grava o estado do detector de picos a cada minuto
+REPORT_POLL_MS = 500  # Intervalo de atualização da fila de relatórios
+DASHBOARD_REFRESH_MS = 30 * 1000  # Atualiza o dashboard a cada 30 segundos
+CHANGE_POLL_MS = 1000  # Verifica alterações no banco (deste ou de outro posto) a cada segundo
+LOGIN_POLL_MS = 30  # Intervalo de verificação do resultado do login
+VIEW_FULL_REFRESH_ROWS = 500  # Acima disso a tela é recarregada inteira em vez de linha a linha
+BATCH_RESULT_LINES = 15  # Requisições não processadas listadas no resumo do lote
+SCAN_SESSION_POLL_MS = 100  # Intervalo do relógio da sessão de entrada (gravação e câmera)
+SNAPSHOT_POLL_MS = 200  # Intervalo de verificação da cópia de leitura em andamento
 logging.basicConfig(filename='system.log', level=logging.INFO)
 
 # %% Classe Principal
@@ -39,11 +68,55 @@ class BloodBankSystem:
         }
         
         self.conn = sqlite3.connect(DB_NAME)
+        enable_wal(self.conn)
         self.create_tables()
+        
+        # Cópia somente leitura usada pelas análises (não bloqueia o atendimento)
+        self.snapshot = ReadOnlySnapshot(DB_NAME)
         self.current_user = None
         self.alerts = []
         
+        # Senhas são conferidas numa thread separada (o bcrypt é lento de propósito)
+        self.auth_executor = ThreadPoolExecutor(max_workers=1)
+        self.login_future = None
+        
+        # E-mails de notificação saem em segundo plano, numa sessão SMTP por lote
+        self.notification_executor = ThreadPoolExecutor(max_workers=1)
+        
+        # Senhas da importação em lote codificadas fora da thread do login
+        # (que continua livre para conferir senhas enquanto o lote roda)
+        self.import_executor = ThreadPoolExecutor(max_workers=1)
+        
+        # Folhas de etiquetas montadas em segundo plano (os símbolos, num pool de processos)
+        self.label_executor = ThreadPoolExecutor(max_workers=1)
+        self.dashboard_chart = None
+        self.unit_cache = None
+        
+        # Barramento de alterações: cada tela aberta aplica só as linhas que mudaram
+        self.change_bus = ChangeBus(DB_NAME)
+        self.change_bus.subscribe('requests', self.apply_request_changes)
+        self.change_bus.subscribe('requests', self.apply_doctor_request_changes)
+        self.change_bus.subscribe('donations', self.apply_donation_changes)
+        self.change_bus.subscribe('stock', self.apply_stock_changes)
+        self.change_bus.subscribe('alerts', self.apply_alert_changes)
+        self.dashboard_stale = False
+        for table in ('stock', 'requests', 'donations'):
+            self.change_bus.subscribe(table, self.mark_dashboard_stale)
+        
+        # Detector de picos de demanda (estado em memória, gravado periodicamente)
+        self.demand_detector = DemandSurgeDetector(self.conn, on_alert=self.handle_demand_surge)
+        
+        # Fila de relatórios PDF gerados em processos separados
+        self.report_queue = ReportQueue(self.conn, DB_NAME, get_setting(self.conn, SETTING_OUTPUT_DIR, DEFAULT_OUTPUT_DIR))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         self.show_login_screen()
+        self.schedule_close_of_day()
+        self.schedule_detector_flush()
+        self.schedule_report_poll()
+        self.schedule_snapshot_refresh()
+        self.schedule_dashboard_refresh()
+        self.schedule_change_poll()
     
     def configure_styles(self):
         """Configura os estilos visuais do sistema"""
@@ -58,86 +131,10 @@ class BloodBankSystem:
     
     def create_tables(self):
         """Cria as tabelas no banco de dados"""
-        cursor = self.conn.cursor()
-        
-        # Tabela de usuários
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                username TEXT UNIQUE NOT NULL,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL CHECK(role IN ('admin', 'doctor', 'technician')),
-                email TEXT,
-                last_login TEXT,
-                is_active INTEGER DEFAULT 1
-            )''')
-        
-        # Tabela de tipos sanguíneos
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS blood_types (
-                type TEXT PRIMARY KEY,
-                min_stock INTEGER NOT NULL,
-                description TEXT
-            )''')
-        
-        # Tabela de estoque
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS stock (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                blood_type TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                entry_date TEXT NOT NULL,
-                expiration_date TEXT NOT NULL,
-                donor_id TEXT,
-                FOREIGN KEY (blood_type) REFERENCES blood_types(type)
-            )''')
-        
-        # Tabela de requisições
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                blood_type TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                requesting_doctor INTEGER NOT NULL,
-                request_date TEXT NOT NULL,
-                status TEXT NOT NULL CHECK(status IN ('pending', 'approved', 'rejected')),
-                response_date TEXT,
-                responding_staff INTEGER,
-                urgency TEXT CHECK(urgency IN ('Normal', 'Urgente', 'Emergência')),
-                patient_info TEXT,
-                FOREIGN KEY (blood_type) REFERENCES blood_types(type),
-                FOREIGN KEY (requesting_doctor) REFERENCES users(id),
-                FOREIGN KEY (responding_staff) REFERENCES users(id)
-            )''')
-        
-        # Tabela de alertas
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type TEXT NOT NULL,
-                message TEXT NOT NULL,
-                recipient_id INTEGER NOT NULL,
-                sent_date TEXT NOT NULL,
-                status TEXT NOT NULL CHECK(status IN ('sent', 'read')),
-                FOREIGN KEY (recipient_id) REFERENCES users(id)
-            )''')
-        
-        # Tabela de doações
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS donations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                donor_name TEXT NOT NULL,
-                donor_cpf TEXT,
-                donor_blood_type TEXT NOT NULL,
-                donation_date TEXT NOT NULL,
-                quantity INTEGER NOT NULL,
-                next_donation_date TEXT,
-                FOREIGN KEY (donor_blood_type) REFERENCES blood_types(type)
-            )''')
+        create_schema(self.conn)
         
         # Inserir dados iniciais
-        if not cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+        if not self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
             self.create_initial_data()
         
         self.conn.commit()
@@ -188,12 +185,8 @@ class BloodBankSystem:
         self.conn.commit()
     
     def hash_password(self, password):
-        """Gera hash seguro da senha usando bcrypt"""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-    
-    def verify_password(self, hashed_password, input_password):
-        """Verifica se a senha está correta"""
-        return bcrypt.checkpw(input_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        """Gera hash seguro da senha usando bcrypt, com o custo configurado"""
+        return hash_password(password, bcrypt_rounds(self.conn))
     
     def show_login_screen(self):
         """Exibe a tela de login"""
@@ -218,9 +211,9 @@ class BloodBankSystem:
         self.password_entry.grid(row=3, column=1, padx=5, pady=5)
         
         # Botão de login
-        login_btn = ttk.Button(login_frame, text="Acessar", style='Primary.TButton',
-                              command=self.authenticate)
-        login_btn.grid(row=4, column=0, columnspan=2, pady=20, ipadx=20, ipady=5)
+        self.login_btn = ttk.Button(login_frame, text="Acessar", style='Primary.TButton',
+                                    command=self.authenticate)
+        self.login_btn.grid(row=4, column=0, columnspan=2, pady=20, ipadx=20, ipady=5)
         
         # Botão de recuperação de senha
         ttk.Button(login_frame, text="Esqueci minha senha", style='TButton',
@@ -285,7 +278,10 @@ class BloodBankSystem:
         ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
     
     def authenticate(self):
-        """Autentica o usuário"""
+        """Autentica o usuário (a senha é conferida fora da thread da interface)"""
+        if self.login_future is not None:
+            return
+        
         username = self.username_entry.get()
         password = self.password_entry.get()
         
@@ -304,13 +300,41 @@ class BloodBankSystem:
             messagebox.showerror("Erro", "Esta conta está desativada. Contate o administrador.")
             return
         
-        if user and self.verify_password(user[3], password):
+        self.login_btn.config(state='disabled', text="Verificando...")
+        self.login_future = self.auth_executor.submit(
+            check_login, user[3] if user else None, password, bcrypt_rounds(self.conn))
+        self.root.after(LOGIN_POLL_MS, self.finish_authentication, username, user)
+    
+    def finish_authentication(self, username, user):
+        """Conclui o login quando a verificação da senha termina"""
+        if not self.login_future.done():
+            self.root.after(LOGIN_POLL_MS, self.finish_authentication, username, user)
+            return
+        
+        future, self.login_future = self.login_future, None
+        try:
+            valid, new_hash = future.result()
+        except ValueError as e:
+            # Hash gravado em formato inválido
+            self.log_activity(f"Falha ao conferir a senha de {username}: {str(e)}", level='ERROR')
+            valid, new_hash = False, None
+        
+        if self.login_btn.winfo_exists():
+            self.login_btn.config(state='normal', text="Acessar")
+        
+        if valid:
             self.current_user = {
                 'id': user[0],
                 'name': user[1],
                 'role': user[2]
             }
             
+            cursor = self.conn.cursor()
+            if new_hash:
+                # Custo do bcrypt mudou desde o último login: regrava o hash
+                cursor.execute("UPDATE users SET password = ? WHERE id = ?", (new_hash, user[0]))
+                self.log_activity(f"Hash da senha de {user[1]} atualizado para o custo {bcrypt_rounds(self.conn)}")
+            
             # Atualizar último login
             cursor.execute(
                 "UPDATE users SET last_login = ? WHERE id = ?",
@@ -378,6 +402,7 @@ class BloodBankSystem:
         if self.current_user['role'] in ['admin', 'technician']:
             self.create_requests_tab()
             self.create_donations_tab()
+            self.create_reports_tab()
         
         if self.current_user['role'] == 'doctor':
             self.create_doctor_tab()
@@ -420,58 +445,23 @@ class BloodBankSystem:
         summary_frame = ttk.LabelFrame(scrollable_frame, text="Resumo do Estoque", padding=15)
         summary_frame.pack(fill=tk.X, padx=10, pady=10)
         
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT b.type, COALESCE(SUM(s.quantity), 0), b.min_stock 
-            FROM blood_types b
-            LEFT JOIN stock s ON b.type = s.blood_type
-            GROUP BY b.type
-            ORDER BY b.type
-        ''')
-        
-        stock_data = cursor.fetchall()
-        
-        # Gráfico de barras do estoque
-        fig = plt.Figure(figsize=(10, 4), dpi=100)
-        ax = fig.add_subplot(111)
-        
-        types = [row[0] for row in stock_data]
-        quantities = [row[1] for row in stock_data]
-        min_stocks = [row[2] for row in stock_data]
-        
-        ax.bar(types, quantities, color='#d90429', label='Estoque Atual')
-        ax.plot(types, min_stocks, color='#ef233c', marker='o', linestyle='--', label='Estoque Mínimo')
-        
-        ax.set_title('Níveis de Estoque por Tipo Sanguíneo')
-        ax.set_xlabel('Tipo Sanguíneo')
-        ax.set_ylabel('Quantidade (unidades)')
-        ax.legend()
-        ax.grid(True, linestyle='--', alpha=0.6)
-        
-        canvas_graph = FigureCanvasTkAgg(fig, summary_frame)
-        canvas_graph.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Gráfico de barras do estoque (desenhado no próprio Canvas, sem matplotlib)
+        self.dashboard_chart = CanvasChart(summary_frame, title='Níveis de Estoque por Tipo Sanguíneo',
+                                           xlabel='Tipo Sanguíneo', ylabel='Quantidade (unidades)',
+                                           bar_label='Estoque Atual', line_label=self.threshold_label(),
+                                           width=900, height=400)
+        self.dashboard_chart.pack(fill=tk.BOTH, expand=True)
         
         # Cards de resumo
         metrics_frame = ttk.Frame(scrollable_frame)
         metrics_frame.pack(fill=tk.X, padx=10, pady=5)
         
-        # Total em estoque
-        total_stock = sum(quantities)
-        self.create_metric_card(metrics_frame, "Estoque Total", f"{total_stock} unidades", 0)
-        
-        # Requisições pendentes
-        cursor.execute("SELECT COUNT(*) FROM requests WHERE status = 'pending'")
-        pending_requests = cursor.fetchone()[0]
-        self.create_metric_card(metrics_frame, "Requisições Pendentes", str(pending_requests), 1)
-        
-        # Doações recentes
-        cursor.execute("SELECT COUNT(*) FROM donations WHERE date(donation_date) = date('now')")
-        today_donations = cursor.fetchone()[0]
-        self.create_metric_card(metrics_frame, "Doações Hoje", str(today_donations), 2)
-        
-        # Alertas
-        low_stock_types = sum(1 for row in stock_data if row[1] < row[2])
-        self.create_metric_card(metrics_frame, "Tipos com Estoque Baixo", str(low_stock_types), 3)
+        self.dashboard_metrics = {
+            'total_stock': self.create_metric_card(metrics_frame, "Estoque Total", "", 0),
+            'pending_requests': self.create_metric_card(metrics_frame, "Requisições Pendentes", "", 1),
+            'today_donations': self.create_metric_card(metrics_frame, "Doações Hoje", "", 2),
+            'low_stock_types': self.create_metric_card(metrics_frame, "Tipos com Estoque Baixo", "", 3),
+        }
         
         # Últimas requisições
         requests_frame = ttk.LabelFrame(scrollable_frame, text="Últimas Requisições", padding=15)
@@ -496,7 +486,46 @@ class BloodBankSystem:
         
         self.dashboard_requests_tree.pack(fill=tk.BOTH, expand=True)
         
-        # Preencher com as últimas 10 requisições
+        self.refresh_dashboard()
+    
+    def refresh_dashboard(self):
+        """Atualiza gráfico, cards e últimas requisições do dashboard sem recriá-los"""
+        if self.dashboard_chart is None or not self.dashboard_chart.winfo_exists():
+            return
+        
+        stock_data = stock_levels(self.conn)
+        
+        types = [row[0] for row in stock_data]
+        quantities = [row[1] for row in stock_data]
+        min_stocks = [row[2] for row in stock_data]
+        
+        # Só as barras e pontos que mudaram são redesenhados
+        self.dashboard_chart.set_data(types, quantities, min_stocks, line_label=self.threshold_label())
+        
+        # Cards de resumo
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM requests WHERE status = 'pending'")
+        pending_requests = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM donations WHERE date(donation_date) = date('now')")
+        today_donations = cursor.fetchone()[0]
+        low_stock_types = sum(1 for row in stock_data if row[1] < row[2])
+        
+        self.dashboard_metrics['total_stock'].config(text=f"{sum(quantities)} unidades")
+        self.dashboard_metrics['pending_requests'].config(text=str(pending_requests))
+        self.dashboard_metrics['today_donations'].config(text=str(today_donations))
+        self.dashboard_metrics['low_stock_types'].config(text=str(low_stock_types))
+        
+        # Estilo baseado no valor
+        low_stock_card = self.dashboard_metrics['low_stock_types'].master
+        if low_stock_types > 0:
+            low_stock_card.configure(relief='raised', style='Secondary.TFrame')
+        else:
+            low_stock_card.configure(relief='groove', style='TFrame')
+        
+        # Últimas 10 requisições
+        for item in self.dashboard_requests_tree.get_children():
+            self.dashboard_requests_tree.delete(item)
+        
         cursor.execute('''
             SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status
             FROM requests r
@@ -514,6 +543,43 @@ class BloodBankSystem:
             
             self.dashboard_requests_tree.insert('', 'end', values=row[:5] + (status_text,))
     
+    def mark_dashboard_stale(self, events):
+        """Marca o dashboard para ser atualizado uma vez ao fim da rodada de eventos"""
+        self.dashboard_stale = True
+    
+    def apply_alert_changes(self, events):
+        """Atualiza o contador de notificações quando chegam alertas"""
+        alert_btn = getattr(self, 'alert_btn', None)
+        if self.current_user is None or alert_btn is None or not alert_btn.winfo_exists():
+            return
+        self.load_alerts()
+        alert_btn.config(text=f"🔔 {len(self.alerts)}" if self.alerts else "🔔",
+                         style='Primary.TButton' if self.alerts else 'TButton')
+    
+    def poll_changes(self):
+        """Aplica nas telas abertas as alterações gravadas no banco, por este ou por outro posto"""
+        try:
+            self.change_bus.poll()
+            if self.dashboard_stale:
+                self.dashboard_stale = False
+                self.refresh_dashboard()
+        except (sqlite3.Error, tk.TclError) as e:
+            self.log_activity(f"Falha ao aplicar alterações nas telas: {str(e)}", level='ERROR')
+    
+    def schedule_change_poll(self):
+        """Verifica periodicamente o registro de alterações"""
+        self.poll_changes()
+        self.root.after(CHANGE_POLL_MS, self.schedule_change_poll)
+    
+    def schedule_dashboard_refresh(self):
+        """Atualiza periodicamente o dashboard, se ele estiver na tela"""
+        try:
+            self.refresh_dashboard()
+        except sqlite3.Error as e:
+            self.log_activity(f"Falha ao atualizar o dashboard: {str(e)}", level='ERROR')
+        
+        self.root.after(DASHBOARD_REFRESH_MS, self.schedule_dashboard_refresh)
+    
     def create_metric_card(self, parent, title, value, column):
         """Cria um card de métrica para o dashboard"""
         card = ttk.Frame(parent, relief='groove', borderwidth=2)
@@ -521,11 +587,9 @@ class BloodBankSystem:
         parent.columnconfigure(column, weight=1)
         
         ttk.Label(card, text=title, font=('Arial', 10, 'bold')).pack(pady=(5, 0))
-        ttk.Label(card, text=value, font=('Arial', 14, 'bold'), foreground='#d90429').pack(pady=(0, 5))
-        
-        # Estilo baseado no valor
-        if title == "Tipos com Estoque Baixo" and int(value) > 0:
-            card.configure(relief='raised', style='Secondary.TFrame')
+        value_label = ttk.Label(card, text=value, font=('Arial', 14, 'bold'), foreground='#d90429')
+        value_label.pack(pady=(0, 5))
+        return value_label
     
     def create_stock_tab(self):
         """Cria a aba de estoque"""
@@ -551,6 +615,33 @@ class BloodBankSystem:
             report_btn = ttk.Button(control_frame, text="Gerar Relatório", style='Success.TButton',
                                   command=self.generate_stock_report)
             report_btn.grid(row=0, column=3, padx=5)
+            
+            # Remessa do centro regional em planilha
+            ttk.Button(control_frame, text="Importar Remessa", style='Primary.TButton',
+                      command=lambda: self.import_donation_file('shipment')).grid(row=0, column=4, padx=5)
+            
+            # Leitura de bolsas pelo código de barras (leitor USB digita o código e Enter)
+            scan_frame = ttk.LabelFrame(stock_tab, text="Leitura de Bolsas", padding=10)
+            scan_frame.pack(fill=tk.X, padx=10)
+            
+            self.scan_mode = tk.StringVar(value='in')
+            ttk.Radiobutton(scan_frame, text="Entrada", variable=self.scan_mode, value='in').pack(side=tk.LEFT, padx=5)
+            ttk.Radiobutton(scan_frame, text="Saída", variable=self.scan_mode, value='out').pack(side=tk.LEFT, padx=5)
+            
+            ttk.Label(scan_frame, text="Código:").pack(side=tk.LEFT, padx=5)
+            self.scan_entry = ttk.Entry(scan_frame, width=24)
+            self.scan_entry.pack(side=tk.LEFT, padx=5)
+            self.scan_entry.bind('<Return>', lambda e: self.process_scan())
+            
+            ttk.Button(scan_frame, text="Sessão de Entrada", style='Primary.TButton',
+                      command=self.open_scan_session).pack(side=tk.LEFT, padx=5)
+            
+            self.scan_status_label = ttk.Label(scan_frame, text="")
+            self.scan_status_label.pack(side=tk.LEFT, padx=10)
+            
+            # Cache das bolsas carregado uma vez para o posto de leitura
+            if self.unit_cache is None:
+                self.unit_cache = UnitCache(self.conn)
         
         # Atualizar lista de tipos
         self.update_blood_types()
@@ -569,6 +660,172 @@ class BloodBankSystem:
         # Atualizar dados
         self.update_stock_display()
     
+    def process_scan(self):
+        """Registra a entrada ou a saída da bolsa cujo código foi lido"""
+        code = self.scan_entry.get().strip()
+        self.scan_entry.delete(0, tk.END)
+        if not code:
+            return
+        
+        try:
+            if self.scan_mode.get() == 'in':
+                unit = scan_in(self.conn, code, cache=self.unit_cache)
+                text = f"✅ Entrada: {code} ({unit.blood_type})"
+            else:
+                unit = scan_out(self.conn, code, reason="Saída pelo leitor", cache=self.unit_cache)
+                text = f"✅ Saída: {code} ({unit.blood_type})"
+        except UnitError as e:
+            self.root.bell()
+            self.scan_status_label.config(text=f"❌ {str(e)}", foreground='#d90429')
+            return
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Falha ao registrar leitura: {str(e)}")
+            return
+        
+        self.scan_status_label.config(text=text, foreground='#2b9348')
+        self.log_activity(f"Leitura de bolsa ({self.scan_mode.get()}): {code}")
+        self.poll_changes()
+        self.check_stock_levels(unit.blood_type)
+    
+    def open_scan_session(self):
+        """Recebimento de uma entrega: leitura contínua das bolsas com gravação em grupo"""
+        session = ScanSession(self.conn, cache=self.unit_cache)
+        state = {'pipeline': None, 'closed': False}
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Sessão de Entrada de Bolsas")
+        dialog.geometry("560x480")
+        
+        ttk.Label(dialog, text="Leia as bolsas em sequência; a gravação é feita em grupo.",
+                  font=('Arial', 11)).pack(pady=10)
+        
+        entry = ttk.Entry(dialog, width=30, font=('Arial', 14))
+        entry.pack(pady=5)
+        entry.focus_set()
+        
+        last_label = ttk.Label(dialog, text="", font=('Arial', 11))
+        last_label.pack(pady=5)
+        counters_label = ttk.Label(dialog, text="")
+        counters_label.pack(pady=5)
+        
+        tally_tree = ttk.Treeview(dialog, columns=('type', 'quantity'), show='headings', height=8)
+        tally_tree.heading('type', text='Tipo')
+        tally_tree.heading('quantity', text='Bolsas recebidas')
+        tally_tree.column('type', width=100, anchor='center')
+        tally_tree.column('quantity', width=150, anchor='center')
+        tally_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        def refresh_counters():
+            counters_label.config(text=f"Gravadas: {session.stored}  |  No buffer: {len(session.pending)}  |  "
+                                       f"Repetidas: {session.duplicates}  |  Recusadas: {len(session.rejected)}")
+        
+        def refresh_tally():
+            tally_tree.delete(*tally_tree.get_children())
+            for blood_type, quantity in sorted(session.tally.items()):
+                tally_tree.insert('', 'end', values=(blood_type, quantity))
+        
+        def flush(force=False):
+            try:
+                units = session.flush() if force else session.flush_if_due()
+            except sqlite3.Error as e:
+                last_label.config(text=f"❌ Falha ao gravar (nova tentativa em seguida): {str(e)}", foreground='#d90429')
+                self.log_activity(f"Erro na sessão de entrada: {str(e)}", level='ERROR')
+                return False
+            if units:
+                refresh_tally()
+                self.poll_changes()
+            return True
+        
+        def add_code(code):
+            before = session.flushes
+            try:
+                accepted, message = session.add(code)
+            except sqlite3.Error as e:
+                accepted, message = False, f"Falha ao gravar: {str(e)}"
+            if accepted:
+                last_label.config(text=f"✅ {message}", foreground='#2b9348')
+            elif message != "Código vazio":
+                self.root.bell()
+                last_label.config(text=f"❌ {message}", foreground='#d90429')
+            if session.flushes != before:
+                refresh_tally()
+                self.poll_changes()
+            refresh_counters()
+        
+        def on_return(event=None):
+            code = entry.get()
+            entry.delete(0, tk.END)
+            add_code(code)
+        
+        def tick():
+            if state['closed']:
+                return
+            pipeline = state['pipeline']
+            if pipeline is not None:
+                # Códigos da câmera que chegaram desde a última volta
+                while True:
+                    try:
+                        scan = pipeline.results.get_nowait()
+                    except queue.Empty:
+                        break
+                    if scan is None:
+                        pipeline.stop()
+                        state['pipeline'] = None
+                        camera_btn.config(text="Usar Câmera")
+                        break
+                    add_code(scan.code)
+            if flush():
+                refresh_counters()
+            dialog.after(SCAN_SESSION_POLL_MS, tick)
+        
+        def toggle_camera():
+            if state['pipeline'] is not None:
+                state['pipeline'].stop()
+                state['pipeline'] = None
+                camera_btn.config(text="Usar Câmera")
+                return
+            try:
+                from lercodigo_barras import ScanPipeline
+                state['pipeline'] = ScanPipeline(0).start()
+            except ImportError:
+                messagebox.showerror("Erro", "A leitura pela câmera requer os pacotes opencv-python e pyzbar "
+                                             "(pip install opencv-python pyzbar)", parent=dialog)
+                return
+            except OSError as e:
+                messagebox.showerror("Erro", f"Falha ao abrir a câmera: {str(e)}", parent=dialog)
+                return
+            camera_btn.config(text="Parar Câmera")
+        
+        def finish():
+            if state['pipeline'] is not None:
+                state['pipeline'].stop()
+                state['pipeline'] = None
+            if not flush(force=True):
+                if not messagebox.askyesno("Sessão de Entrada",
+                                           f"{len(session.pending)} leituras não foram gravadas. Fechar mesmo assim?",
+                                           parent=dialog):
+                    return
+            state['closed'] = True
+            dialog.destroy()
+            
+            self.log_activity(f"Sessão de entrada: {session.stored} bolsas gravadas, {len(session.rejected)} recusadas "
+                              f"por {self.current_user['name']}")
+            for blood_type in sorted(session.tally):
+                self.check_stock_levels(blood_type)
+            self.scan_status_label.config(text=f"✅ Sessão: {session.stored} bolsas recebidas", foreground='#2b9348')
+        
+        entry.bind('<Return>', on_return)
+        
+        btn_frame = ttk.Frame(dialog)
+        btn_frame.pack(pady=10)
+        camera_btn = ttk.Button(btn_frame, text="Usar Câmera", command=toggle_camera)
+        camera_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Encerrar Sessão", style='Primary.TButton', command=finish).pack(side=tk.LEFT, padx=5)
+        dialog.protocol("WM_DELETE_WINDOW", finish)
+        
+        refresh_counters()
+        dialog.after(SCAN_SESSION_POLL_MS, tick)
+    
     def show_add_stock_dialog(self):
         """Mostra diálogo para adicionar estoque"""
         dialog = tk.Toplevel(self.root)
@@ -624,16 +881,21 @@ class BloodBankSystem:
                     INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
                     VALUES (?, ?, ?, ?, ?)
                 ''', (blood_type, quantity, datetime.now().isoformat(), expiry_date, donor_id or None))
+                stock_id = cursor.lastrowid
+                register_units(self.conn, shipment_units(stock_id, blood_type, quantity, expiry_date))
                 
                 self.conn.commit()
                 
                 messagebox.showinfo("Sucesso", "Estoque adicionado com sucesso!")
-                self.update_stock_display()
+                self.poll_changes()
                 dialog.destroy()
                 
                 # Verificar se estoque saiu do nível crítico
                 self.check_stock_levels(blood_type)
                 
+                if messagebox.askyesno("Etiquetas", f"Gerar as etiquetas das {quantity} bolsas?"):
+                    self.print_labels('shipment', [stock_id])
+                
             except ValueError:
                 messagebox.showerror("Erro", "Quantidade deve ser um número positivo!")
             except Exception as e:
@@ -655,20 +917,14 @@ class BloodBankSystem:
             self.blood_type_combo.current(0)
     
     def update_stock_display(self):
-        """Atualiza a exibição do estoque"""
+        """Atualiza a exibição do estoque (uma linha por tipo, identificada pelo tipo)"""
+        levels = stock_levels(self.conn)
+        current = {row[0] for row in levels}
         for item in self.stock_tree.get_children():
-            self.stock_tree.delete(item)
+            if item not in current:
+                self.stock_tree.delete(item)
         
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT b.type, COALESCE(SUM(s.quantity), 0), b.min_stock 
-            FROM blood_types b
-            LEFT JOIN stock s ON b.type = s.blood_type
-            GROUP BY b.type
-            ORDER BY b.type
-        ''')
-        
-        for row in cursor.fetchall():
+        for index, row in enumerate(levels):
             stock = row[1]
             min_stock = row[2]
             
@@ -679,121 +935,21 @@ class BloodBankSystem:
                 status = "✅ OK"
                 tag = ''
             
-            self.stock_tree.insert('', 'end', values=(row[0], stock, min_stock, status), tags=(tag,))
+            values = (row[0], stock, min_stock, status)
+            if self.stock_tree.exists(row[0]):
+                self.stock_tree.item(row[0], values=values, tags=(tag,))
+            else:
+                self.stock_tree.insert('', index, iid=row[0], values=values, tags=(tag,))
+    
+    def apply_stock_changes(self, events):
+        """Atualiza a aba de estoque após alterações na tabela stock"""
+        tree = getattr(self, 'stock_tree', None)
+        if tree is not None and tree.winfo_exists():
+            self.update_stock_display()
     
     def generate_stock_report(self):
-        """Gera relatório PDF do estoque atual"""
-        try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', 'B', 16)
-            
-            # Título
-            pdf.cell(0, 10, 'Relatório de Estoque de Sangue', 0, 1, 'C')
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, f'Emitido em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
-            pdf.cell(0, 10, f'Emitido por: {self.current_user["name"]}', 0, 1, 'C')
-            pdf.ln(10)
-            
-            # Dados do estoque
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, 'Níveis de Estoque por Tipo Sanguíneo', 0, 1)
-            pdf.set_font('Arial', '', 10)
-            
-            # Cabeçalho da tabela
-            pdf.set_fill_color(200, 220, 255)
-            pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
-            pdf.cell(40, 10, 'Quantidade', 1, 0, 'C', 1)
-            pdf.cell(40, 10, 'Estoque Mínimo', 1, 0, 'C', 1)
-            pdf.cell(70, 10, 'Status', 1, 1, 'C', 1)
-            
-            pdf.set_fill_color(255, 255, 255)
-            
-            # Obter dados do estoque
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT b.type, COALESCE(SUM(s.quantity), 0), b.min_stock 
-                FROM blood_types b
-                LEFT JOIN stock s ON b.type = s.blood_type
-                GROUP BY b.type
-                ORDER BY b.type
-            ''')
-            
-            for row in cursor.fetchall():
-                blood_type = row[0]
-                stock = row[1]
-                min_stock = row[2]
-                
-                if stock < min_stock:
-                    status = f"ESTOQUE BAIXO (faltam {min_stock - stock} unidades)"
-                    pdf.set_text_color(255, 0, 0)  # Vermelho
-                else:
-                    status = "OK"
-                    pdf.set_text_color(0, 0, 0)  # Preto
-                
-                pdf.cell(40, 10, blood_type, 1, 0, 'C')
-                pdf.cell(40, 10, str(stock), 1, 0, 'C')
-                pdf.cell(40, 10, str(min_stock), 1, 0, 'C')
-                pdf.cell(70, 10, status, 1, 1, 'C')
-            
-            # Itens próximos a vencer
-            pdf.ln(10)
-            pdf.set_font('Arial', 'B', 12)
-            pdf.set_text_color(0, 0, 0)
-            pdf.cell(0, 10, 'Itens Próximos do Vencimento (7 dias)', 0, 1)
-            pdf.set_font('Arial', '', 10)
-            
-            # Cabeçalho da tabela
-            pdf.set_fill_color(200, 220, 255)
-            pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
-            pdf.cell(40, 10, 'Quantidade', 1, 0, 'C', 1)
-            pdf.cell(40, 10, 'Data Validade', 1, 0, 'C', 1)
-            pdf.cell(70, 10, 'Dias Restantes', 1, 1, 'C', 1)
-            
-            pdf.set_fill_color(255, 255, 255)
-            
-            # Obter itens próximos a vencer
-            cursor.execute('''
-                SELECT blood_type, quantity, expiration_date 
-                FROM stock 
-                WHERE date(expiration_date) BETWEEN date('now') AND date('now', '+7 days')
-                ORDER BY expiration_date
-            ''')
-            
-            today = datetime.now().date()
-            has_expiring = False
-            
-            for row in cursor.fetchall():
-                has_expiring = True
-                expiry_date = datetime.strptime(row[2], '%Y-%m-%d').date()
-                days_left = (expiry_date - today).days
-                
-                pdf.cell(40, 10, row[0], 1, 0, 'C')
-                pdf.cell(40, 10, str(row[1]), 1, 0, 'C')
-                pdf.cell(40, 10, expiry_date.strftime('%d/%m/%Y'), 1, 0, 'C')
-                
-                if days_left <= 0:
-                    pdf.set_text_color(255, 0, 0)
-                    status = "VENCIDO"
-                else:
-                    pdf.set_text_color(255, 165, 0)  # Laranja
-                    status = f"{days_left} dias"
-                
-                pdf.cell(70, 10, status, 1, 1, 'C')
-                pdf.set_text_color(0, 0, 0)
-            
-            if not has_expiring:
-                pdf.cell(0, 10, 'Nenhum item próximo do vencimento', 1, 1, 'C')
-            
-            # Salvar PDF
-            filename = f"relatorio_estoque_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            pdf.output(filename)
-            
-            messagebox.showinfo("Sucesso", f"Relatório gerado com sucesso:\n{filename}")
-            
-        except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao gerar relatório: {str(e)}")
-            self.log_activity(f"Erro ao gerar relatório de estoque: {str(e)}", level='ERROR')
+        """Coloca o relatório PDF do estoque atual na fila de relatórios"""
+        self.enqueue_report('stock', 'Estoque', 'relatorio_estoque')
     
     def create_requests_tab(self):
         """Cria a aba para gerenciar requisições (técnicos e admin)"""
@@ -817,6 +973,21 @@ class BloodBankSystem:
         self.doctor_search_entry.grid(row=0, column=3, padx=5)
         self.doctor_search_entry.bind('<KeyRelease>', lambda e: self.update_requests_display())
         
+        # Filtros do relatório
+        ttk.Label(control_frame, text="Relatório - Tipo:").grid(row=0, column=4, padx=5)
+        self.request_report_type_combo = ttk.Combobox(control_frame, state="readonly", width=8)
+        self.request_report_type_combo['values'] = ['Todos'] + [row[0] for row in self.conn.execute(
+            "SELECT type FROM blood_types ORDER BY type").fetchall()]
+        self.request_report_type_combo.current(0)
+        self.request_report_type_combo.grid(row=0, column=5, padx=5)
+        
+        ttk.Label(control_frame, text="De (DD/MM/AAAA):").grid(row=0, column=6, padx=5)
+        self.request_report_from_entry = ttk.Entry(control_frame, width=12)
+        self.request_report_from_entry.grid(row=0, column=7, padx=5)
+        ttk.Label(control_frame, text="Até:").grid(row=0, column=8, padx=5)
+        self.request_report_to_entry = ttk.Entry(control_frame, width=12)
+        self.request_report_to_entry.grid(row=0, column=9, padx=5)
+        
         # Treeview para requisições
         self.requests_tree = ttk.Treeview(tab, columns=('id', 'type', 'qty', 'doctor', 'date', 'status', 'urgency'), show='headings')
         self.requests_tree.heading('id', text='ID')
@@ -852,12 +1023,8 @@ class BloodBankSystem:
         
         self.update_requests_display()
     
-    def update_requests_display(self):
-        """Atualiza a lista de requisições"""
-        for item in self.requests_tree.get_children():
-            self.requests_tree.delete(item)
-        
-        cursor = self.conn.cursor()
+    def query_requests_view(self, row_ids=None):
+        """Requisições visíveis com os filtros atuais (opcionalmente só as de `row_ids`)"""
         filter_status = self.filter_combo.get()
         doctor_search = self.doctor_search_entry.get().strip()
         
@@ -879,33 +1046,79 @@ class BloodBankSystem:
             conditions.append("u.name LIKE ?")
             params.append(f"%{doctor_search}%")
         
+        if row_ids is not None:
+            conditions.append(f"r.id IN ({', '.join('?' for _ in row_ids)})")
+            params.extend(row_ids)
+        
         if conditions:
             query += " WHERE " + " AND ".join(conditions)
         
         query += " ORDER BY r.request_date DESC"
         
-        cursor.execute(query, params)
+        return self.conn.execute(query, params).fetchall()
+    
+    def request_row(self, row):
+        """Valores e tags de uma linha da lista de requisições"""
+        status_text = {
+            'pending': '⏳ Pendente',
+            'approved': '✅ Aprovada',
+            'rejected': '❌ Rejeitada'
+        }.get(row[5], row[5])
+        
+        urgency_text = row[6] or "Normal"
+        if urgency_text == "Emergência":
+            urgency_text = "🚨 " + urgency_text
+        elif urgency_text == "Urgente":
+            urgency_text = "⚠️ " + urgency_text
+        
+        return row[:5] + (status_text, urgency_text), (row[5],)
+    
+    def update_requests_display(self):
+        """Atualiza a lista de requisições"""
+        for item in self.requests_tree.get_children():
+            self.requests_tree.delete(item)
         
-        for row in cursor.fetchall():
-            status_text = {
-                'pending': '⏳ Pendente',
-                'approved': '✅ Aprovada',
-                'rejected': '❌ Rejeitada'
-            }.get(row[5], row[5])
-            
-            urgency_text = row[6] or "Normal"
-            if urgency_text == "Emergência":
-                urgency_text = "🚨 " + urgency_text
-            elif urgency_text == "Urgente":
-                urgency_text = "⚠️ " + urgency_text
-            
-            self.requests_tree.insert('', 'end', values=row[:5] + (status_text, urgency_text), 
-                                    tags=(row[5],))
+        for row in self.query_requests_view():
+            values, tags = self.request_row(row)
+            self.requests_tree.insert('', 'end', iid=row[0], values=values, tags=tags)
         
         self.requests_tree.tag_configure('pending', background='#fff3cd')
         self.requests_tree.tag_configure('approved', background='#d4edda')
         self.requests_tree.tag_configure('rejected', background='#f8d7da')
     
+    def apply_request_changes(self, events):
+        """Aplica na lista de requisições só as linhas alteradas"""
+        tree = getattr(self, 'requests_tree', None)
+        if tree is None or not tree.winfo_exists():
+            return
+        if is_reload(events) or len(events) > VIEW_FULL_REFRESH_ROWS:
+            self.update_requests_display()
+            return
+        
+        row_ids = [event.row_id for event in events]
+        visible = {row[0]: row for row in self.query_requests_view(row_ids)}
+        for row_id in row_ids:
+            if row_id in visible:
+                values, tags = self.request_row(visible[row_id])
+                self.upsert_tree_row(tree, row_id, values, tags, sort_column='date')
+            elif tree.exists(row_id):
+                # Excluída ou fora dos filtros atuais
+                tree.delete(row_id)
+    
+    def upsert_tree_row(self, tree, iid, values, tags=(), sort_column=None):
+        """Atualiza a linha `iid` ou a insere na posição da ordem decrescente de `sort_column`"""
+        if tree.exists(iid):
+            tree.item(iid, values=values, tags=tags)
+            return
+        
+        index = 0
+        if sort_column is not None:
+            key = str(values[tree['columns'].index(sort_column)])
+            children = tree.get_children()
+            index = next((position for position, child in enumerate(children)
+                          if tree.set(child, sort_column) < key), len(children))
+        tree.insert('', index, iid=iid, values=values, tags=tags)
+    
     def view_request_details(self):
         """Mostra detalhes da requisição selecionada"""
         selected = self.requests_tree.selection()
@@ -968,81 +1181,57 @@ class BloodBankSystem:
         ttk.Button(btn_frame, text="Fechar", command=dialog.destroy).pack()
     
     def approve_request(self):
-        """Aprova a requisição selecionada"""
+        """Aprova as requisições selecionadas, das mais urgentes para as menos urgentes"""
         selected = self.requests_tree.selection()
         if not selected:
             messagebox.showwarning("Aviso", "Selecione uma requisição para aprovar!")
             return
         
-        request_id = self.requests_tree.item(selected[0])['values'][0]
+        request_ids = [self.requests_tree.item(item)['values'][0] for item in selected]
+        if len(request_ids) > 1 and not messagebox.askyesno(
+                "Confirmar", f"Aprovar as {len(request_ids)} requisições selecionadas?"):
+            return
         
         try:
-            cursor = self.conn.cursor()
-            
-            # Obter dados da requisição
-            cursor.execute('''
-                SELECT blood_type, quantity FROM requests WHERE id = ? AND status = 'pending'
-            ''', (request_id,))
-            request_data = cursor.fetchone()
-            
-            if not request_data:
-                messagebox.showerror("Erro", "Requisição já processada ou não encontrada!")
-                return
-            
-            blood_type, quantity = request_data
-            
-            # Verificar estoque
-            cursor.execute('''
-                SELECT SUM(quantity) FROM stock WHERE blood_type = ?
-            ''', (blood_type,))
-            current_stock = cursor.fetchone()[0] or 0
-            
-            if current_stock < quantity:
-                messagebox.showerror("Erro", f"Estoque insuficiente! Disponível: {current_stock}")
-                return
-            
-            # Atualizar requisição
-            cursor.execute('''
-                UPDATE requests 
-                SET status = 'approved', 
-                    responding_staff = ?,
-                    response_date = ?
-                WHERE id = ?
-            ''', (self.current_user['id'], datetime.now().isoformat(), request_id))
-            
-            # Remover do estoque
-            cursor.execute('''
-                INSERT INTO stock (blood_type, quantity, entry_date, expiration_date)
-                VALUES (?, ?, ?, ?)
-            ''', (blood_type, -quantity, datetime.now().isoformat(), datetime.now().isoformat()))
-            
-            self.conn.commit()
-            
-            messagebox.showinfo("Sucesso", "Requisição aprovada e estoque atualizado!")
-            self.update_requests_display()
-            self.update_stock_display()
-            
-            # Enviar notificação ao médico
-            self.notify_doctor(request_id, approved=True)
-            
-        except sqlite3.Error as e:
+            # Confere status e estoque, baixa o estoque e grava tudo numa transação
+            approved, skipped = operacoes.approve_requests(self.conn, request_ids, self.current_user['id'])
+        except (sqlite3.Error, OperationError) as e:
             messagebox.showerror("Erro", f"Falha ao aprovar requisição: {str(e)}")
+            return
+        
+        for _, blood_type, quantity in approved:
+            self.demand_detector.observe(blood_type, quantity, 'approved')
+        self.poll_changes()
+        
+        if len(request_ids) == 1:
+            if skipped:
+                messagebox.showerror("Erro", skipped[0][1])
+            else:
+                messagebox.showinfo("Sucesso", "Requisição aprovada e estoque atualizado!")
+        else:
+            self.show_batch_result("Aprovação em Lote", f"{len(approved)} requisições aprovadas e estoque atualizado.",
+                                   skipped)
+        
+        # Enviar notificação aos médicos
+        self.notify_doctors([request_id for request_id, _, _ in approved], approved=True)
     
     def reject_request(self):
-        """Rejeita a requisição selecionada"""
+        """Rejeita as requisições selecionadas com um mesmo motivo"""
         selected = self.requests_tree.selection()
         if not selected:
             messagebox.showwarning("Aviso", "Selecione uma requisição para rejeitar!")
             return
         
-        request_id = self.requests_tree.item(selected[0])['values'][0]
+        request_ids = [self.requests_tree.item(item)['values'][0] for item in selected]
         
         # Pedir motivo da rejeição
         dialog = tk.Toplevel(self.root)
         dialog.title("Motivo da Rejeição")
         dialog.geometry("400x200")
         
-        ttk.Label(dialog, text="Informe o motivo da rejeição:", font=('Arial', 11)).pack(pady=10)
+        prompt = ("Informe o motivo da rejeição:" if len(request_ids) == 1
+                  else f"Informe o motivo da rejeição ({len(request_ids)} requisições):")
+        ttk.Label(dialog, text=prompt, font=('Arial', 11)).pack(pady=10)
         
         reason_text = scrolledtext.ScrolledText(dialog, width=40, height=5)
         reason_text.pack(pady=5, padx=10)
@@ -1054,27 +1243,24 @@ class BloodBankSystem:
                 return
             
             try:
-                cursor = self.conn.cursor()
-                cursor.execute('''
-                    UPDATE requests 
-                    SET status = 'rejected', 
-                        responding_staff = ?,
-                        response_date = ?,
-                        patient_info = COALESCE(patient_info, '') || '\nMotivo da rejeição: ' || ?
-                    WHERE id = ?
-                ''', (self.current_user['id'], datetime.now().isoformat(), reason, request_id))
-                
-                self.conn.commit()
-                
-                messagebox.showinfo("Sucesso", "Requisição rejeitada!")
-                dialog.destroy()
-                self.update_requests_display()
-                
-                # Enviar notificação ao médico
-                self.notify_doctor(request_id, approved=False, reason=reason)
-                
-            except sqlite3.Error as e:
+                rejected, skipped = operacoes.reject_requests(self.conn, request_ids, self.current_user['id'], reason)
+            except (sqlite3.Error, OperationError) as e:
                 messagebox.showerror("Erro", f"Falha ao rejeitar requisição: {str(e)}")
+                return
+            
+            dialog.destroy()
+            self.poll_changes()
+            
+            if len(request_ids) == 1:
+                if skipped:
+                    messagebox.showerror("Erro", skipped[0][1])
+                else:
+                    messagebox.showinfo("Sucesso", "Requisição rejeitada!")
+            else:
+                self.show_batch_result("Rejeição em Lote", f"{len(rejected)} requisições rejeitadas.", skipped)
+            
+            # Enviar notificação aos médicos
+            self.notify_doctors(rejected, approved=False, reason=reason)
         
         btn_frame = ttk.Frame(dialog)
         btn_frame.pack(pady=10)
@@ -1082,70 +1268,88 @@ class BloodBankSystem:
         ttk.Button(btn_frame, text="Confirmar", style='Secondary.TButton', command=confirm_reject).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
     
-    def notify_doctor(self, request_id, approved, reason=None):
-        """Envia notificação ao médico sobre a requisição"""
-        cursor = self.conn.cursor()
+    def show_batch_result(self, title, summary, skipped):
+        """Resumo de uma operação em lote, com as requisições que ficaram de fora"""
+        if skipped:
+            lines = [f"#{request_id}: {reason}" for request_id, reason in skipped[:BATCH_RESULT_LINES]]
+            if len(skipped) > BATCH_RESULT_LINES:
+                lines.append(f"... e mais {len(skipped) - BATCH_RESULT_LINES}")
+            summary += f"\n\nNão processadas ({len(skipped)}):\n" + "\n".join(lines)
+        messagebox.showinfo(title, summary)
+    
+    def notify_doctors(self, request_ids, approved, reason=None):
+        """Registra os alertas e enfileira os e-mails aos médicos sobre as requisições"""
+        if not request_ids:
+            return
         
-        # Obter detalhes da requisição e médico
-        cursor.execute('''
-            SELECT u.name, u.email, r.blood_type, r.quantity
+        # Obter detalhes das requisições e médicos
+        rows = self.conn.execute(f'''
+            SELECT r.id, u.name, u.email, r.blood_type, r.quantity
             FROM requests r
             JOIN users u ON r.requesting_doctor = u.id
-            WHERE r.id = ?
-        ''', (request_id,))
-        
-        request_data = cursor.fetchone()
-        if not request_data:
-            return
-        
-        doctor_name, doctor_email, blood_type, quantity = request_data
-        
-        # Criar mensagem
-        if approved:
-            subject = f"Requisição #{request_id} Aprovada"
-            message = (
-                f"Olá Dr(a). {doctor_name},\n\n"
-                f"Sua requisição de {quantity} unidades de {blood_type} foi aprovada.\n"
-                f"ID da Requisição: {request_id}\n"
-                f"Data da Resposta: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
-                f"Atenciosamente,\nEquipe Hemolife Pro"
-            )
-        else:
-            subject = f"Requisição #{request_id} Rejeitada"
-            message = (
-                f"Olá Dr(a). {doctor_name},\n\n"
-                f"Sua requisição de {quantity} unidades de {blood_type} foi rejeitada.\n"
-                f"Motivo: {reason or 'Não informado'}\n"
-                f"ID da Requisição: {request_id}\n"
-                f"Data da Resposta: {datetime.now().strftime('%d/%m/%Y %H:%M')}\n\n"
-                f"Atenciosamente,\nEquipe Hemolife Pro"
-            )
-        
-        # Enviar e-mail (simulado)
-        if doctor_email:
-            try:
-                msg = EmailMessage()
-                msg['Subject'] = subject
-                msg['From'] = self.email_config['email']
-                msg['To'] = doctor_email
-                msg.set_content(message)
-                
-                with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
-                    server.starttls()
-                    server.login(self.email_config['email'], self.email_config['password'])
-                    server.send_message(msg)
-                
-                self.log_activity(f"Notificação enviada para {doctor_name} sobre requisição {request_id}")
-            except Exception as e:
-                self.log_activity(f"Falha ao enviar e-mail para {doctor_email}: {str(e)}", level='ERROR')
+            WHERE r.id IN ({', '.join('?' for _ in request_ids)})
+        ''', request_ids).fetchall()
+        
+        response_date = datetime.now().strftime('%d/%m/%Y %H:%M')
+        alerts = []
+        emails = []
+        for request_id, doctor_name, doctor_email, blood_type, quantity in rows:
+            # Criar mensagem
+            if approved:
+                subject = f"Requisição #{request_id} Aprovada"
+                message = (
+                    f"Olá Dr(a). {doctor_name},\n\n"
+                    f"Sua requisição de {quantity} unidades de {blood_type} foi aprovada.\n"
+                    f"ID da Requisição: {request_id}\n"
+                    f"Data da Resposta: {response_date}\n\n"
+                    f"Atenciosamente,\nEquipe Hemolife Pro"
+                )
+            else:
+                subject = f"Requisição #{request_id} Rejeitada"
+                message = (
+                    f"Olá Dr(a). {doctor_name},\n\n"
+                    f"Sua requisição de {quantity} unidades de {blood_type} foi rejeitada.\n"
+                    f"Motivo: {reason or 'Não informado'}\n"
+                    f"ID da Requisição: {request_id}\n"
+                    f"Data da Resposta: {response_date}\n\n"
+                    f"Atenciosamente,\nEquipe Hemolife Pro"
+                )
+            
+            alerts.append(('request_update', message, self.current_user['id'], datetime.now().isoformat(), 'sent'))
+            if doctor_email:
+                emails.append((doctor_email, doctor_name, request_id, subject, message))
         
-        # Registrar alerta no sistema
-        cursor.execute('''
+        # Registrar alertas no sistema
+        self.conn.executemany('''
             INSERT INTO alerts (type, message, recipient_id, sent_date, status)
             VALUES (?, ?, ?, ?, ?)
-        ''', ('request_update', message, self.current_user['id'], datetime.now().isoformat(), 'sent'))
-        
+        ''', alerts)
         self.conn.commit()
+        
+        # Enviar e-mails (simulado) sem travar a tela
+        if emails:
+            self.notification_executor.submit(self.send_notification_emails, emails)
+    
+    def send_notification_emails(self, emails):
+        """Envia os e-mails de um lote numa única sessão SMTP (executado em segundo plano)"""
+        try:
+            with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
+                server.starttls()
+                server.login(self.email_config['email'], self.email_config['password'])
+                for doctor_email, doctor_name, request_id, subject, message in emails:
+                    try:
+                        msg = EmailMessage()
+                        msg['Subject'] = subject
+                        msg['From'] = self.email_config['email']
+                        msg['To'] = doctor_email
+                        msg.set_content(message)
+                        server.send_message(msg)
+                        self.log_activity(f"Notificação enviada para {doctor_name} sobre requisição {request_id}")
+                    except smtplib.SMTPException as e:
+                        self.log_activity(f"Falha ao enviar e-mail para {doctor_email}: {str(e)}", level='ERROR')
+        except Exception as e:
+            recipients = ', '.join(doctor_email for doctor_email, *_ in emails)
+            self.log_activity(f"Falha ao enviar e-mail para {recipients}: {str(e)}", level='ERROR')
     
     def notify_staff_new_request(self):
         """Notifica a equipe sobre nova requisição pendente"""
@@ -1277,29 +1481,20 @@ class BloodBankSystem:
             return
         
         try:
-            cursor = self.conn.cursor()
-            
             # Verificar estoque atual
-            cursor.execute('''
-                SELECT SUM(quantity) FROM stock WHERE blood_type = ?
-            ''', (blood_type,))
-            current_stock = cursor.fetchone()[0] or 0
+            current_stock = operacoes.available_stock(self.conn, blood_type)
             
             if current_stock < quantity and urgency != "Emergência":
                 messagebox.showwarning("Aviso", 
                     f"Estoque atual de {blood_type}: {current_stock}\n"
                     f"Sua requisição será enviada para aprovação.")
             
-            # Inserir requisição
-            cursor.execute('''
-                INSERT INTO requests (blood_type, quantity, requesting_doctor, request_date, status, urgency, patient_info)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (blood_type, quantity, self.current_user['id'], datetime.now().isoformat(), 'pending', urgency, patient_info))
-            
-            self.conn.commit()
+            operacoes.submit_request(self.conn, self.current_user['id'], blood_type, quantity,
+                                     urgency or 'Normal', patient_info)
+            self.demand_detector.observe(blood_type, quantity, 'requested')
             
             messagebox.showinfo("Sucesso", "Requisição enviada para aprovação!")
-            self.update_doctor_requests()
+            self.poll_changes()
             
             # Limpar formulário
             self.request_qty_entry.delete(0, tk.END)
@@ -1308,36 +1503,65 @@ class BloodBankSystem:
             # Enviar notificação aos técnicos/admins
             self.notify_staff_new_request()
             
+        except OperationError as e:
+            messagebox.showerror("Erro", str(e))
         except sqlite3.Error as e:
             messagebox.showerror("Erro", f"Falha ao enviar requisição: {str(e)}")
     
+    def query_doctor_requests(self, row_ids=None):
+        """Requisições do médico logado (opcionalmente só as de `row_ids`)"""
+        query = '''
+            SELECT id, blood_type, quantity, request_date, status, urgency
+            FROM requests
+            WHERE requesting_doctor = ?
+        '''
+        params = [self.current_user['id']]
+        if row_ids is not None:
+            query += f" AND id IN ({', '.join('?' for _ in row_ids)})"
+            params.extend(row_ids)
+        query += " ORDER BY request_date DESC"
+        return self.conn.execute(query, params).fetchall()
+    
+    def doctor_request_row(self, row):
+        """Valores de uma linha da lista de requisições do médico"""
+        status_text = {
+            'pending': '⏳ Pendente',
+            'approved': '✅ Aprovada',
+            'rejected': '❌ Rejeitada'
+        }.get(row[4], row[4])
+        
+        urgency_text = row[5] or "Normal"
+        if urgency_text == "Emergência":
+            urgency_text = "🚨 " + urgency_text
+        elif urgency_text == "Urgente":
+            urgency_text = "⚠️ " + urgency_text
+        
+        return row[:4] + (status_text, urgency_text)
+    
     def update_doctor_requests(self):
         """Atualiza a lista de requisições do médico"""
         for item in self.doctor_requests_tree.get_children():
             self.doctor_requests_tree.delete(item)
         
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, blood_type, quantity, request_date, status, urgency
-            FROM requests
-            WHERE requesting_doctor = ?
-            ORDER BY request_date DESC
-        ''', (self.current_user['id'],))
+        for row in self.query_doctor_requests():
+            self.doctor_requests_tree.insert('', 'end', iid=row[0], values=self.doctor_request_row(row))
+    
+    def apply_doctor_request_changes(self, events):
+        """Aplica na lista do médico só as requisições dele que mudaram"""
+        tree = getattr(self, 'doctor_requests_tree', None)
+        if tree is None or not tree.winfo_exists():
+            return
+        if is_reload(events) or len(events) > VIEW_FULL_REFRESH_ROWS:
+            self.update_doctor_requests()
+            return
         
-        for row in cursor.fetchall():
-            status_text = {
-                'pending': '⏳ Pendente',
-                'approved': '✅ Aprovada',
-                'rejected': '❌ Rejeitada'
-            }.get(row[4], row[4])
-            
-            urgency_text = row[5] or "Normal"
-            if urgency_text == "Emergência":
-                urgency_text = "🚨 " + urgency_text
-            elif urgency_text == "Urgente":
-                urgency_text = "⚠️ " + urgency_text
-            
-            self.doctor_requests_tree.insert('', 'end', values=row[:4] + (status_text, urgency_text))
+        row_ids = [event.row_id for event in events]
+        visible = {row[0]: row for row in self.query_doctor_requests(row_ids)}
+        for row_id in row_ids:
+            if row_id in visible:
+                self.upsert_tree_row(tree, row_id, self.doctor_request_row(visible[row_id]), sort_column='date')
+            elif tree.exists(row_id):
+                tree.delete(row_id)
     
     def create_donations_tab(self):
         """Cria a aba para gerenciar doações (técnicos e admin)"""
@@ -1351,6 +1575,10 @@ class BloodBankSystem:
         # Botões de ação
         ttk.Button(control_frame, text="Registrar Doação", style='Primary.TButton',
                   command=self.show_add_donation_dialog).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Importar Planilha", style='Primary.TButton',
+                  command=lambda: self.import_donation_file('donations')).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Etiquetas", style='Primary.TButton',
+                  command=self.print_selected_donation_labels).pack(side=tk.LEFT, padx=5)
         ttk.Button(control_frame, text="Gerar Relatório", style='Success.TButton',
                   command=self.generate_donation_report).pack(side=tk.LEFT, padx=5)
         
@@ -1360,6 +1588,14 @@ class BloodBankSystem:
         self.donation_filter_combo.pack(side=tk.LEFT, padx=5)
         self.donation_filter_combo.bind("<<ComboboxSelected>>", lambda e: self.update_donations_display())
         
+        # Período do relatório
+        ttk.Label(control_frame, text="De (DD/MM/AAAA):").pack(side=tk.LEFT, padx=5)
+        self.donation_report_from_entry = ttk.Entry(control_frame, width=12)
+        self.donation_report_from_entry.pack(side=tk.LEFT, padx=5)
+        ttk.Label(control_frame, text="Até:").pack(side=tk.LEFT, padx=5)
+        self.donation_report_to_entry = ttk.Entry(control_frame, width=12)
+        self.donation_report_to_entry.pack(side=tk.LEFT, padx=5)
+        
         # Preencher tipos sanguíneos
         cursor = self.conn.cursor()
         cursor.execute("SELECT type FROM blood_types ORDER BY type")
@@ -1451,35 +1687,21 @@ class BloodBankSystem:
                 if qty <= 0:
                     raise ValueError
                 
-                # Converter data para formato ISO
-                donation_date = datetime.strptime(data['date'], '%d/%m/%Y').date().isoformat()
-                next_donation_date = (datetime.strptime(data['date'], '%d/%m/%Y') + timedelta(days=90)).date().isoformat()
-                
-                cursor = self.conn.cursor()
-                
-                # Registrar doação
-                cursor.execute('''
-                    INSERT INTO donations (donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (data['name'], data['cpf'], data['type'], donation_date, qty, next_donation_date))
-                
-                # Adicionar ao estoque
-                cursor.execute('''
-                    INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (data['type'], qty, donation_date, (datetime.strptime(data['date'], '%d/%m/%Y') + timedelta(days=42)).date().isoformat(), 
-                              f"{data['name']} (CPF: {data['cpf']})"))
-                
-                self.conn.commit()
+                # Registrar doação e entrada no estoque
+                donation_date = datetime.strptime(data['date'], '%d/%m/%Y').date()
+                donation_id = operacoes.register_donation(self.conn, data['name'], data['cpf'], data['type'],
+                                                          donation_date, qty)
                 
                 messagebox.showinfo("Sucesso", "Doação registrada e estoque atualizado!")
-                self.update_donations_display()
-                self.update_stock_display()
+                self.poll_changes()
                 dialog.destroy()
                 
                 # Verificar se estoque saiu do nível crítico
                 self.check_stock_levels(data['type'])
                 
+                if messagebox.askyesno("Etiqueta", "Gerar a etiqueta da bolsa?"):
+                    self.print_labels('donations', [donation_id])
+                
             except ValueError:
                 messagebox.showerror("Erro", "Quantidade deve ser um número positivo!")
             except Exception as e:
@@ -1492,180 +1714,227 @@ class BloodBankSystem:
         ttk.Button(btn_frame, text="Salvar", style='Primary.TButton', command=save_donation).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
     
-    def update_donations_display(self):
-        """Atualiza a lista de doações"""
-        for item in self.donations_tree.get_children():
-            self.donations_tree.delete(item)
+    def import_donation_file(self, kind):
+        """Valida uma planilha de doações (ou remessa de estoque) e mostra a pré-visualização"""
+        from tkinter import filedialog
+        title = "Importar doações" if kind == 'donations' else "Importar remessa de estoque"
+        path = filedialog.askopenfilename(
+            title=title,
+            filetypes=[("CSV ou Excel", "*.csv *.xlsx"), ("Todos os arquivos", "*.*")])
+        if not path:
+            return
         
-        cursor = self.conn.cursor()
+        self.root.config(cursor='watch')
+        try:
+            valid, errors = validate_rows(self.conn, read_rows(path), kind)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao ler o arquivo: {str(e)}")
+            return
+        finally:
+            self.root.config(cursor='')
+        
+        self.show_import_preview(title, kind, valid, errors)
+    
+    def show_import_preview(self, title, kind, valid, errors):
+        """Resumo da planilha validada, com as linhas rejeitadas, antes de gravar"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("600x400")
+        
+        summary = f"{len(valid)} linhas válidas, {len(errors)} com erro."
+        if errors:
+            summary += " As linhas com erro serão ignoradas."
+        ttk.Label(dialog, text=summary, font=('Arial', 11)).pack(pady=10)
+        
+        errors_tree = ttk.Treeview(dialog, columns=('line', 'error'), show='headings', height=12)
+        errors_tree.heading('line', text='Linha')
+        errors_tree.heading('error', text='Erro')
+        errors_tree.column('line', width=60, anchor='center')
+        errors_tree.column('error', width=500)
+        errors_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        for line, error in errors:
+            errors_tree.insert('', 'end', values=(line, error))
+        
+        def confirm_import():
+            try:
+                created_ids = insert_rows(self.conn, valid, kind)
+            except sqlite3.Error as e:
+                messagebox.showerror("Erro", f"Falha ao importar planilha: {str(e)}")
+                self.log_activity(f"Erro na importação de planilha: {str(e)}", level='ERROR')
+                return
+            
+            dialog.destroy()
+            self.poll_changes()
+            self.log_activity(f"{len(created_ids)} linhas importadas ({kind}) por {self.current_user['name']}")
+            
+            # Verificar se o estoque dos tipos importados saiu do nível crítico
+            blood_type_index = 2 if kind == 'donations' else 0
+            for blood_type in sorted({row[blood_type_index] for _, row in valid}):
+                self.check_stock_levels(blood_type)
+            
+            messagebox.showinfo("Sucesso", f"{len(created_ids)} linhas importadas e estoque atualizado!")
+            if messagebox.askyesno("Etiquetas", "Gerar a folha de etiquetas das bolsas importadas?"):
+                self.print_labels(kind, created_ids)
+        
+        btn_frame = ttk.Frame(dialog)
+        btn_frame.pack(pady=10)
+        
+        import_btn = ttk.Button(btn_frame, text=f"Importar {len(valid)} linhas", style='Primary.TButton',
+                                command=confirm_import)
+        import_btn.pack(side=tk.LEFT, padx=5)
+        if not valid:
+            import_btn.state(['disabled'])
+        ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def print_selected_donation_labels(self):
+        """Gera (ou reimprime) as etiquetas das doações selecionadas"""
+        selected = self.donations_tree.selection()
+        if not selected:
+            messagebox.showwarning("Aviso", "Selecione as doações para gerar as etiquetas!")
+            return
+        self.print_labels('donations', [self.donations_tree.item(item)['values'][0] for item in selected])
+    
+    def print_labels(self, kind, ids):
+        """Monta em segundo plano a folha de etiquetas das doações ou linhas de estoque indicadas"""
+        try:
+            from etiquetas import donation_labels, shipment_labels, render_label_sheet
+        except ImportError:
+            messagebox.showerror("Erro", "A geração de etiquetas requer os pacotes python-barcode e pillow "
+                                         "(pip install python-barcode pillow)")
+            return
+        
+        labels = (donation_labels if kind == 'donations' else shipment_labels)(self.conn, ids)
+        if not labels:
+            messagebox.showwarning("Aviso", "Nenhuma bolsa para etiquetar!")
+            return
+        
+        output_dir = self.report_queue.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.abspath(os.path.join(output_dir, f"etiquetas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"))
+        
+        self.root.config(cursor='watch')
+        future = self.label_executor.submit(render_label_sheet, labels, path)
+        self.root.after(REPORT_POLL_MS, self.finish_labels, future, path, len(labels))
+    
+    def finish_labels(self, future, path, count):
+        """Avisa quando a folha de etiquetas fica pronta"""
+        if not future.done():
+            self.root.after(REPORT_POLL_MS, self.finish_labels, future, path, count)
+            return
+        
+        self.root.config(cursor='')
+        try:
+            pages, rendered = future.result()
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao gerar etiquetas: {str(e)}")
+            self.log_activity(f"Erro ao gerar etiquetas: {str(e)}", level='ERROR')
+            return
+        
+        self.log_activity(f"{count} etiquetas geradas ({rendered} símbolos novos): {path}")
+        messagebox.showinfo("Etiquetas", f"{count} etiquetas em {pages} páginas.\nArquivo:\n{path}")
+    
+    def query_donations_view(self, row_ids=None):
+        """Doações visíveis com o filtro atual (opcionalmente só as de `row_ids`)"""
         blood_type = self.donation_filter_combo.get()
         
-        if blood_type == 'Todos':
-            cursor.execute('''
-                SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
-                FROM donations
-                ORDER BY donation_date DESC
-            ''')
+        query = '''
+            SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
+            FROM donations
+        '''
+        conditions = []
+        params = []
+        
+        if blood_type != 'Todos':
+            conditions.append("donor_blood_type = ?")
+            params.append(blood_type)
+        
+        if row_ids is not None:
+            conditions.append(f"id IN ({', '.join('?' for _ in row_ids)})")
+            params.extend(row_ids)
+        
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        
+        query += " ORDER BY donation_date DESC"
+        
+        return self.conn.execute(query, params).fetchall()
+    
+    def donation_row(self, row, today):
+        """Valores e tags de uma linha da lista de doações"""
+        donation_date = datetime.strptime(row[4], '%Y-%m-%d').date()
+        next_donation = datetime.strptime(row[6], '%Y-%m-%d').date() if row[6] else None
+        
+        # Verificar se já pode doar novamente
+        if next_donation and next_donation <= today:
+            next_text = "Pode doar"
+            tags = ('can_donate',)
         else:
-            cursor.execute('''
-                SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
-                FROM donations
-                WHERE donor_blood_type = ?
-                ORDER BY donation_date DESC
-            ''', (blood_type,))
+            next_text = row[6] if row[6] else "N/A"
+            tags = ()
+        
+        return (
+            row[0], row[1], row[2], row[3],
+            donation_date.strftime('%d/%m/%Y'),
+            row[5], next_text
+        ), tags
+    
+    def update_donations_display(self):
+        """Atualiza a lista de doações"""
+        for item in self.donations_tree.get_children():
+            self.donations_tree.delete(item)
         
         today = datetime.now().date()
         
-        for row in cursor.fetchall():
-            donation_date = datetime.strptime(row[4], '%Y-%m-%d').date()
-            next_donation = datetime.strptime(row[6], '%Y-%m-%d').date() if row[6] else None
-            
-            # Verificar se já pode doar novamente
-            if next_donation and next_donation <= today:
-                next_text = "Pode doar"
-                tags = ('can_donate',)
-            else:
-                next_text = row[6] if row[6] else "N/A"
-                tags = ()
-            
-            self.donations_tree.insert('', 'end', values=(
-                row[0], row[1], row[2], row[3], 
-                donation_date.strftime('%d/%m/%Y'), 
-                row[5], next_text
-            ), tags=tags)
+        for row in self.query_donations_view():
+            values, tags = self.donation_row(row, today)
+            self.donations_tree.insert('', 'end', iid=row[0], values=values, tags=tags)
         
         self.donations_tree.tag_configure('can_donate', background='#d4edda')
     
+    def apply_donation_changes(self, events):
+        """Aplica na lista de doações só as linhas alteradas"""
+        tree = getattr(self, 'donations_tree', None)
+        if tree is None or not tree.winfo_exists():
+            return
+        if is_reload(events) or len(events) > VIEW_FULL_REFRESH_ROWS:
+            self.update_donations_display()
+            return
+        
+        today = datetime.now().date()
+        row_ids = [event.row_id for event in events]
+        visible = {row[0]: row for row in self.query_donations_view(row_ids)}
+        for row_id in row_ids:
+            if row_id in visible:
+                # A data aparece como DD/MM/AAAA: doações novas entram no topo
+                values, tags = self.donation_row(visible[row_id], today)
+                self.upsert_tree_row(tree, row_id, values, tags)
+            elif tree.exists(row_id):
+                tree.delete(row_id)
+    
     def generate_donation_report(self):
-        """Gera relatório PDF das doações"""
+        """Coloca o relatório PDF das doações na fila de relatórios"""
+        period = self.report_period(self.donation_report_from_entry, self.donation_report_to_entry)
+        if period is None:
+            return
+        
+        blood_type = self.donation_filter_combo.get()
+        self.enqueue_report('donations', f'Doações ({blood_type})', 'relatorio_doacoes', blood_type=blood_type,
+                            date_from=period[0], date_to=period[1])
+    
+    def report_period(self, from_entry, to_entry):
+        """Lê o período (DD/MM/AAAA) dos campos; retorna datas ISO ou None se inválido"""
         try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', 'B', 16)
-            
-            # Título
-            pdf.cell(0, 10, 'Relatório de Doações de Sangue', 0, 1, 'C')
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, f'Emitido em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
-            pdf.cell(0, 10, f'Emitido por: {self.current_user["name"]}', 0, 1, 'C')
-            pdf.ln(10)
-            
-            # Filtro aplicado
-            blood_type = self.donation_filter_combo.get()
-            if blood_type != 'Todos':
-                pdf.cell(0, 10, f'Filtro: Tipo Sanguíneo {blood_type}', 0, 1)
-                pdf.ln(5)
-            
-            # Dados das doações
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, 'Registro de Doações', 0, 1)
-            pdf.set_font('Arial', '', 10)
-            
-            # Cabeçalho da tabela
-            pdf.set_fill_color(200, 220, 255)
-            pdf.cell(15, 10, 'ID', 1, 0, 'C', 1)
-            pdf.cell(50, 10, 'Doador', 1, 0, 'C', 1)
-            pdf.cell(30, 10, 'CPF', 1, 0, 'C', 1)
-            pdf.cell(20, 10, 'Tipo', 1, 0, 'C', 1)
-            pdf.cell(30, 10, 'Data', 1, 0, 'C', 1)
-            pdf.cell(20, 10, 'Qtd (ml)', 1, 0, 'C', 1)
-            pdf.cell(30, 10, 'Próxima Doação', 1, 1, 'C', 1)
-            
-            pdf.set_fill_color(255, 255, 255)
-            
-            # Obter dados das doações
-            cursor = self.conn.cursor()
-            if blood_type == 'Todos':
-                cursor.execute('''
-                    SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
-                    FROM donations
-                    ORDER BY donation_date DESC
-                ''')
-            else:
-                cursor.execute('''
-                    SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
-                    FROM donations
-                    WHERE donor_blood_type = ?
-                    ORDER BY donation_date DESC
-                ''', (blood_type,))
-            
-            today = datetime.now().date()
-            
-            for row in cursor.fetchall():
-                donation_date = datetime.strptime(row[4], '%Y-%m-%d').date()
-                next_donation = datetime.strptime(row[6], '%Y-%m-%d').date() if row[6] else None
-                
-                pdf.cell(15, 10, str(row[0]), 1, 0, 'C')
-                pdf.cell(50, 10, row[1], 1, 0)
-                pdf.cell(30, 10, row[2] or 'N/A', 1, 0)
-                pdf.cell(20, 10, row[3], 1, 0, 'C')
-                pdf.cell(30, 10, donation_date.strftime('%d/%m/%Y'), 1, 0, 'C')
-                pdf.cell(20, 10, str(row[5]), 1, 0, 'C')
-                
-                if next_donation:
-                    if next_donation <= today:
-                        pdf.set_text_color(0, 128, 0)  # Verde
-                        next_text = "PODE DOAR"
-                    else:
-                        pdf.set_text_color(0, 0, 0)  # Preto
-                        next_text = next_donation.strftime('%d/%m/%Y')
-                else:
-                    next_text = "N/A"
-                
-                pdf.cell(30, 10, next_text, 1, 1, 'C')
-                pdf.set_text_color(0, 0, 0)
-            
-            # Estatísticas
-            pdf.ln(10)
-            pdf.set_font('Arial', 'B', 12)
-            pdf.cell(0, 10, 'Estatísticas', 0, 1)
-            pdf.set_font('Arial', '', 10)
-            
-            # Total de doações
-            if blood_type == 'Todos':
-                cursor.execute("SELECT COUNT(*), SUM(quantity) FROM donations")
-            else:
-                cursor.execute("SELECT COUNT(*), SUM(quantity) FROM donations WHERE donor_blood_type = ?", (blood_type,))
-            
-            total_count, total_ml = cursor.fetchone()
-            total_ml = total_ml or 0
-            
-            pdf.cell(0, 10, f'Total de Doações: {total_count}', 0, 1)
-            pdf.cell(0, 10, f'Volume Total Coletado: {total_ml} ml', 0, 1)
-            
-            # Doações por tipo (se não estiver filtrado)
-            if blood_type == 'Todos':
-                pdf.ln(5)
-                pdf.cell(0, 10, 'Doações por Tipo Sanguíneo:', 0, 1)
-                
-                cursor.execute('''
-                    SELECT donor_blood_type, COUNT(*), SUM(quantity)
-                    FROM donations
-                    GROUP BY donor_blood_type
-                    ORDER BY COUNT(*) DESC
-                ''')
-                
-                pdf.set_fill_color(200, 220, 255)
-                pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
-                pdf.cell(30, 10, 'Doações', 1, 0, 'C', 1)
-                pdf.cell(40, 10, 'Volume Total (ml)', 1, 1, 'C', 1)
-                
-                pdf.set_fill_color(255, 255, 255)
-                
-                for row in cursor.fetchall():
-                    pdf.cell(40, 10, row[0], 1, 0, 'C')
-                    pdf.cell(30, 10, str(row[1]), 1, 0, 'C')
-                    pdf.cell(40, 10, str(row[2]), 1, 1, 'C')
-            
-            # Salvar PDF
-            filename = f"relatorio_doacoes_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            pdf.output(filename)
-            
-            messagebox.showinfo("Sucesso", f"Relatório gerado com sucesso:\n{filename}")
-            
-        except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao gerar relatório: {str(e)}")
-            self.log_activity(f"Erro ao gerar relatório de doações: {str(e)}", level='ERROR')
+            dates = [datetime.strptime(entry.get().strip(), '%d/%m/%Y').date().isoformat()
+                     if entry.get().strip() else None
+                     for entry in (from_entry, to_entry)]
+        except ValueError:
+            messagebox.showerror("Erro", "Data inválida! Use o formato DD/MM/AAAA.")
+            return None
+        
+        if dates[0] and dates[1] and dates[0] > dates[1]:
+            messagebox.showerror("Erro", "A data inicial deve ser anterior à data final!")
+            return None
+        return dates
     
     def create_admin_tab(self):
         """Cria a aba de administração"""
@@ -1727,6 +1996,8 @@ class BloodBankSystem:
                   command=self.toggle_user_status).pack(side=tk.LEFT, padx=5)
         ttk.Button(btn_frame, text="Redefinir Senha", style='Success.TButton',
                   command=self.reset_user_password).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Importar CSV/JSON", style='Primary.TButton',
+                  command=self.import_users_from_file).pack(side=tk.LEFT, padx=5)
         
         # Atualizar lista de usuários
         self.update_users_list()
@@ -1814,8 +2085,63 @@ class BloodBankSystem:
         btn_frame = ttk.Frame(dialog)
         btn_frame.grid(row=6, column=0, columnspan=2, pady=10)
         
-        ttk.Button(btn_frame, text="Salvar", style='Primary.TButton', command=save_user).pack(side=tk.LEFT, padx=5)
-        ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Salvar", style='Primary.TButton', command=save_user).pack(side=tk.LEFT, padx=5)
+        ttk.Button(btn_frame, text="Cancelar", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def import_users_from_file(self):
+        """Cadastra usuários em lote; as senhas são codificadas num pool de processos"""
+        from tkinter import filedialog
+        path = filedialog.askopenfilename(
+            title="Importar usuários",
+            filetypes=[("CSV ou JSON", "*.csv *.json"), ("Todos os arquivos", "*.*")])
+        if not path:
+            return
+        
+        try:
+            valid, errors = validate_users(self.conn, read_users(path))
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao ler o arquivo: {str(e)}")
+            return
+        
+        if not valid:
+            self.show_user_import_result(0, errors)
+            return
+        
+        self.root.config(cursor='watch')
+        future = self.import_executor.submit(
+            hash_passwords, [user['password'] for _, user in valid], bcrypt_rounds(self.conn))
+        self.root.after(REPORT_POLL_MS, self.finish_user_import, future, valid, errors)
+    
+    def finish_user_import(self, future, valid, errors):
+        """Grava os usuários importados quando as senhas ficam prontas"""
+        if not future.done():
+            self.root.after(REPORT_POLL_MS, self.finish_user_import, future, valid, errors)
+            return
+        
+        self.root.config(cursor='')
+        try:
+            created, skipped = insert_users(self.conn, valid, future.result())
+            errors = sorted(errors + skipped)
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao importar usuários: {str(e)}")
+            self.log_activity(f"Erro na importação de usuários: {str(e)}", level='ERROR')
+            return
+        
+        self.log_activity(f"{created} usuários importados por {self.current_user['name']}")
+        if self.users_tree.winfo_exists():
+            self.update_users_list()
+        self.show_user_import_result(created, errors)
+    
+    def show_user_import_result(self, created, errors):
+        """Resumo da importação, com as primeiras linhas rejeitadas"""
+        message = f"{created} usuários cadastrados."
+        if errors:
+            lines = "\n".join(f"Linha {line}: {error}" for line, error in errors[:15])
+            more = f"\n... e mais {len(errors) - 15}" if len(errors) > 15 else ""
+            message += f"\n\n{len(errors)} linhas com erro:\n{lines}{more}"
+            messagebox.showwarning("Importação de Usuários", message)
+        else:
+            messagebox.showinfo("Importação de Usuários", message)
     
     def show_edit_user_dialog(self):
         """Mostra diálogo para editar usuário existente"""
@@ -1987,13 +2313,21 @@ class BloodBankSystem:
         types_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
         # Treeview de tipos
-        self.blood_types_tree = ttk.Treeview(types_frame, columns=('type', 'min_stock', 'description'), show='headings')
+        self.blood_types_tree = ttk.Treeview(types_frame, columns=('type', 'min_stock', 'demand', 'lead', 'safety', 'reorder', 'description'), show='headings')
         self.blood_types_tree.heading('type', text='Tipo')
         self.blood_types_tree.heading('min_stock', text='Estoque Mínimo')
+        self.blood_types_tree.heading('demand', text='Demanda/dia')
+        self.blood_types_tree.heading('lead', text='Reposição (dias)')
+        self.blood_types_tree.heading('safety', text='Estoque Segurança')
+        self.blood_types_tree.heading('reorder', text='Ponto Reposição')
         self.blood_types_tree.heading('description', text='Descrição')
         
         self.blood_types_tree.column('type', width=80, anchor='center')
         self.blood_types_tree.column('min_stock', width=100, anchor='center')
+        self.blood_types_tree.column('demand', width=100, anchor='center')
+        self.blood_types_tree.column('lead', width=100, anchor='center')
+        self.blood_types_tree.column('safety', width=110, anchor='center')
+        self.blood_types_tree.column('reorder', width=110, anchor='center')
         self.blood_types_tree.column('description', width=200)
         
         self.blood_types_tree.pack(fill=tk.BOTH, expand=True)
@@ -2005,6 +2339,23 @@ class BloodBankSystem:
         ttk.Button(btn_frame, text="Editar", style='Primary.TButton',
                   command=self.edit_blood_type).pack(side=tk.LEFT, padx=5)
         
+        # Limites dinâmicos (estoque de segurança / ponto de reposição)
+        thresholds_frame = ttk.LabelFrame(tab, text="Limites Dinâmicos de Estoque", padding=10)
+        thresholds_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
+        self.dynamic_thresholds_var = tk.BooleanVar(value=dynamic_thresholds_enabled(self.conn))
+        ttk.Checkbutton(thresholds_frame, text="Usar ponto de reposição calculado em vez do estoque mínimo",
+                       variable=self.dynamic_thresholds_var,
+                       command=self.toggle_dynamic_thresholds).grid(row=0, column=0, columnspan=3, sticky='w')
+        
+        ttk.Label(thresholds_frame, text="Nível de serviço:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        self.service_level_entry = ttk.Entry(thresholds_frame, width=8)
+        self.service_level_entry.insert(0, get_setting(self.conn, SETTING_SERVICE_LEVEL, str(DEFAULT_SERVICE_LEVEL)))
+        self.service_level_entry.grid(row=1, column=1, padx=5, pady=5, sticky='w')
+        
+        ttk.Button(thresholds_frame, text="Recalcular Agora", style='Primary.TButton',
+                  command=self.recalculate_thresholds).grid(row=1, column=2, padx=5, pady=5)
+        
         # Atualizar lista de tipos
         self.update_blood_types_list()
     
@@ -2014,10 +2365,69 @@ class BloodBankSystem:
             self.blood_types_tree.delete(item)
         
         cursor = self.conn.cursor()
-        cursor.execute("SELECT type, min_stock, description FROM blood_types ORDER BY type")
+        cursor.execute('''
+            SELECT type, min_stock, demand_mean, lead_time_days, safety_stock, reorder_point, description
+            FROM blood_types
+            ORDER BY type
+        ''')
         
         for row in cursor.fetchall():
-            self.blood_types_tree.insert('', 'end', values=row)
+            demand = f"{row[2]:.1f}" if row[2] is not None else "-"
+            lead = f"{row[3]:.1f}" if row[3] is not None else "-"
+            safety = row[4] if row[4] is not None else "-"
+            reorder = row[5] if row[5] is not None else "-"
+            self.blood_types_tree.insert('', 'end', values=(row[0], row[1], demand, lead, safety, reorder, row[6] or ""))
+    
+    def toggle_dynamic_thresholds(self):
+        """Liga/desliga o uso dos limites calculados no lugar do estoque mínimo"""
+        enabled = self.dynamic_thresholds_var.get()
+        set_setting(self.conn, SETTING_USE_DYNAMIC, enabled)
+        self.conn.commit()
+        
+        self.log_activity(f"Limites dinâmicos {'ativados' if enabled else 'desativados'} por {self.current_user['name']}")
+        self.update_stock_display()
+        self.refresh_dashboard()
+        self.check_low_stock()
+    
+    def recalculate_thresholds(self):
+        """Recalcula imediatamente o estoque de segurança e o ponto de reposição"""
+        try:
+            service_level = float(self.service_level_entry.get().replace(',', '.'))
+            if not 0 < service_level < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Erro", "Nível de serviço deve ser um número entre 0 e 1 (ex.: 0.95)!")
+            return
+        
+        try:
+            set_setting(self.conn, SETTING_SERVICE_LEVEL, service_level)
+            recompute_thresholds(self.conn, service_level=service_level)
+            
+            self.update_blood_types_list()
+            self.update_stock_display()
+            self.refresh_dashboard()
+            self.log_activity(f"Limites de estoque recalculados (nível de serviço {service_level})")
+            messagebox.showinfo("Sucesso", "Limites de estoque recalculados com sucesso!")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao recalcular limites: {str(e)}")
+            self.log_activity(f"Erro ao recalcular limites: {str(e)}", level='ERROR')
+    
+    def threshold_label(self):
+        """Rótulo do limite de estoque em uso (fixo ou calculado)"""
+        return 'Ponto Reposição' if dynamic_thresholds_enabled(self.conn) else 'Estoque Mínimo'
+    
+    def schedule_close_of_day(self):
+        """Agenda a verificação periódica do recálculo de fechamento do dia"""
+        try:
+            if close_of_day_due(self.conn):
+                recompute_thresholds(self.conn)
+                self.log_activity("Limites de estoque recalculados no fechamento do dia")
+                removed = prune_changes(self.conn)
+                self.log_activity(f"Registro de alterações: {removed} linhas já lidas removidas")
+        except Exception as e:
+            self.log_activity(f"Erro no recálculo de fechamento do dia: {str(e)}", level='ERROR')
+        
+        self.root.after(CLOSE_OF_DAY_CHECK_MS, self.schedule_close_of_day)
     
     def edit_blood_type(self):
         """Edita o tipo sanguíneo selecionado"""
@@ -2074,6 +2484,7 @@ class BloodBankSystem:
                 messagebox.showinfo("Sucesso", "Tipo sanguíneo atualizado com sucesso!")
                 self.update_blood_types_list()
                 self.update_stock_display()  # Atualizar status no estoque
+                self.refresh_dashboard()
                 dialog.destroy()
                 
                 # Verificar se estoque está abaixo do novo mínimo
@@ -2137,6 +2548,19 @@ class BloodBankSystem:
                       pass_entry.get()
                   )).pack(pady=5)
         
+        # Política de senhas
+        security_frame = ttk.LabelFrame(tab, text="Segurança das Senhas", padding=15)
+        security_frame.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttk.Label(security_frame, text="Custo do bcrypt:").pack(side=tk.LEFT)
+        rounds_spin = ttk.Spinbox(security_frame, from_=MIN_BCRYPT_ROUNDS, to=MAX_BCRYPT_ROUNDS, width=5, state='readonly')
+        rounds_spin.set(bcrypt_rounds(self.conn))
+        rounds_spin.pack(side=tk.LEFT, padx=5)
+        ttk.Button(security_frame, text="Salvar", style='Success.TButton',
+                  command=lambda: self.save_bcrypt_rounds(rounds_spin.get())).pack(side=tk.LEFT, padx=5)
+        ttk.Label(security_frame, text="As senhas são recodificadas no próximo login de cada usuário.",
+                 foreground='#6c757d').pack(side=tk.LEFT, padx=10)
+        
         # Frame de backup
         backup_frame = ttk.LabelFrame(tab, text="Backup do Sistema", padding=15)
         backup_frame.pack(fill=tk.BOTH, padx=10, pady=10)
@@ -2147,6 +2571,18 @@ class BloodBankSystem:
         ttk.Button(backup_frame, text="Restaurar Backup", style='Secondary.TButton',
                   command=self.restore_backup).pack(pady=5)
     
+    def save_bcrypt_rounds(self, rounds):
+        """Grava o custo do bcrypt usado nas senhas novas e no recodificar ao entrar"""
+        try:
+            set_setting(self.conn, SETTING_BCRYPT_ROUNDS, int(rounds))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Falha ao salvar a configuração: {str(e)}")
+            return
+        
+        self.log_activity(f"Custo do bcrypt alterado para {rounds} por {self.current_user['name']}")
+        messagebox.showinfo("Sucesso", "Custo do bcrypt atualizado!")
+    
     def test_smtp_connection(self, server, port, email, password):
         """Testa a conexão com o servidor SMTP"""
         if not all([server, port, email, password]):
@@ -2195,21 +2631,17 @@ class BloodBankSystem:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_file = os.path.join(backup_dir, f"blood_bank_backup_{timestamp}.db")
             
-            # Fechar a conexão atual para permitir a cópia
-            self.conn.close()
-            
-            # Copiar o arquivo do banco de dados
-            import shutil
-            shutil.copy2(DB_NAME, backup_file)
-            
-            # Reconectar
-            self.conn = sqlite3.connect(DB_NAME)
+            # API de backup do SQLite: inclui o que ainda está no arquivo -wal
+            # e não fecha a conexão usada pelo resto do sistema
+            target = sqlite3.connect(backup_file)
+            try:
+                self.conn.backup(target)
+            finally:
+                target.close()
             
             messagebox.showinfo("Sucesso", f"Backup criado com sucesso:\n{backup_file}")
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao criar backup: {str(e)}")
-            # Tentar reconectar mesmo em caso de erro
-            self.conn = sqlite3.connect(DB_NAME)
     
     def restore_backup(self):
         """Restaura um backup do banco de dados"""
@@ -2227,27 +2659,56 @@ class BloodBankSystem:
             if not messagebox.askyesno("Confirmar", "Tem certeza que deseja restaurar este backup? Todos os dados atuais serão substituídos."):
                 return
             
-            # Fechar a conexão atual
-            self.conn.close()
+            # O que estiver pendente na conexão seria sobrescrito pelo backup
+            if self.conn.in_transaction:
+                self.conn.rollback()
             
-            # Substituir o banco de dados atual pelo backup
-            import shutil
-            shutil.copy2(backup_file, DB_NAME)
+            # Copia o backup para dentro do banco em uso pela API de backup: o
+            # -wal e as demais conexões (barramento, cópia de leitura) continuam
+            # consistentes, e os módulos seguem com a mesma conexão
+            source = sqlite3.connect(f"file:{backup_file}?mode=ro", uri=True)
+            try:
+                source.backup(self.conn)
+            finally:
+                source.close()
             
-            # Reconectar
-            self.conn = sqlite3.connect(DB_NAME)
+            # Backups de versões anteriores podem não ter as tabelas mais novas
+            create_schema(self.conn)
+            self.conn.commit()
             
-            messagebox.showinfo("Sucesso", "Backup restaurado com sucesso! Reinicie o sistema para aplicar as alterações.")
+            # Estado em memória recarregado do banco restaurado
+            self.demand_detector.state.clear()
+            self.demand_detector.dirty.clear()
+            self.demand_detector.load()
+            if self.unit_cache is not None:
+                self.unit_cache.reload(self.conn)
+            self.change_bus.reload()
+            self.poll_changes()
+            if self.snapshot.start_refresh(force=True):
+                self.root.after(SNAPSHOT_POLL_MS, self.poll_snapshot_refresh)
+            
+            self.log_activity(f"Backup restaurado: {backup_file}")
+            messagebox.showinfo("Sucesso", "Backup restaurado com sucesso! Reinicie o sistema para atualizar todas as telas.")
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao restaurar backup: {str(e)}")
-            # Tentar reconectar mesmo em caso de erro
-            self.conn = sqlite3.connect(DB_NAME)
     
     def create_analytics_tab(self):
-        """Cria a aba de análise preditiva (admin)"""
+        """Cria a aba de análise preditiva (admin), montada só na primeira visita"""
         tab = ttk.Frame(self.notebook)
         self.notebook.add(tab, text="🔮 Análise Preditiva")
         
+        def on_tab_changed(event):
+            if self.notebook.select() == str(tab) and not tab.winfo_children():
+                self.build_analytics_tab(tab)
+        
+        self.notebook.bind('<<NotebookTabChanged>>', on_tab_changed, add='+')
+    
+    def build_analytics_tab(self, tab):
+        """Monta o conteúdo da aba de análise preditiva"""
+        # O matplotlib só é carregado aqui, fora do caminho do login
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
         # Frame de controle
         control_frame = ttk.Frame(tab, padding=10)
         control_frame.pack(fill=tk.X)
@@ -2268,6 +2729,12 @@ class BloodBankSystem:
         ttk.Button(control_frame, text="Gerar Relatório", style='Success.TButton',
                   command=self.generate_analytics_report).grid(row=0, column=5, padx=5)
         
+        ttk.Button(control_frame, text="Atualizar Dados",
+                  command=self.refresh_analytics_data).grid(row=0, column=6, padx=5)
+        
+        self.snapshot_label = ttk.Label(control_frame, text=self.snapshot.describe(), foreground='#6c757d')
+        self.snapshot_label.grid(row=1, column=0, columnspan=7, sticky='w', padx=5, pady=(5, 0))
+        
         # Notebook para diferentes análises
         analytics_notebook = ttk.Notebook(tab)
         analytics_notebook.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -2276,7 +2743,7 @@ class BloodBankSystem:
         forecast_tab = ttk.Frame(analytics_notebook)
         analytics_notebook.add(forecast_tab, text="Previsão de Demanda")
         
-        self.forecast_fig = plt.Figure(figsize=(10, 5), dpi=100)
+        self.forecast_fig = Figure(figsize=(10, 5), dpi=100)
         self.forecast_ax = self.forecast_fig.add_subplot(111)
         self.forecast_canvas = FigureCanvasTkAgg(self.forecast_fig, forecast_tab)
         self.forecast_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
@@ -2285,11 +2752,16 @@ class BloodBankSystem:
         stock_vs_demand_tab = ttk.Frame(analytics_notebook)
         analytics_notebook.add(stock_vs_demand_tab, text="Estoque vs Demanda")
         
-        self.stock_demand_fig = plt.Figure(figsize=(10, 5), dpi=100)
+        self.stock_demand_fig = Figure(figsize=(10, 5), dpi=100)
         self.stock_demand_ax = self.stock_demand_fig.add_subplot(111)
         self.stock_demand_canvas = FigureCanvasTkAgg(self.stock_demand_fig, stock_vs_demand_tab)
         self.stock_demand_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
+        # Aba de drill-down no cubo de demanda
+        drilldown_tab = ttk.Frame(analytics_notebook)
+        analytics_notebook.add(drilldown_tab, text="Drill-down da Demanda")
+        self.create_drilldown_tab(drilldown_tab)
+        
         # Frame de recomendações
         self.recommendation_frame = ttk.Frame(tab)
         self.recommendation_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -2298,8 +2770,142 @@ class BloodBankSystem:
         self.recommendation_text = tk.Text(self.recommendation_frame, height=6, wrap=tk.WORD)
         self.recommendation_text.pack(fill=tk.X, pady=5)
         
-        # Gerar gráfico inicial de estoque vs demanda
-        self.generate_stock_vs_demand_chart()
+        # Gerar gráfico inicial de estoque vs demanda (se a primeira cópia
+        # de leitura ainda não terminou, o gráfico é desenhado quando ela terminar)
+        if self.snapshot.taken_at is not None:
+            self.generate_stock_vs_demand_chart()
+    
+    def create_drilldown_tab(self, tab):
+        """Cria a sub-aba de drill-down sobre o cubo de demanda"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        
+        self.cube_dimension = 'blood_type'
+        self.cube_filters = {}
+        self.cube_filter_labels = {}
+        self.cube_history = []
+        
+        control_frame = ttk.Frame(tab, padding=5)
+        control_frame.pack(fill=tk.X)
+        
+        ttk.Label(control_frame, text="Agrupar por:").pack(side=tk.LEFT, padx=5)
+        self.cube_dimension_combo = ttk.Combobox(control_frame, values=list(DIMENSIONS.values()), state="readonly", width=16)
+        self.cube_dimension_combo.set(DIMENSIONS[self.cube_dimension])
+        self.cube_dimension_combo.pack(side=tk.LEFT, padx=5)
+        self.cube_dimension_combo.bind("<<ComboboxSelected>>", lambda e: self.change_drilldown_dimension())
+        
+        ttk.Label(control_frame, text="Medida:").pack(side=tk.LEFT, padx=5)
+        self.cube_measure_combo = ttk.Combobox(control_frame, values=list(MEASURES.values()), state="readonly", width=16)
+        self.cube_measure_combo.set(MEASURES['approved_qty'])
+        self.cube_measure_combo.pack(side=tk.LEFT, padx=5)
+        self.cube_measure_combo.bind("<<ComboboxSelected>>", lambda e: self.update_drilldown())
+        
+        ttk.Button(control_frame, text="Voltar", command=self.drilldown_back).pack(side=tk.LEFT, padx=5)
+        ttk.Button(control_frame, text="Limpar Filtros", command=self.reset_drilldown).pack(side=tk.LEFT, padx=5)
+        
+        self.cube_timing_label = ttk.Label(control_frame, text="")
+        self.cube_timing_label.pack(side=tk.RIGHT, padx=5)
+        
+        self.cube_filters_label = ttk.Label(tab, text="Filtros: nenhum", font=('Arial', 10, 'italic'))
+        self.cube_filters_label.pack(anchor='w', padx=10)
+        
+        content_frame = ttk.Frame(tab)
+        content_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.cube_tree = ttk.Treeview(content_frame, columns=('value', 'total'), show='headings', height=12)
+        self.cube_tree.heading('value', text=DIMENSIONS[self.cube_dimension])
+        self.cube_tree.heading('total', text=MEASURES['approved_qty'])
+        self.cube_tree.column('value', width=150)
+        self.cube_tree.column('total', width=100, anchor='center')
+        self.cube_tree.pack(side=tk.LEFT, fill=tk.Y, padx=5, pady=5)
+        self.cube_tree.bind('<Double-1>', lambda e: self.drilldown_into())
+        
+        self.cube_fig = Figure(figsize=(7, 4), dpi=100)
+        self.cube_ax = self.cube_fig.add_subplot(111)
+        self.cube_canvas = FigureCanvasTkAgg(self.cube_fig, content_frame)
+        self.cube_canvas.get_tk_widget().pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        if self.snapshot.taken_at is not None:
+            self.update_drilldown()
+    
+    def update_drilldown(self):
+        """Atualiza a tabela e o gráfico do drill-down a partir do cubo"""
+        if self.snapshot.taken_at is None:
+            return  # Desenhado quando a primeira cópia de leitura terminar
+        measure = next(key for key, label in MEASURES.items() if label == self.cube_measure_combo.get())
+        
+        try:
+            started = time.perf_counter()
+            rows = slice_cube(self.snapshot.conn, self.cube_dimension, measure, self.cube_filters)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        except sqlite3.Error as e:
+            messagebox.showerror("Erro", f"Falha ao consultar o cubo de demanda: {str(e)}")
+            return
+        
+        for item in self.cube_tree.get_children():
+            self.cube_tree.delete(item)
+        
+        self.cube_rows = {}
+        for value, label, total in rows:
+            item = self.cube_tree.insert('', 'end', values=(label, total))
+            self.cube_rows[item] = value
+        
+        self.cube_tree.heading('value', text=DIMENSIONS[self.cube_dimension])
+        self.cube_tree.heading('total', text=MEASURES[measure])
+        self.cube_timing_label.config(text=f"Consulta: {elapsed_ms:.1f} ms")
+        
+        if self.cube_filters:
+            filters_text = ", ".join(f"{DIMENSIONS[key]} = {self.cube_filter_labels.get(key, value)}"
+                                     for key, value in self.cube_filters.items())
+        else:
+            filters_text = "nenhum"
+        self.cube_filters_label.config(text=f"Filtros: {filters_text}")
+        
+        self.cube_ax.clear()
+        self.cube_ax.bar([label for _, label, _ in rows], [total for _, _, total in rows], color='#d90429')
+        self.cube_ax.set_title(f"{MEASURES[measure]} por {DIMENSIONS[self.cube_dimension]}")
+        self.cube_ax.grid(True, linestyle='--', alpha=0.6)
+        self.cube_ax.tick_params(axis='x', labelrotation=45)
+        self.cube_fig.tight_layout()
+        self.cube_canvas.draw_idle()
+    
+    def change_drilldown_dimension(self):
+        """Troca a dimensão de agrupamento mantendo os filtros"""
+        self.cube_dimension = next(key for key, label in DIMENSIONS.items() if label == self.cube_dimension_combo.get())
+        self.update_drilldown()
+    
+    def drilldown_into(self):
+        """Filtra pelo valor selecionado e desce para a próxima dimensão"""
+        selected = self.cube_tree.selection()
+        if not selected:
+            return
+        
+        dimension = next_dimension(self.cube_dimension, {**self.cube_filters, self.cube_dimension: None})
+        if dimension is None:
+            return
+        
+        self.cube_history.append((self.cube_dimension, dict(self.cube_filters), dict(self.cube_filter_labels)))
+        self.cube_filters[self.cube_dimension] = self.cube_rows[selected[0]]
+        self.cube_filter_labels[self.cube_dimension] = self.cube_tree.item(selected[0])['values'][0]
+        self.cube_dimension = dimension
+        self.cube_dimension_combo.set(DIMENSIONS[dimension])
+        self.update_drilldown()
+    
+    def drilldown_back(self):
+        """Volta ao nível anterior do drill-down"""
+        if not self.cube_history:
+            return
+        
+        self.cube_dimension, self.cube_filters, self.cube_filter_labels = self.cube_history.pop()
+        self.cube_dimension_combo.set(DIMENSIONS[self.cube_dimension])
+        self.update_drilldown()
+    
+    def reset_drilldown(self):
+        """Remove todos os filtros do drill-down"""
+        self.cube_filters = {}
+        self.cube_filter_labels = {}
+        self.cube_history = []
+        self.update_drilldown()
     
     def update_blood_types_analytics(self):
         """Atualiza a lista de tipos sanguíneos para análise"""
@@ -2319,51 +2925,27 @@ class BloodBankSystem:
             messagebox.showerror("Erro", "Selecione um tipo sanguíneo!")
             return
         
+        if self.snapshot.taken_at is None:
+            messagebox.showinfo("Aguarde", "Os dados das análises ainda estão sendo copiados. Tente de novo em instantes.")
+            return
+        
         try:
-            # Obter dados históricos
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT date(request_date) as day, SUM(quantity) as daily_usage
-                FROM requests
-                WHERE blood_type = ? AND status = 'approved'
-                GROUP BY day
-                ORDER BY day
-            ''', (blood_type,))
+            # Dados e previsão (o mesmo conjunto usado pelo relatório PDF)
+            data = analytics_dataset(self.snapshot.conn, blood_type, days_to_predict)
             
-            data = cursor.fetchall()
-            
-            if len(data) < 30:
+            if data['predictions'] is None:
                 messagebox.showwarning("Aviso", 
-                    f"Dados insuficientes para {blood_type}. Necessário pelo menos 30 dias de histórico.")
+                    f"Dados insuficientes para {blood_type}. Necessário pelo menos {MIN_HISTORY_DAYS} dias de histórico.")
                 return
             
-            # Preparar dados para o modelo
-            dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-            usages = [row[1] for row in data]
-            
-            # Criar features (dias desde a primeira data)
-            day_numbers = np.array([(d - dates[0]).days for d in dates]).reshape(-1, 1)
-            
-            # Treinar modelo Random Forest
-            model = RandomForestRegressor(n_estimators=100, random_state=42)
-            model.fit(day_numbers, usages)
-            
-            # Prever para os próximos dias
-            last_day = day_numbers[-1][0]
-            future_days = np.array([last_day + i for i in range(1, days_to_predict + 1)]).reshape(-1, 1)
-            predictions = model.predict(future_days)
-            
-            # Gerar datas futuras
-            future_dates = [dates[-1] + timedelta(days=i) for i in range(1, days_to_predict + 1)]
-            
             # Plotar resultados
             self.forecast_ax.clear()
             
             # Histórico
-            self.forecast_ax.plot(dates, usages, label='Histórico', marker='o')
+            self.forecast_ax.plot(data['dates'], data['usages'], label='Histórico', marker='o')
             
             # Previsão
-            self.forecast_ax.plot(future_dates, predictions, label='Previsão', linestyle='--', marker='o', color='red')
+            self.forecast_ax.plot(data['future_dates'], data['predictions'], label='Previsão', linestyle='--', marker='o', color='red')
             
             self.forecast_ax.set_title(f'Previsão de Demanda para {blood_type}')
             self.forecast_ax.set_xlabel('Data')
@@ -2375,7 +2957,7 @@ class BloodBankSystem:
             self.forecast_canvas.draw()
             
             # Gerar recomendações
-            self.generate_recommendations(blood_type, predictions, future_dates)
+            self.generate_recommendations(data)
             
         except Exception as e:
             messagebox.showerror("Erro", f"Falha ao gerar previsão: {str(e)}")
@@ -2383,49 +2965,25 @@ class BloodBankSystem:
     
     def generate_stock_vs_demand_chart(self):
         """Gera gráfico comparando estoque atual com demanda média"""
+        if self.snapshot.taken_at is None:
+            return  # Desenhado quando a primeira cópia de leitura terminar
         try:
-            cursor = self.conn.cursor()
-            
-            # Obter estoque atual por tipo
-            cursor.execute('''
-                SELECT b.type, COALESCE(SUM(s.quantity), 0), b.min_stock
-                FROM blood_types b
-                LEFT JOIN stock s ON b.type = s.blood_type
-                GROUP BY b.type
-                ORDER BY b.type
-            ''')
-            
-            stock_data = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
-            
-            # Obter demanda média por tipo (últimos 30 dias)
-            cursor.execute('''
-                SELECT blood_type, AVG(daily_usage)
-                FROM (
-                    SELECT blood_type, date(request_date) as day, SUM(quantity) as daily_usage
-                    FROM requests
-                    WHERE status = 'approved' AND date(request_date) >= date('now', '-30 days')
-                    GROUP BY blood_type, day
-                )
-                GROUP BY blood_type
-            ''')
-            
-            demand_data = {row[0]: row[1] for row in cursor.fetchall() if row[1] is not None}
-            
-            # Preparar dados para o gráfico
-            types = sorted(stock_data.keys())
-            stock = [stock_data[t][0] for t in types]
-            min_stock = [stock_data[t][1] for t in types]
-            demand = [demand_data.get(t, 0) for t in types]
+            # Estoque, mínimo e demanda média (últimos 30 dias) numa única leitura
+            data = stock_demand_dataset(self.snapshot.conn)
+            types = data['types']
+            stock = data['stock']
+            min_stock = data['min_stock']
+            demand = data['demand']
             
             # Plotar gráfico
             self.stock_demand_ax.clear()
             
-            x = np.arange(len(types))
+            x = list(range(len(types)))
             width = 0.25
             
-            self.stock_demand_ax.bar(x - width, stock, width, label='Estoque Atual', color='#d90429')
+            self.stock_demand_ax.bar([i - width for i in x], stock, width, label='Estoque Atual', color='#d90429')
             self.stock_demand_ax.bar(x, min_stock, width, label='Estoque Mínimo', color='#ef233c')
-            self.stock_demand_ax.bar(x + width, demand, width, label='Demanda Média (30 dias)', color='#2b2d42')
+            self.stock_demand_ax.bar([i + width for i in x], demand, width, label='Demanda Média (30 dias)', color='#2b2d42')
             
             self.stock_demand_ax.set_title('Estoque vs Demanda por Tipo Sanguíneo')
             self.stock_demand_ax.set_xlabel('Tipo Sanguíneo')
@@ -2441,43 +2999,27 @@ class BloodBankSystem:
             messagebox.showerror("Erro", f"Falha ao gerar gráfico: {str(e)}")
             self.log_activity(f"Erro no gráfico estoque vs demanda: {str(e)}", level='ERROR')
     
-    def generate_recommendations(self, blood_type, predictions, future_dates):
+    def generate_recommendations(self, data):
         """Gera recomendações baseadas na previsão"""
-        cursor = self.conn.cursor()
-        
-        # Obter estoque atual
-        cursor.execute('''
-            SELECT SUM(quantity) FROM stock WHERE blood_type = ?
-        ''', (blood_type,))
-        current_stock = cursor.fetchone()[0] or 0
-        
-        # Obter estoque mínimo
-        cursor.execute('''
-            SELECT min_stock FROM blood_types WHERE type = ?
-        ''', (blood_type,))
-        min_stock = cursor.fetchone()[0]
-        
-        # Calcular demanda total prevista
-        total_predicted = sum(predictions)
-        avg_daily = total_predicted / len(predictions)
-        
-        # Identificar pico de demanda
-        peak_day_idx = np.argmax(predictions)
-        peak_date = future_dates[peak_day_idx]
-        peak_demand = predictions[peak_day_idx]
+        blood_type = data['blood_type']
+        current_stock = data['current_stock']
+        min_stock = data['min_stock']
+        predictions = data['predictions']
+        total_predicted = data['total_predicted']
+        peak_date = data['peak_date'].date()
         
         # Gerar texto de recomendações
         recommendations = f"Recomendações para {blood_type}:\n\n"
         recommendations += f"- Estoque atual: {current_stock} unidades\n"
         recommendations += f"- Estoque mínimo recomendado: {min_stock} unidades\n"
         recommendations += f"- Demanda prevista para os próximos {len(predictions)} dias: {total_predicted:.1f} unidades\n"
-        recommendations += f"- Demanda média diária prevista: {avg_daily:.1f} unidades/dia\n"
-        recommendations += f"- Pico de demanda previsto: {peak_demand:.1f} unidades em {peak_date.strftime('%d/%m/%Y')}\n\n"
+        recommendations += f"- Demanda média diária prevista: {data['avg_predicted']:.1f} unidades/dia\n"
+        recommendations += f"- Pico de demanda previsto: {data['peak_demand']:.1f} unidades em {peak_date.strftime('%d/%m/%Y')}\n\n"
         
-        if current_stock >= total_predicted + min_stock:
+        if data['deficit'] <= 0:
             recommendations += "✅ Estoque suficiente para atender à demanda prevista e manter o mínimo recomendado."
         else:
-            deficit = (total_predicted + min_stock) - current_stock
+            deficit = data['deficit']
             recommendations += f"⚠️ Atenção: Déficit previsto de {deficit:.1f} unidades.\n"
             recommendations += f"- Recomendação: Obter pelo menos {max(deficit, min_stock)} unidades adicionais.\n"
             
@@ -2491,202 +3033,21 @@ class BloodBankSystem:
                 recommendations += f"- Prioridade BAIXA: Pico de demanda em {days_until_peak} dias.\n"
             
             # Verificar se há doadores frequentes deste tipo
-            cursor.execute('''
-                SELECT COUNT(*) 
-                FROM donations 
-                WHERE donor_blood_type = ? AND date(next_donation_date) <= date('now')
-            ''', (blood_type,))
-            eligible_donors = cursor.fetchone()[0]
-            
-            if eligible_donors > 0:
-                recommendations += f"- {eligible_donors} doadores deste tipo podem doar novamente. Considere contatá-los.\n"
+            if data['eligible_donors'] > 0:
+                recommendations += f"- {data['eligible_donors']} doadores deste tipo podem doar novamente. Considere contatá-los.\n"
         
         self.recommendation_text.delete(1.0, tk.END)
         self.recommendation_text.insert(tk.END, recommendations)
     
     def generate_analytics_report(self):
-        """Gera relatório PDF completo de análises"""
-        try:
-            blood_type = self.analytics_type_combo.get()
-            if not blood_type:
-                messagebox.showerror("Erro", "Selecione um tipo sanguíneo para gerar o relatório!")
-                return
-            
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', 'B', 16)
-            
-            # Título
-            pdf.cell(0, 10, 'Relatório de Análise Preditiva', 0, 1, 'C')
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, f'Tipo Sanguíneo: {blood_type}', 0, 1, 'C')
-            pdf.cell(0, 10, f'Emitido em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
-            pdf.cell(0, 10, f'Emitido por: {self.current_user["name"]}', 0, 1, 'C')
-            pdf.ln(10)
-            
-            # Seção 1: Estoque Atual
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, '1. Situação Atual do Estoque', 0, 1)
-            pdf.set_font('Arial', '', 12)
-            
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                SELECT SUM(quantity) FROM stock WHERE blood_type = ?
-            ''', (blood_type,))
-            current_stock = cursor.fetchone()[0] or 0
-            
-            cursor.execute('''
-                SELECT min_stock FROM blood_types WHERE type = ?
-            ''', (blood_type,))
-            min_stock = cursor.fetchone()[0]
-            
-            pdf.cell(0, 10, f'- Estoque atual: {current_stock} unidades', 0, 1)
-            pdf.cell(0, 10, f'- Estoque mínimo recomendado: {min_stock} unidades', 0, 1)
-            
-            status = "✅ Suficiente" if current_stock >= min_stock else "⚠️ Abaixo do mínimo"
-            pdf.cell(0, 10, f'- Status: {status}', 0, 1)
-            pdf.ln(5)
-            
-            # Seção 2: Análise de Demanda
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, '2. Análise de Demanda', 0, 1)
-            pdf.set_font('Arial', '', 12)
-            
-            # Demanda dos últimos 30 dias
-            cursor.execute('''
-                SELECT AVG(daily_usage), MAX(daily_usage), MIN(daily_usage)
-                FROM (
-                    SELECT date(request_date) as day, SUM(quantity) as daily_usage
-                    FROM requests
-                    WHERE blood_type = ? AND status = 'approved' AND date(request_date) >= date('now', '-30 days')
-                    GROUP BY day
-                )
-            ''', (blood_type,))
-            
-            avg_demand, max_demand, min_demand = cursor.fetchone()
-            
-            if avg_demand:
-                pdf.cell(0, 10, f'- Demanda média (últimos 30 dias): {avg_demand:.1f} unidades/dia', 0, 1)
-                pdf.cell(0, 10, f'- Máxima diária: {max_demand:.1f} unidades', 0, 1)
-                pdf.cell(0, 10, f'- Mínima diária: {min_demand:.1f} unidades', 0, 1)
-            else:
-                pdf.cell(0, 10, '- Sem dados de demanda nos últimos 30 dias', 0, 1)
-            
-            pdf.ln(5)
-            
-            # Seção 3: Previsão
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, '3. Previsão de Demanda', 0, 1)
-            pdf.set_font('Arial', '', 12)
-            
-            days_to_predict = int(self.forecast_days_combo.get())
-            
-            # Obter dados históricos para previsão
-            cursor.execute('''
-                SELECT date(request_date) as day, SUM(quantity) as daily_usage
-                FROM requests
-                WHERE blood_type = ? AND status = 'approved'
-                GROUP BY day
-                ORDER BY day
-            ''', (blood_type,))
-            
-            data = cursor.fetchall()
-            
-            if len(data) >= 30:
-                dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in data]
-                usages = [row[1] for row in data]
-                
-                # Treinar modelo
-                day_numbers = np.array([(d - dates[0]).days for d in dates]).reshape(-1, 1)
-                model = RandomForestRegressor(n_estimators=100, random_state=42)
-                model.fit(day_numbers, usages)
-                
-                # Fazer previsão
-                last_day = day_numbers[-1][0]
-                future_days = np.array([last_day + i for i in range(1, days_to_predict + 1)]).reshape(-1, 1)
-                predictions = model.predict(future_days)
-                
-                total_predicted = sum(predictions)
-                avg_daily_predicted = total_predicted / days_to_predict
-                peak_day_idx = np.argmax(predictions)
-                peak_demand = predictions[peak_day_idx]
-                
-                pdf.cell(0, 10, f'- Período de previsão: {days_to_predict} dias', 0, 1)
-                pdf.cell(0, 10, f'- Demanda total prevista: {total_predicted:.1f} unidades', 0, 1)
-                pdf.cell(0, 10, f'- Demanda média prevista: {avg_daily_predicted:.1f} unidades/dia', 0, 1)
-                pdf.cell(0, 10, f'- Pico de demanda previsto: {peak_demand:.1f} unidades', 0, 1)
-                
-                # Adicionar gráfico de previsão
-                pdf.ln(10)
-                pdf.set_font('Arial', 'B', 12)
-                pdf.cell(0, 10, 'Gráfico de Previsão de Demanda', 0, 1)
-                
-                # Criar gráfico temporário para salvar como imagem
-                fig = plt.Figure(figsize=(8, 4), dpi=100)
-                ax = fig.add_subplot(111)
-                
-                future_dates = [dates[-1] + timedelta(days=i) for i in range(1, days_to_predict + 1)]
-                
-                ax.plot(dates, usages, label='Histórico', marker='o')
-                ax.plot(future_dates, predictions, label='Previsão', linestyle='--', marker='o', color='red')
-                
-                ax.set_title(f'Previsão de Demanda para {blood_type}')
-                ax.set_xlabel('Data')
-                ax.set_ylabel('Unidades')
-                ax.legend()
-                ax.grid(True)
-                fig.autofmt_xdate()
-                
-                # Salvar gráfico como imagem temporária
-                temp_img = "temp_forecast.png"
-                fig.savefig(temp_img, bbox_inches='tight')
-                plt.close(fig)
-                
-                # Adicionar imagem ao PDF
-                pdf.image(temp_img, x=10, w=190)
-                os.remove(temp_img)  # Remover arquivo temporário
-            else:
-                pdf.cell(0, 10, '- Dados insuficientes para previsão (mínimo 30 dias de histórico)', 0, 1)
-            
-            pdf.ln(10)
-            
-            # Seção 4: Recomendações
-            pdf.set_font('Arial', 'B', 14)
-            pdf.cell(0, 10, '4. Recomendações', 0, 1)
-            pdf.set_font('Arial', '', 12)
-            
-            if len(data) >= 30:
-                required_stock = total_predicted + min_stock
-                deficit = required_stock - current_stock
-                
-                if current_stock >= required_stock:
-                    pdf.cell(0, 10, '- Estoque suficiente para atender à demanda prevista e manter o mínimo recomendado.', 0, 1)
-                else:
-                    pdf.cell(0, 10, f'- Estoque insuficiente. Déficit previsto: {deficit:.1f} unidades', 0, 1)
-                    pdf.cell(0, 10, f'- Recomendação: Obter pelo menos {max(deficit, min_stock)} unidades adicionais', 0, 1)
-                    
-                    # Verificar doadores elegíveis
-                    cursor.execute('''
-                        SELECT COUNT(*) 
-                        FROM donations 
-                        WHERE donor_blood_type = ? AND date(next_donation_date) <= date('now')
-                    ''', (blood_type,))
-                    eligible_donors = cursor.fetchone()[0]
-                    
-                    if eligible_donors > 0:
-                        pdf.cell(0, 10, f'- {eligible_donors} doadores deste tipo podem doar novamente. Considere contatá-los.', 0, 1)
-            else:
-                pdf.cell(0, 10, '- Coletar mais dados históricos para gerar recomendações precisas.', 0, 1)
-            
-            # Salvar PDF
-            filename = f"relatorio_analise_{blood_type}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf"
-            pdf.output(filename)
-            
-            messagebox.showinfo("Sucesso", f"Relatório gerado com sucesso:\n{filename}")
-            
-        except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao gerar relatório: {str(e)}")
-            self.log_activity(f"Erro ao gerar relatório de análise: {str(e)}", level='ERROR')
+        """Coloca o relatório PDF completo de análises na fila de relatórios"""
+        blood_type = self.analytics_type_combo.get()
+        if not blood_type:
+            messagebox.showerror("Erro", "Selecione um tipo sanguíneo para gerar o relatório!")
+            return
+        
+        self.enqueue_report('analytics', f'Análise {blood_type}', f'relatorio_analise_{blood_type}', blood_type=blood_type,
+                            days_to_predict=int(self.forecast_days_combo.get()))
     
     def create_chatbot_tab(self):
         """Cria a aba do chatbot de suporte"""
@@ -2834,132 +3195,216 @@ class BloodBankSystem:
             return "Desculpe, não entendi sua pergunta. Você pode reformular ou perguntar sobre:\n- Estoque\n- Requisições\n- Doações\n- Previsões\n- Como usar o sistema"
     
     def generate_request_report(self):
-        """Gera relatório PDF das requisições"""
+        """Coloca o relatório PDF das requisições na fila de relatórios"""
         selected = self.requests_tree.selection()
         filter_status = self.filter_combo.get()
         
+        if selected:
+            request_id = self.requests_tree.item(selected[0])['values'][0]
+            self.enqueue_report('requests', f'Requisição #{request_id}', f'requisicao_{request_id}',
+                                filter_status=filter_status, request_id=request_id)
+        else:
+            period = self.report_period(self.request_report_from_entry, self.request_report_to_entry)
+            if period is None:
+                return
+            
+            self.enqueue_report('requests', f'Requisições ({filter_status})',
+                                f'relatorio_requisicoes_{filter_status.lower()}',
+                                filter_status=filter_status, blood_type=self.request_report_type_combo.get(),
+                                date_from=period[0], date_to=period[1])
+    
+    def enqueue_report(self, kind, title, stem, **params):
+        """Envia um relatório para ser gerado em segundo plano (ou reaproveita o já gerado)"""
         try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font('Arial', 'B', 16)
-            
-            # Título
-            title = 'Relatório de Requisições de Sangue'
-            if filter_status != 'Todas':
-                title += f' ({filter_status})'
-            
-            pdf.cell(0, 10, title, 0, 1, 'C')
-            pdf.set_font('Arial', '', 12)
-            pdf.cell(0, 10, f'Emitido em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
-            pdf.cell(0, 10, f'Emitido por: {self.current_user["name"]}', 0, 1, 'C')
-            pdf.ln(10)
-            
-            if selected:
-                # Relatório individual
-                request_id = self.requests_tree.item(selected[0])['values'][0]
-                
-                cursor = self.conn.cursor()
-                cursor.execute('''
-                    SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status, 
-                           r.urgency, r.patient_info, r.response_date, u2.name
-                    FROM requests r
-                    JOIN users u ON r.requesting_doctor = u.id
-                    LEFT JOIN users u2 ON r.responding_staff = u2.id
-                    WHERE r.id = ?
-                ''', (request_id,))
-                
-                request_data = cursor.fetchone()
-                
-                if request_data:
-                    pdf.set_font('Arial', 'B', 14)
-                    pdf.cell(0, 10, f'Requisição #{request_id}', 0, 1)
-                    pdf.set_font('Arial', '', 12)
-                    
-                    fields = [
-                        ("Tipo Sanguíneo:", request_data[1]),
-                        ("Quantidade:", str(request_data[2])),
-                        ("Médico Solicitante:", request_data[3]),
-                        ("Data da Requisição:", request_data[4]),
-                        ("Status:", {
-                            'pending': 'Pendente',
-                            'approved': 'Aprovada',
-                            'rejected': 'Rejeitada'
-                        }.get(request_data[5], request_data[5])),
-                        ("Urgência:", request_data[6] or "Normal"),
-                        ("Informações do Paciente:", request_data[7] or "Não informado"),
-                        ("Data da Resposta:", request_data[8] or "N/A"),
-                        ("Responsável pela Resposta:", request_data[9] or "N/A")
-                    ]
-                    
-                    for label, value in fields:
-                        pdf.cell(50, 10, label, 0, 0)
-                        pdf.cell(0, 10, value, 0, 1)
-            else:
-                # Relatório múltiplo
-                pdf.set_font('Arial', 'B', 12)
-                pdf.cell(15, 10, 'ID', 1, 0, 'C', 1)
-                pdf.cell(30, 10, 'Tipo', 1, 0, 'C', 1)
-                pdf.cell(25, 10, 'Qtd', 1, 0, 'C', 1)
-                pdf.cell(60, 10, 'Médico', 1, 0, 'C', 1)
-                pdf.cell(40, 10, 'Data', 1, 0, 'C', 1)
-                pdf.cell(20, 10, 'Status', 1, 1, 'C', 1)
-                
-                pdf.set_font('Arial', '', 10)
-                
-                cursor = self.conn.cursor()
-                status_map = {"Todas": None, "Pendentes": "pending", "Aprovadas": "approved", "Rejeitadas": "rejected"}
-                status = status_map[filter_status]
-                
-                if status:
-                    cursor.execute('''
-                        SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status
-                        FROM requests r
-                        JOIN users u ON r.requesting_doctor = u.id
-                        WHERE r.status = ?
-                        ORDER BY r.request_date DESC
-                    ''', (status,))
-                else:
-                    cursor.execute('''
-                        SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status
-                        FROM requests r
-                        JOIN users u ON r.requesting_doctor = u.id
-                        ORDER BY r.request_date DESC
-                    ''')
-                
-                for row in cursor.fetchall():
-                    pdf.cell(15, 10, str(row[0]), 1, 0, 'C')
-                    pdf.cell(30, 10, row[1], 1, 0, 'C')
-                    pdf.cell(25, 10, str(row[2]), 1, 0, 'C')
-                    pdf.cell(60, 10, row[3], 1, 0)
-                    pdf.cell(40, 10, row[4], 1, 0, 'C')
-                    
-                    status_text = {
-                        'pending': 'Pendente',
-                        'approved': 'Aprovada',
-                        'rejected': 'Rejeitada'
-                    }.get(row[5], row[5])
-                    
-                    # Cores para status
-                    if status_text == 'Aprovada':
-                        pdf.set_text_color(0, 128, 0)  # Verde
-                    elif status_text == 'Rejeitada':
-                        pdf.set_text_color(255, 0, 0)  # Vermelho
-                    
-                    pdf.cell(20, 10, status_text, 1, 1, 'C')
-                    pdf.set_text_color(0, 0, 0)  # Volta ao preto
+            job_id = self.report_queue.submit(kind, title, stem, issued_by=self.current_user['name'], **params)
+            job = self.report_queue.jobs[job_id]
+            self.update_reports_tree()
             
-            # Salvar PDF
-            if selected:
-                filename = f"requisicao_{request_id}_{datetime.now().strftime('%Y%m%d')}.pdf"
+            if job['status'] == 'done':
+                self.log_activity(f"Relatório '{title}' reaproveitado do cache: {job['path']}")
+                messagebox.showinfo("Relatórios", f"Os dados não mudaram desde a última geração.\nRelatório disponível em:\n{job['path']}")
             else:
-                filename = f"relatorio_requisicoes_{filter_status.lower()}_{datetime.now().strftime('%Y%m%d')}.pdf"
-            
-            pdf.output(filename)
-            messagebox.showinfo("Sucesso", f"Relatório gerado:\n{filename}")
-            
+                self.log_activity(f"Relatório '{title}' enviado para a fila (trabalho #{job_id})")
+                messagebox.showinfo("Relatórios", f"Relatório '{title}' adicionado à fila.\nAcompanhe o andamento na aba Relatórios.")
+        except Exception as e:
+            messagebox.showerror("Erro", f"Falha ao enfileirar relatório: {str(e)}")
+            self.log_activity(f"Erro ao enfileirar relatório {kind}: {str(e)}", level='ERROR')
+    
+    def create_reports_tab(self):
+        """Cria a aba que acompanha a fila de relatórios"""
+        tab = ttk.Frame(self.notebook)
+        self.notebook.add(tab, text="🗂️ Relatórios")
+        
+        # Frame de controle
+        control_frame = ttk.Frame(tab, padding=10)
+        control_frame.pack(fill=tk.X)
+        
+        ttk.Label(control_frame, text="Pasta de saída:").pack(side=tk.LEFT, padx=5)
+        self.report_dir_var = tk.StringVar(value=os.path.abspath(self.report_queue.output_dir))
+        ttk.Entry(control_frame, textvariable=self.report_dir_var, state='readonly', width=60).pack(side=tk.LEFT, padx=5)
+        
+        if self.current_user['role'] == 'admin':
+            ttk.Button(control_frame, text="Alterar...",
+                      command=self.change_report_output_dir).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(control_frame, text="Limpar Concluídos",
+                  command=self.clear_finished_reports).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(control_frame, text="Cancelar", style='Secondary.TButton',
+                  command=self.cancel_selected_report).pack(side=tk.RIGHT, padx=5)
+        
+        # Treeview com os trabalhos
+        columns = ("ID", "Relatório", "Status", "Progresso", "Etapa", "Enviado", "Arquivo")
+        self.reports_tree = ttk.Treeview(tab, columns=columns, show='headings')
+        
+        for col in columns:
+            self.reports_tree.heading(col, text=col)
+        self.reports_tree.column("ID", width=50)
+        self.reports_tree.column("Relatório", width=180)
+        self.reports_tree.column("Status", width=90)
+        self.reports_tree.column("Progresso", width=80)
+        self.reports_tree.column("Etapa", width=200)
+        self.reports_tree.column("Enviado", width=80)
+        self.reports_tree.column("Arquivo", width=400)
+        
+        self.reports_tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # Cores por status
+        self.reports_tree.tag_configure('running', background='#e7f1ff')
+        self.reports_tree.tag_configure('done', background='#d4edda')
+        self.reports_tree.tag_configure('failed', background='#f8d7da')
+        self.reports_tree.tag_configure('cancelled', background='#e2e3e5')
+        
+        self.update_reports_tree()
+    
+    def update_reports_tree(self):
+        """Atualiza a lista de trabalhos da aba Relatórios"""
+        tree = getattr(self, 'reports_tree', None)
+        if tree is None or not tree.winfo_exists():
+            return
+        
+        # Linhas atualizadas no lugar (identificadas pelo id do trabalho) para não perder a seleção
+        jobs = list(self.report_queue.jobs.values())
+        current = {str(job['id']) for job in jobs}
+        for item in tree.get_children():
+            if item not in current:
+                tree.delete(item)
+        
+        for job in jobs:
+            iid = str(job['id'])
+            values = (
+                job['id'],
+                job['title'],
+                REPORT_STATUS_LABELS[job['status']],
+                f"{job['progress'] * 100:.0f}%",
+                job['message'],
+                job['submitted'].strftime('%H:%M:%S'),
+                (job['path'] + (f" (+{job['parts'] - 1} partes)" if job['parts'] > 1 else ''))
+                if job['status'] == 'done' else ''
+            )
+            if not tree.exists(iid):
+                # Trabalhos mais novos no topo
+                tree.insert('', 0, iid=iid, values=values, tags=(job['status'],))
+            elif [str(v) for v in tree.item(iid, 'values')] != [str(v) for v in values]:
+                tree.item(iid, values=values, tags=(job['status'],))
+    
+    def schedule_report_poll(self):
+        """Acompanha periodicamente o andamento da fila de relatórios"""
+        try:
+            for job in self.report_queue.poll():
+                if job['status'] == 'done':
+                    self.log_activity(f"Relatório gerado: {job['path']}")
+                elif job['status'] == 'failed':
+                    self.log_activity(f"Erro ao gerar relatório '{job['title']}': {job['error']}", level='ERROR')
+            self.update_reports_tree()
+        except Exception as e:
+            self.log_activity(f"Falha ao acompanhar a fila de relatórios: {str(e)}", level='ERROR')
+        
+        self.root.after(REPORT_POLL_MS, self.schedule_report_poll)
+    
+    def schedule_snapshot_refresh(self):
+        """Atualiza periodicamente a cópia de leitura das análises"""
+        if self.snapshot.start_refresh():
+            self.root.after(SNAPSHOT_POLL_MS, self.poll_snapshot_refresh)
+        
+        seconds = float(get_setting(self.conn, SETTING_REFRESH_SECONDS, DEFAULT_REFRESH_SECONDS))
+        self.root.after(int(seconds * 1000), self.schedule_snapshot_refresh)
+    
+    def poll_snapshot_refresh(self, on_done=None):
+        """Acompanha a cópia de leitura feita em segundo plano e troca a conexão ao terminar"""
+        if not self.snapshot.refreshing:
+            return
+        try:
+            copied = self.snapshot.poll()
+        except sqlite3.Error as e:
+            self.log_activity(f"Falha ao atualizar a cópia de leitura: {str(e)}", level='ERROR')
+            if on_done:
+                messagebox.showerror("Erro", f"Falha ao atualizar os dados das análises: {str(e)}")
+            return
+        if self.snapshot.refreshing:
+            self.root.after(SNAPSHOT_POLL_MS, lambda: self.poll_snapshot_refresh(on_done))
+            return
+        
+        if copied:
+            self.log_activity("Cópia de leitura das análises atualizada")
+            if self.snapshot.copies == 1 and not on_done and hasattr(self, 'cube_ax'):
+                # A aba de análises foi aberta antes da primeira cópia terminar
+                self.generate_stock_vs_demand_chart()
+                self.update_drilldown()
+        self.update_snapshot_label()
+        if on_done:
+            on_done()
+    
+    def update_snapshot_label(self):
+        """Mostra na aba de análises a hora da cópia de leitura"""
+        label = getattr(self, 'snapshot_label', None)
+        if label is not None and label.winfo_exists():
+            label.config(text=self.snapshot.describe())
+    
+    def refresh_analytics_data(self):
+        """Atualiza a cópia de leitura e, quando ela terminar, os gráficos da aba de análises"""
+        def redraw():
+            self.generate_stock_vs_demand_chart()
+            self.update_drilldown()
+        
+        if not self.snapshot.start_refresh(force=True):
+            # Já há uma cópia em andamento: os gráficos usam a que está valendo
+            redraw()
+            return
+        self.root.after(SNAPSHOT_POLL_MS, lambda: self.poll_snapshot_refresh(redraw))
+    
+    def cancel_selected_report(self):
+        """Cancela o trabalho de relatório selecionado"""
+        selected = self.reports_tree.selection()
+        if not selected:
+            messagebox.showwarning("Aviso", "Selecione um relatório para cancelar!")
+            return
+        
+        if not self.report_queue.cancel(int(selected[0])):
+            messagebox.showinfo("Relatórios", "Este relatório já foi encerrado.")
+        self.update_reports_tree()
+    
+    def clear_finished_reports(self):
+        """Remove da lista os relatórios já encerrados"""
+        self.report_queue.clear_finished()
+        self.update_reports_tree()
+    
+    def change_report_output_dir(self):
+        """Altera a pasta onde os relatórios são gravados"""
+        from tkinter import filedialog
+        directory = filedialog.askdirectory(title="Pasta dos relatórios",
+                                            initialdir=self.report_dir_var.get())
+        if not directory:
+            return
+        
+        try:
+            set_setting(self.conn, SETTING_OUTPUT_DIR, directory)
+            self.conn.commit()
+            self.report_queue.output_dir = directory
+            self.report_dir_var.set(directory)
+            self.log_activity(f"Pasta de relatórios alterada para {directory}")
         except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao gerar relatório PDF: {str(e)}")
-            self.log_activity(f"Erro ao gerar PDF: {str(e)}", level='ERROR')
+            messagebox.showerror("Erro", f"Falha ao salvar configuração: {str(e)}")
+            self.log_activity(f"Erro ao alterar pasta de relatórios: {str(e)}", level='ERROR')
     
     def show_alerts(self):
         """Mostra a janela de alertas/notificações"""
@@ -3016,16 +3461,7 @@ class BloodBankSystem:
     
     def check_low_stock(self):
         """Verifica e alerta sobre estoque baixo"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT b.type, COALESCE(SUM(s.quantity), 0), b.min_stock 
-            FROM blood_types b
-            LEFT JOIN stock s ON b.type = s.blood_type
-            GROUP BY b.type
-            HAVING SUM(s.quantity) < b.min_stock OR SUM(s.quantity) IS NULL
-        ''')
-        
-        low_stock = cursor.fetchall()
+        low_stock = [row for row in stock_levels(self.conn) if row[1] < row[2]]
         
         if low_stock:
             message = "Atenção! Estoque baixo para os seguintes tipos:\n\n"
@@ -3033,6 +3469,7 @@ class BloodBankSystem:
                 message += f"- {row[0]}: {row[1]} unidades (mínimo: {row[2]})\n"
             
             # Registrar alerta para administradores
+            cursor = self.conn.cursor()
             cursor.execute("SELECT id FROM users WHERE role = 'admin' AND is_active = 1")
             admins = cursor.fetchall()
             
@@ -3046,18 +3483,15 @@ class BloodBankSystem:
     
     def check_stock_levels(self, blood_type):
         """Verifica os níveis de estoque para um tipo específico"""
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT COALESCE(SUM(quantity), 0), min_stock 
-            FROM stock
-            JOIN blood_types ON stock.blood_type = blood_types.type
-            WHERE blood_type = ?
-        ''', (blood_type,))
+        levels = {row[0]: row[1:3] for row in stock_levels(self.conn)}
+        if blood_type not in levels:
+            return
         
-        stock, min_stock = cursor.fetchone()
+        stock, min_stock = levels[blood_type]
         
         if stock < min_stock:
             # Registrar alerta
+            cursor = self.conn.cursor()
             cursor.execute("SELECT id FROM users WHERE role = 'admin' AND is_active = 1")
             admins = cursor.fetchall()
             
@@ -3071,6 +3505,65 @@ class BloodBankSystem:
             
             self.conn.commit()
     
+    def handle_demand_surge(self, alert):
+        """Registra alerta de pico de demanda para administradores e técnicos"""
+        stream_text = 'aprovada' if alert['stream'] == 'approved' else 'solicitada'
+        message = (
+            f"Pico de demanda {stream_text} de {alert['blood_type']}: "
+            f"{alert['hour_qty']:.0f} unidades na última hora "
+            f"(esperado: {alert['expected']:.1f})"
+        )
+        
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT id FROM users WHERE role IN ('admin', 'technician') AND is_active = 1")
+            recipients = cursor.fetchall()
+            
+            now = datetime.now().isoformat()
+            cursor.executemany('''
+                INSERT INTO alerts (type, message, recipient_id, sent_date, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [('demand_surge', message, user_id, now, 'sent') for user_id, in recipients])
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.log_activity(f"Falha ao registrar alerta de pico de demanda: {str(e)}", level='ERROR')
+            return
+        
+        self.log_activity(message)
+        
+        # Atualizar contador de notificações se o usuário atual recebeu o alerta
+        alert_btn = getattr(self, 'alert_btn', None)
+        if (self.current_user and self.current_user['role'] in ['admin', 'technician']
+                and alert_btn is not None and alert_btn.winfo_exists()):
+            self.load_alerts()
+            alert_btn.config(text=f"🔔 {len(self.alerts)}", style='Primary.TButton')
+    
+    def schedule_detector_flush(self):
+        """Grava periodicamente o estado do detector de picos de demanda"""
+        try:
+            self.demand_detector.flush()
+        except sqlite3.Error as e:
+            self.log_activity(f"Falha ao gravar estado do detector: {str(e)}", level='ERROR')
+        
+        self.root.after(DETECTOR_FLUSH_MS, self.schedule_detector_flush)
+    
+    def on_close(self):
+        """Grava o estado pendente e encerra o sistema"""
+        try:
+            self.demand_detector.flush()
+        except sqlite3.Error as e:
+            self.log_activity(f"Falha ao gravar estado do detector: {str(e)}", level='ERROR')
+        
+        self.report_queue.shutdown()
+        self.auth_executor.shutdown(wait=False)
+        self.import_executor.shutdown(wait=False)
+        self.notification_executor.shutdown(wait=False)
+        self.label_executor.shutdown(wait=False)
+        self.snapshot.close()
+        self.change_bus.close()
+        self.conn.close()
+        self.root.destroy()
+    
     def log_activity(self, message, level='INFO'):
         """Registra atividades no log do sistema"""
         if level == 'INFO':
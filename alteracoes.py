@@ -0,0 +1,167 @@
+"""Registro de alterações (captura de mudanças) das tabelas operacionais
+
+Gatilhos em stock, requests, donations e alerts acrescentam uma linha na
+tabela changes a cada inserção, alteração ou exclusão, com um número de
+sequência crescente. Quem precisa saber "o que mudou desde X" (exportação
+incremental, atualização das telas) guarda a última sequência que viu e lê
+só as linhas seguintes.
+
+Cada leitor registra a sua posição em change_consumers: as exportações
+incrementais (permanentes, só avançam a cada exportação) e o barramento de
+eventos de cada posto aberto (renovado a cada minuto; some se o posto parar
+de renovar). `prune_changes` apaga as linhas que todos os leitores já viram
+e guarda até onde apagou, para quem voltar depois disso saber que perdeu
+alterações.
+
+Além do registro linha a linha, table_versions guarda um contador por tabela,
+incrementado por gatilhos a cada alteração: é a marca d'água dos dados usada
+pelo cache de relatórios e pelos ETags do serviço HTTP.
+"""
+from configuracoes import create_settings_table, get_setting, set_setting
+
+CAPTURED_TABLES = ('stock', 'requests', 'donations', 'alerts')
+
+OPERATIONS = {'INSERT': ('I', 'NEW'), 'UPDATE': ('U', 'NEW'), 'DELETE': ('D', 'OLD')}
+
+SETTING_PRUNED_UPTO = 'changes_pruned_upto'
+CONSUMER_SAVE_SECONDS = 60  # Intervalo de renovação da posição de um leitor ao vivo
+CONSUMER_STALE_MINUTES = 60  # Leitor ao vivo sem renovar há mais tempo não segura a limpeza
+
+# Tabelas lidas por cada relatório (a marca d'água só considera estas)
+REPORT_TABLES = {
+    'stock': ('stock', 'blood_types', 'settings'),
+    'donations': ('donations',),
+    'requests': ('requests', 'users'),
+    'analytics': ('stock', 'blood_types', 'requests', 'donations'),
+}
+
+TRACKED_TABLES = ('stock', 'blood_types', 'settings', 'donations', 'requests', 'users')
+
+
+def create_changes_table(conn):
+    """Cria a tabela changes, os gatilhos de captura e o registro de leitores"""
+    create_settings_table(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL CHECK(op IN ('I', 'U', 'D')),
+            changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+        )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_changes_table_seq ON changes(table_name, seq)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_consumers (
+            name TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL,
+            durable INTEGER NOT NULL DEFAULT 0,
+            updated TEXT NOT NULL
+        )''')
+
+    for table in CAPTURED_TABLES:
+        for event, (op, row) in OPERATIONS.items():
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_{event.lower()} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {row}.id, '{op}');
+                END''')
+
+
+def create_version_table(conn):
+    """Cria os contadores de versão por tabela e seus gatilhos"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )''')
+
+    for table in TRACKED_TABLES:
+        conn.execute("INSERT OR IGNORE INTO table_versions (table_name, version) VALUES (?, 0)", (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            # Em users só o nome aparece nos relatórios (o login atualiza last_login)
+            columns = ' OF name' if table == 'users' and event == 'UPDATE' else ''
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_version_{table}_{event.lower()} AFTER {event}{columns} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+                END''')
+
+
+def data_watermark(conn, kind):
+    """Versões atuais das tabelas lidas pelo relatório"""
+    tables = REPORT_TABLES[kind]
+    placeholders = ', '.join('?' for _ in tables)
+    return dict(conn.execute(
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({placeholders})", tables
+    ).fetchall())
+
+
+def pruned_upto(conn):
+    """Última sequência já apagada pela limpeza (0 se nunca houve limpeza)"""
+    return int(get_setting(conn, SETTING_PRUNED_UPTO, 0))
+
+
+def last_change_seq(conn, table=None):
+    """Maior número de sequência registrado, da tabela indicada ou de todas
+
+    Nunca diminui: depois de uma limpeza vale pelo menos a sequência apagada.
+    """
+    if table:
+        row = conn.execute("SELECT MAX(seq) FROM changes WHERE table_name = ?", (table,)).fetchone()
+    else:
+        row = conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+    return max(row[0] or 0, pruned_upto(conn))
+
+
+def changes_available(conn, since_seq):
+    """Se todas as alterações depois de `since_seq` ainda estão no registro"""
+    return since_seq >= pruned_upto(conn)
+
+
+def changes_since(conn, since_seq, table=None, upto_seq=None):
+    """Alterações (seq, tabela, id, operação) após `since_seq`, em ordem"""
+    query = "SELECT seq, table_name, row_id, op FROM changes WHERE seq > ?"
+    params = [since_seq]
+    if table:
+        query += " AND table_name = ?"
+        params.append(table)
+    if upto_seq is not None:
+        query += " AND seq <= ?"
+        params.append(upto_seq)
+    query += " ORDER BY seq"
+    return conn.execute(query, params).fetchall()
+
+
+def save_consumer(conn, name, seq, durable=False):
+    """Registra até onde o leitor já leu (o commit fica a cargo de quem chama)"""
+    conn.execute('''
+        INSERT INTO change_consumers (name, seq, durable, updated)
+        VALUES (?, ?, ?, datetime('now', 'localtime'))
+        ON CONFLICT(name) DO UPDATE SET seq = excluded.seq, durable = excluded.durable, updated = excluded.updated
+    ''', (name, seq, 1 if durable else 0))
+
+
+def drop_consumer(conn, name):
+    """Remove um leitor que não vai mais ler (o commit fica a cargo de quem chama)"""
+    conn.execute("DELETE FROM change_consumers WHERE name = ?", (name,))
+
+
+def prune_changes(conn, stale_minutes=CONSUMER_STALE_MINUTES):
+    """Apaga as alterações que todos os leitores ativos já leram; devolve quantas saíram
+
+    Leitores ao vivo que não renovam a posição há mais de `stale_minutes`
+    são descartados antes do cálculo.
+    """
+    with conn:
+        conn.execute(f'''
+            DELETE FROM change_consumers
+            WHERE durable = 0 AND updated < datetime('now', 'localtime', '-{int(stale_minutes)} minutes')
+        ''')
+        floor = conn.execute("SELECT MIN(seq) FROM change_consumers").fetchone()[0]
+        if floor is None:
+            floor = last_change_seq(conn)
+        if floor <= pruned_upto(conn):
+            return 0
+        removed = conn.execute("DELETE FROM changes WHERE seq <= ?", (floor,)).rowcount
+        set_setting(conn, SETTING_PRUNED_UPTO, floor)
+    return removed
@@ -0,0 +1,183 @@
+"""Teste de carga da aprovação de requisições com vários postos ao mesmo tempo
+
+Gera um banco temporário com o esquema completo do sistema, um saldo inicial
+por tipo sanguíneo (com as bolsas cadastradas) e mais requisições pendentes
+do que o estoque cobre. Vários trabalhadores (threads
+ou processos, cada um com sua conexão) tentam aprovar todas as requisições
+em ordens diferentes, disputando as mesmas linhas. Ao final informa a vazão,
+a latência (mediana, p95 e máxima) e confere que o estoque de nenhum tipo
+ficou negativo e que a baixa bate com as requisições aprovadas e com as
+bolsas que continuam no estoque. Só erros de
+banco ocupado contam como "ocupado"; qualquer outro erro de banco encerra a
+carga com falha, assim como uma carga que não aprovou nenhuma requisição.
+
+Com --sem-trava roda a aprovação antiga (lê o saldo, confere em Python e
+depois grava), para comparar: sob disputa ela deixa o estoque negativo.
+
+Uso: python benchmark_aprovacoes.py [--trabalhadores N] [--requisicoes N] [--estoque N] [--processos] [--sem-trava]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+
+from esquema import create_schema
+from operacoes import approve_request, available_stock, OperationError, _is_busy
+from unidades import register_units, shipment_units
+
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+
+def build_database(path, requests, initial_stock):
+    """Cria um banco com estoque inicial (e suas bolsas) e requisições pendentes sintéticas"""
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    create_schema(conn)
+    conn.executemany("INSERT INTO blood_types (type, min_stock) VALUES (?, 0)",
+                     [(blood_type,) for blood_type in BLOOD_TYPES])
+    now = datetime.now().isoformat()
+    for blood_type in BLOOD_TYPES:
+        stock_id = conn.execute(
+            "INSERT INTO stock (blood_type, quantity, entry_date, expiration_date) VALUES (?, ?, ?, ?)",
+            (blood_type, initial_stock, now, now)).lastrowid
+        register_units(conn, shipment_units(stock_id, blood_type, initial_stock, now))
+
+    rng = random.Random(42)
+    conn.executemany(
+        "INSERT INTO requests (blood_type, quantity, requesting_doctor, request_date, status) VALUES (?, ?, 1, ?, 'pending')",
+        [(rng.choice(BLOOD_TYPES), rng.randint(1, 5), now) for _ in range(requests)])
+    conn.commit()
+    conn.close()
+
+
+def approve_without_lock(conn, request_id, staff_id):
+    """Aprovação antiga: confere o saldo e só depois grava, sem reservar a escrita"""
+    request_data = conn.execute(
+        "SELECT blood_type, quantity FROM requests WHERE id = ? AND status = 'pending'", (request_id,)).fetchone()
+    if not request_data:
+        raise OperationError("Requisição já processada ou não encontrada!")
+    blood_type, quantity = request_data
+    current_stock = available_stock(conn, blood_type)
+    if current_stock < quantity:
+        raise OperationError(f"Estoque insuficiente! Disponível: {current_stock}")
+    # Janela em que outro posto lê o mesmo saldo
+    time.sleep(0.001)
+    now = datetime.now().isoformat()
+    conn.execute("UPDATE requests SET status = 'approved', responding_staff = ?, response_date = ? WHERE id = ?",
+                 (staff_id, now, request_id))
+    conn.execute("INSERT INTO stock (blood_type, quantity, entry_date, expiration_date) VALUES (?, ?, ?, ?)",
+                 (blood_type, -quantity, now, now))
+    conn.commit()
+    return blood_type, quantity
+
+
+def run_worker(args):
+    """Um posto: tenta aprovar todas as requisições numa ordem própria"""
+    db_path, request_ids, worker, naive = args
+    approve = approve_without_lock if naive else approve_request
+    order = list(request_ids)
+    random.Random(worker).shuffle(order)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    results = []
+    try:
+        for request_id in order:
+            started = time.perf_counter()
+            try:
+                approve(conn, request_id, worker)
+                outcome = 'aprovada'
+            except OperationError as e:
+                outcome = 'estoque' if str(e).startswith("Estoque") else 'processada'
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e):
+                    raise
+                conn.rollback()
+                outcome = 'ocupado'
+            results.append((time.perf_counter() - started, outcome))
+    finally:
+        conn.close()
+    return results
+
+
+def check_database(path, initial_stock):
+    """Saldo final por tipo e se a baixa confere com as requisições aprovadas e as bolsas"""
+    conn = sqlite3.connect(path)
+    try:
+        balances = dict(conn.execute("SELECT blood_type, SUM(quantity) FROM stock GROUP BY blood_type"))
+        approved = dict(conn.execute(
+            "SELECT blood_type, SUM(quantity) FROM requests WHERE status = 'approved' GROUP BY blood_type"))
+        units = dict(conn.execute(
+            "SELECT blood_type, SUM(quantity) FROM units WHERE status = 'in_stock' GROUP BY blood_type"))
+        consistent = all(balances[blood_type] == initial_stock - approved.get(blood_type, 0)
+                         == units.get(blood_type, 0)
+                         for blood_type in BLOOD_TYPES)
+        return balances, consistent
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    """Roda a carga e imprime vazão, latência e a conferência do estoque"""
+    parser = argparse.ArgumentParser(description="Carga concorrente sobre a aprovação de requisições.")
+    parser.add_argument('--trabalhadores', type=int, default=8, help="Postos aprovando ao mesmo tempo (padrão: 8)")
+    parser.add_argument('--requisicoes', type=int, default=400, help="Requisições pendentes (padrão: 400)")
+    parser.add_argument('--estoque', type=int, default=100, help="Saldo inicial de cada tipo (padrão: 100)")
+    parser.add_argument('--processos', action='store_true', help="Usa processos em vez de threads")
+    parser.add_argument('--sem-trava', action='store_true', help="Usa a aprovação antiga, sem transação")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'carga.db')
+        build_database(path, args.requisicoes, args.estoque)
+        request_ids = range(1, args.requisicoes + 1)
+        jobs = [(path, request_ids, worker, args.sem_trava) for worker in range(1, args.trabalhadores + 1)]
+
+        if args.processos:
+            executor = ProcessPoolExecutor(max_workers=args.trabalhadores,
+                                           mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = ThreadPoolExecutor(max_workers=args.trabalhadores)
+        started = time.perf_counter()
+        try:
+            with executor:
+                results = [item for worker_results in executor.map(run_worker, jobs) for item in worker_results]
+        except sqlite3.Error as e:
+            print(f"❌ Falha de banco durante a carga: {e}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - started
+
+        balances, consistent = check_database(path, args.estoque)
+
+    latencies = sorted(latency * 1000 for latency, _ in results)
+    outcomes = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    mode = "processos" if args.processos else "threads"
+    print(f"{args.trabalhadores} {mode}, {len(results)} tentativas em {elapsed:.2f} s "
+          f"({len(results) / elapsed:.0f} tentativas/s)")
+    print(f"latência: mediana {statistics.median(latencies):.2f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms, máxima {latencies[-1]:.2f} ms")
+    print("resultado: " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+    print("saldo final: " + ", ".join(f"{blood_type} {balances[blood_type]}" for blood_type in BLOOD_TYPES))
+
+    if not outcomes.get('aprovada'):
+        print("❌ Nenhuma requisição foi aprovada")
+        return 1
+    negative = [blood_type for blood_type in BLOOD_TYPES if balances[blood_type] < 0]
+    if negative or not consistent:
+        print(f"❌ Estoque inconsistente (negativo: {', '.join(negative) or 'nenhum'})")
+        return 1
+    print("✅ Nenhum tipo ficou negativo e a baixa confere com as aprovações e as bolsas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
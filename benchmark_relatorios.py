@@ -0,0 +1,88 @@
+"""Mede a vazão (linhas/s) e o pico de memória dos relatórios de doações e requisições
+
+Gera um banco temporário com N doações e N requisições sintéticas e monta
+os dois relatórios, informando o tempo, as linhas por segundo e o pico de
+memória alocada em Python (tracemalloc), que fica limitado pelo tamanho de
+uma parte (ROWS_PER_PART linhas) qualquer que seja o número de linhas.
+
+Uso: python benchmark_relatorios.py [N ...]   (padrão: 1000 10000 50000)
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from relatorios_pdf import render_donation_report, render_request_report, report_files
+
+BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+
+def build_database(path, rows):
+    """Cria um banco com as tabelas usadas pelos relatórios e N linhas sintéticas"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT NOT NULL);
+        CREATE TABLE donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, donor_name TEXT NOT NULL, donor_cpf TEXT,
+            donor_blood_type TEXT NOT NULL, donation_date TEXT NOT NULL, quantity INTEGER NOT NULL,
+            next_donation_date TEXT);
+        CREATE TABLE requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, blood_type TEXT NOT NULL, quantity INTEGER NOT NULL,
+            requesting_doctor INTEGER NOT NULL, request_date TEXT NOT NULL, status TEXT NOT NULL,
+            response_date TEXT, responding_staff INTEGER, urgency TEXT, patient_info TEXT);
+        CREATE INDEX idx_donations_date ON donations(donation_date);
+        CREATE INDEX idx_requests_date ON requests(request_date);
+    ''')
+    conn.executemany("INSERT INTO users (id, name) VALUES (?, ?)",
+                     [(i, f"Dr. Médico {i}") for i in range(1, 21)])
+
+    rng = random.Random(42)
+    start = date.today() - timedelta(days=5 * 365)
+    donations = []
+    requests = []
+    for _ in range(rows):
+        day = start + timedelta(days=rng.randrange(5 * 365))
+        donations.append((f"Doador {rng.randrange(100000)}", f"{rng.randrange(10**11):011d}",
+                          rng.choice(BLOOD_TYPES), day.isoformat(), 450,
+                          (day + timedelta(days=90)).isoformat()))
+        requests.append((rng.choice(BLOOD_TYPES), rng.randint(1, 5), rng.randint(1, 20),
+                         f"{day.isoformat()} {rng.randrange(24):02d}:00:00",
+                         rng.choice(['pending', 'approved', 'rejected'])))
+    conn.executemany('''
+        INSERT INTO donations (donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', donations)
+    conn.executemany('''
+        INSERT INTO requests (blood_type, quantity, requesting_doctor, request_date, status)
+        VALUES (?, ?, ?, ?, ?)
+    ''', requests)
+    conn.commit()
+    conn.close()
+
+
+def measure(label, rows, render, *args, **kwargs):
+    """Executa um relatório e imprime tempo, vazão e pico de memória"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    path = render(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<12} {rows:>8} linhas  {elapsed:7.2f} s  {rows / elapsed:9.0f} linhas/s  "
+          f"pico {peak / 1024 / 1024:7.1f} MB  {len(report_files(path))} parte(s)")
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            db_path = os.path.join(tmp, f"bench_{rows}.db")
+            build_database(db_path, rows)
+            measure("Doações", rows, render_donation_report,
+                    db_path, os.path.join(tmp, f"doacoes_{rows}.pdf"), "benchmark")
+            measure("Requisições", rows, render_request_report,
+                    db_path, os.path.join(tmp, f"requisicoes_{rows}.pdf"), "benchmark")
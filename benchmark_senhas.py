@@ -0,0 +1,53 @@
+"""Mede o tempo de verificação de senha (bcrypt) para cada custo
+
+Para cada custo gera um hash e o confere várias vezes, informando o tempo
+médio e o pior caso. Serve para escolher a configuração bcrypt_rounds: o
+custo mais alto cuja verificação ainda cabe no tempo aceitável de login nas
+máquinas do hemocentro.
+
+Uso: python benchmark_senhas.py [CUSTO ...] [--repeticoes N]   (padrão: 10 a 14, 5 repetições)
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from senhas import hash_password, verify_password, DEFAULT_BCRYPT_ROUNDS, MIN_BCRYPT_ROUNDS, MAX_BCRYPT_ROUNDS
+
+PASSWORD = 'senha-de-teste-123'
+
+
+def measure(rounds, repetitions):
+    """Tempos (ms) de cada verificação de um hash com o custo indicado"""
+    hashed = hash_password(PASSWORD, rounds)
+    timings = []
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        verify_password(hashed, PASSWORD)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main(argv=None):
+    """Mede os custos pedidos e imprime uma linha por custo"""
+    parser = argparse.ArgumentParser(description="Tempo de verificação de senha por custo do bcrypt.")
+    parser.add_argument('custos', nargs='*', type=int, metavar='custo',
+                        help=f"Custos a medir ({MIN_BCRYPT_ROUNDS} a {MAX_BCRYPT_ROUNDS}; padrão: 10 a 14)")
+    parser.add_argument('--repeticoes', type=int, default=5, help="Verificações por custo (padrão: 5)")
+    args = parser.parse_args(argv)
+
+    costs = args.custos or list(range(MIN_BCRYPT_ROUNDS, 15))
+    invalid = [cost for cost in costs if not MIN_BCRYPT_ROUNDS <= cost <= MAX_BCRYPT_ROUNDS]
+    if invalid:
+        parser.error(f"Custo fora da faixa {MIN_BCRYPT_ROUNDS}-{MAX_BCRYPT_ROUNDS}: {', '.join(map(str, invalid))}")
+
+    print(f"{'custo':>5}  {'média':>10}  {'máximo':>10}")
+    for rounds in costs:
+        timings = measure(rounds, args.repeticoes)
+        marker = '  (padrão)' if rounds == DEFAULT_BCRYPT_ROUNDS else ''
+        print(f"{rounds:>5}  {statistics.mean(timings):>7.1f} ms  {max(timings):>7.1f} ms{marker}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+"""Cache endereçado por conteúdo dos relatórios PDF
+
+A impressão digital de um relatório combina o tipo, os filtros, quem emite,
+a versão do modelo do PDF, o dia e a marca d'água dos dados: contadores em
+table_versions (alteracoes.py) incrementados por gatilhos a cada alteração
+nas tabelas que o relatório lê. Se a impressão digital já está em
+report_cache e o arquivo existe, o PDF é reaproveitado sem consultar nem
+renderizar nada. O índice é limitado pelo tamanho total dos arquivos,
+removendo os menos usados.
+
+relatorios_pdf (que depende do fpdf) só é importado pelas funções que o
+usam: o esquema do banco cria o índice sem precisar da biblioteca de PDF.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from configuracoes import get_setting
+from alteracoes import create_version_table, data_watermark
+
+SETTING_CACHE_MAX_MB = 'report_cache_max_mb'
+DEFAULT_CACHE_MAX_MB = 200
+
+
+def create_report_cache_tables(conn):
+    """Cria o índice do cache e os contadores de versão que entram na impressão digital"""
+    create_version_table(conn)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS report_cache (
+            fingerprint TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created TEXT NOT NULL,
+            last_used TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_report_cache_last_used ON report_cache(last_used)")
+
+
+def report_fingerprint(conn, kind, params, today=None):
+    """Hash SHA-256 de tudo que determina o conteúdo do relatório"""
+    from relatorios_pdf import TEMPLATE_VERSION
+    payload = json.dumps({
+        'kind': kind,
+        'params': params,
+        'template': TEMPLATE_VERSION,
+        'day': (today or datetime.now().date()).isoformat(),
+        'data': data_watermark(conn, kind),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup_report(conn, fingerprint):
+    """Caminho do PDF já gerado para a impressão digital, ou None
+
+    Entradas cujo arquivo sumiu do disco são descartadas. O commit fica a
+    cargo de quem chama.
+    """
+    row = conn.execute("SELECT path FROM report_cache WHERE fingerprint = ?", (fingerprint,)).fetchone()
+    if not row:
+        return None
+    if not os.path.exists(row[0]):
+        conn.execute("DELETE FROM report_cache WHERE fingerprint = ?", (fingerprint,))
+        return None
+    conn.execute('''
+        UPDATE report_cache SET last_used = ?, hits = hits + 1 WHERE fingerprint = ?
+    ''', (datetime.now().isoformat(), fingerprint))
+    return row[0]
+
+
+def store_report(conn, fingerprint, kind, path):
+    """Registra um PDF recém-gerado (todas as partes) e aplica o limite de tamanho do cache"""
+    from relatorios_pdf import report_files
+    now = datetime.now().isoformat()
+    size = sum(os.path.getsize(part) for part in report_files(path))
+    conn.execute('''
+        INSERT OR REPLACE INTO report_cache (fingerprint, kind, path, size, created, last_used, hits)
+        VALUES (?, ?, ?, ?, ?, ?, 0)
+    ''', (fingerprint, kind, path, size, now, now))
+    return evict_reports(conn, keep=fingerprint)
+
+
+def evict_reports(conn, max_bytes=None, keep=None):
+    """Apaga os PDFs menos usados até o cache caber no limite; devolve quantos saíram"""
+    from relatorios_pdf import report_files
+    if max_bytes is None:
+        max_bytes = int(float(get_setting(conn, SETTING_CACHE_MAX_MB, DEFAULT_CACHE_MAX_MB)) * 1024 * 1024)
+
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM report_cache").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    removed = []
+    for fingerprint, path, size in conn.execute(
+            "SELECT fingerprint, path, size FROM report_cache ORDER BY last_used").fetchall():
+        if total <= max_bytes:
+            break
+        if fingerprint == keep:
+            continue
+        for part in report_files(path):
+            if os.path.exists(part):
+                os.remove(part)
+        removed.append((fingerprint,))
+        total -= size
+
+    conn.executemany("DELETE FROM report_cache WHERE fingerprint = ?", removed)
+    return len(removed)
@@ -0,0 +1,34 @@
+"""Configurações persistentes do sistema, guardadas na tabela settings"""
+
+
+def create_settings_table(conn):
+    """Cria a tabela de configurações chave/valor"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )''')
+
+
+def get_setting(conn, key, default=None):
+    """Lê uma configuração (texto) ou devolve o valor padrão"""
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def get_bool_setting(conn, key, default=False):
+    """Lê uma configuração booleana gravada como '1'/'0'"""
+    value = get_setting(conn, key)
+    if value is None:
+        return default
+    return value == '1'
+
+
+def set_setting(conn, key, value):
+    """Grava uma configuração (o commit fica a cargo de quem chama)"""
+    if isinstance(value, bool):
+        value = '1' if value else '0'
+    conn.execute('''
+        INSERT INTO settings (key, value) VALUES (?, ?)
+        ON CONFLICT(key) DO UPDATE SET value = excluded.value
+    ''', (key, None if value is None else str(value)))
@@ -0,0 +1,146 @@
+"""Cópia somente leitura do banco para as análises
+
+A aba de análises consulta uma cópia do banco em memória em vez da conexão
+usada no atendimento, então consultas pesadas nunca seguram bloqueios no
+arquivo enquanto os técnicos gravam doações e aprovações. A cópia é feita com
+a API de backup do SQLite num passo só, dentro de uma única transação de
+leitura: em modo WAL ela não bloqueia os gravadores (uma cópia em vários
+passos recomeçaria do zero a cada gravação de outra conexão). Ela só é
+refeita quando `PRAGMA data_version` indica que outra conexão gravou algo
+desde a cópia anterior.
+
+A cópia roda numa thread própria, sobre uma conexão nova: a interface pede a
+atualização com `start_refresh()`, continua consultando a cópia antiga e troca
+de conexão em `poll()` quando a nova termina, sem travar a janela enquanto o
+banco inteiro é copiado.
+
+O banco opera em modo WAL: os relatórios PDF, que leem o arquivo em processos
+separados, também não bloqueiam nem são bloqueados pelas gravações.
+"""
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+SETTING_REFRESH_SECONDS = 'snapshot_refresh_seconds'
+DEFAULT_REFRESH_SECONDS = 60
+
+
+def enable_wal(conn):
+    """Coloca o banco em modo WAL; devolve True se o modo foi aplicado"""
+    try:
+        mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    except sqlite3.OperationalError:
+        # Outra conexão está usando o banco: fica no modo atual até a próxima abertura
+        return False
+    return mode.lower() == 'wal'
+
+
+class ReadOnlySnapshot:
+    """Cópia em memória do banco, atualizada só quando o original muda"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(':memory:')
+        self.taken_at = None  # Quando a cópia atual foi feita
+        self.checked_at = None  # Última vez em que a cópia foi conferida com o banco
+        self.copies = 0
+        self._source = None
+        self._data_version = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def _source_conn(self):
+        """Conexão somente leitura com o banco original (mantida aberta, usada só pela thread da cópia)"""
+        if self._source is None:
+            self._source = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True,
+                                           check_same_thread=False)
+        return self._source
+
+    def _copy(self, force, known_version, has_copy):
+        """Roda na thread da cópia: devolve (versão, momento, conexão nova ou None)"""
+        source = self._source_conn()
+        # data_version muda quando outra conexão grava; é lido antes da cópia,
+        # então uma gravação durante a cópia provoca nova cópia na próxima vez
+        version = source.execute("PRAGMA data_version").fetchone()[0]
+        now = datetime.now()
+
+        if not force and has_copy and version == known_version:
+            return version, now, None
+
+        copy = sqlite3.connect(':memory:', check_same_thread=False)
+        try:
+            # Num passo só (pages=-1): uma única transação de leitura, sem recomeços
+            source.backup(copy, pages=-1)
+            copy.execute("PRAGMA query_only = ON")
+        except sqlite3.Error:
+            copy.close()
+            raise
+        return version, now, copy
+
+    @property
+    def refreshing(self):
+        """Indica se há uma cópia em andamento"""
+        return self._pending is not None
+
+    def start_refresh(self, force=False):
+        """Começa a conferir/recopiar o banco em segundo plano; False se já há uma cópia em andamento"""
+        if self._pending is not None:
+            return False
+        self._pending = self._executor.submit(
+            self._copy, force, self._data_version, self.taken_at is not None)
+        return True
+
+    def poll(self):
+        """Aplica a cópia terminada, se houver; devolve True se a conexão foi trocada
+
+        Erros da cópia são repassados aqui (sqlite3.Error); a cópia anterior
+        continua valendo.
+        """
+        if self._pending is None or not self._pending.done():
+            return False
+        future, self._pending = self._pending, None
+        version, now, copy = future.result()
+
+        self.checked_at = now
+        if copy is None:
+            return False
+
+        old, self.conn = self.conn, copy
+        old.close()
+        self._data_version = version
+        self.taken_at = now
+        self.copies += 1
+        return True
+
+    def refresh(self, force=False):
+        """Recopia o banco se ele mudou, esperando a cópia terminar; devolve True se copiou"""
+        self.start_refresh(force)
+        self._pending.result()
+        return self.poll()
+
+    def age_seconds(self):
+        """Segundos desde que a cópia foi conferida com o banco (None se nunca)"""
+        if self.checked_at is None:
+            return None
+        return (datetime.now() - self.checked_at).total_seconds()
+
+    def describe(self):
+        """Texto curto com a hora da cópia, para exibir na interface"""
+        if self.taken_at is None:
+            return "Dados das análises: ainda não copiados"
+        age = int(self.age_seconds())
+        checked = f"há {age} s" if age < 60 else f"há {age // 60} min"
+        return f"Dados das análises: cópia de {self.taken_at.strftime('%H:%M:%S')} (conferida {checked})"
+
+    def close(self):
+        """Espera a cópia em andamento e fecha a cópia e a conexão com o original"""
+        self._executor.shutdown(wait=True)
+        if self._pending is not None and self._pending.done() and self._pending.exception() is None:
+            copy = self._pending.result()[2]
+            if copy is not None:
+                copy.close()
+        self._pending = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+        self.conn.close()
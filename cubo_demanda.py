@@ -0,0 +1,226 @@
+"""Cubo de demanda pré-agregado para análises com drill-down
+
+Três níveis, todos mantidos por gatilhos na tabela requests:
+
+    demand_cube        tipo x dia x urgência x médico (com dia da semana,
+                       semana e mês gravados para filtrar sem funções)
+    demand_cube_week   tipo x semana x urgência x médico
+    demand_cube_month  tipo x mês x urgência x médico
+
+As semanas são identificadas pela data da segunda-feira em que começam, então
+uma semana que atravessa a virada do ano continua sendo uma só.
+
+`slice_cube` agrega qualquer dimensão a partir do nível mais grosso que
+atende aos filtros, então o custo depende do tamanho do cubo e não do
+número de requisições.
+"""
+
+MEASURES = {
+    'request_count': 'Requisições',
+    'requested_qty': 'Qtd. Solicitada',
+    'approved_qty': 'Qtd. Aprovada',
+    'rejected_qty': 'Qtd. Rejeitada',
+}
+
+DIMENSIONS = {
+    'blood_type': 'Tipo Sanguíneo',
+    'urgency': 'Urgência',
+    'doctor': 'Médico',
+    'weekday': 'Dia da Semana',
+    'month': 'Mês',
+    'week': 'Semana',
+    'day': 'Dia',
+}
+
+# Ordem seguida pelo drill-down ao dar duplo clique numa linha
+DRILL_ORDER = ['blood_type', 'urgency', 'doctor', 'month', 'week', 'day']
+
+WEEKDAY_NAMES = ['Domingo', 'Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado']
+
+_DAY = "substr({row}.request_date, 1, 10)"
+_WEEK = "date({row}.request_date, '-6 days', 'weekday 1')"  # Segunda-feira da semana
+_MONTH = "substr({row}.request_date, 1, 7)"
+_URGENCY = "COALESCE({row}.urgency, 'Normal')"
+
+# (tabela, colunas de período, expressões dos períodos)
+LEVELS = (
+    ('demand_cube', ('day', 'weekday', 'week', 'month'),
+     (_DAY, "CAST(strftime('%w', {row}.request_date) AS INTEGER)", _WEEK, _MONTH)),
+    ('demand_cube_week', ('week',), (_WEEK,)),
+    ('demand_cube_month', ('month',), (_MONTH,)),
+)
+
+_MEASURE_UPDATE = '''
+        request_count = request_count {op} 1,
+        requested_qty = requested_qty {op} {row}.quantity,
+        approved_qty = approved_qty {op} CASE WHEN {row}.status = 'approved' THEN {row}.quantity ELSE 0 END,
+        rejected_qty = rejected_qty {op} CASE WHEN {row}.status = 'rejected' THEN {row}.quantity ELSE 0 END'''
+
+
+def _apply_row(row, op):
+    """Instruções SQL que somam (ou subtraem) uma requisição em todos os níveis"""
+    statements = []
+    for table, columns, expressions in LEVELS:
+        values = [expr.format(row=row) for expr in expressions]
+        key_columns = ['blood_type', columns[0], 'urgency', 'doctor_id']
+        key_values = [f"{row}.blood_type", values[0], _URGENCY.format(row=row), f"{row}.requesting_doctor"]
+        statements.append(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(key_columns + list(columns[1:]))}) "
+            f"VALUES ({', '.join(key_values + values[1:])});"
+        )
+        where = ' AND '.join(f"{col} = {val}" for col, val in zip(key_columns, key_values))
+        statements.append(
+            f"UPDATE {table} SET {_MEASURE_UPDATE.format(row=row, op=op)} WHERE {where};"
+        )
+    return '\n            '.join(statements)
+
+
+def create_cube_tables(conn):
+    """Cria as tabelas do cubo e seus gatilhos, preenchendo-as na primeira vez
+
+    Bancos com os gatilhos da chave de semana antiga ("AAAA-Wnn", que partia
+    em duas a semana da virada do ano) têm os gatilhos refeitos e o cubo
+    recalculado.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'demand_cube'"
+    ).fetchone()
+    stale = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_demand_cube_insert' AND instr(sql, ?) = 0",
+        (_WEEK.format(row='NEW'),)
+    ).fetchone()
+    if stale:
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_demand_cube_{event}")
+
+    measures = '''
+            request_count INTEGER NOT NULL DEFAULT 0,
+            requested_qty INTEGER NOT NULL DEFAULT 0,
+            approved_qty INTEGER NOT NULL DEFAULT 0,
+            rejected_qty INTEGER NOT NULL DEFAULT 0'''
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS demand_cube (
+            blood_type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            urgency TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            week TEXT NOT NULL,
+            month TEXT NOT NULL,{measures},
+            PRIMARY KEY (blood_type, day, urgency, doctor_id)
+        )''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS demand_cube_week (
+            blood_type TEXT NOT NULL,
+            week TEXT NOT NULL,
+            urgency TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,{measures},
+            PRIMARY KEY (blood_type, week, urgency, doctor_id)
+        )''')
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS demand_cube_month (
+            blood_type TEXT NOT NULL,
+            month TEXT NOT NULL,
+            urgency TEXT NOT NULL,
+            doctor_id INTEGER NOT NULL,{measures},
+            PRIMARY KEY (blood_type, month, urgency, doctor_id)
+        )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_demand_cube_day ON demand_cube(day)")
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_demand_cube_insert AFTER INSERT ON requests
+        BEGIN
+            {_apply_row('NEW', '+')}
+        END''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_demand_cube_update
+        AFTER UPDATE OF blood_type, quantity, requesting_doctor, request_date, status, urgency ON requests
+        BEGIN
+            {_apply_row('OLD', '-')}
+            {_apply_row('NEW', '+')}
+        END''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_demand_cube_delete AFTER DELETE ON requests
+        BEGIN
+            {_apply_row('OLD', '-')}
+        END''')
+
+    if not exists or stale:
+        backfill_cube(conn)
+
+
+def backfill_cube(conn):
+    """Recalcula todos os níveis do cubo a partir de requests (carga única)"""
+    sums = '''COUNT(*), SUM(quantity),
+               SUM(CASE WHEN status = 'approved' THEN quantity ELSE 0 END),
+               SUM(CASE WHEN status = 'rejected' THEN quantity ELSE 0 END)'''
+    for table, columns, expressions in LEVELS:
+        values = [expr.format(row='requests') for expr in expressions]
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f'''
+            INSERT INTO {table} (blood_type, {', '.join(columns)}, urgency, doctor_id,
+                                 request_count, requested_qty, approved_qty, rejected_qty)
+            SELECT blood_type, {', '.join(values)}, {_URGENCY.format(row='requests')}, requesting_doctor,
+                   {sums}
+            FROM requests
+            GROUP BY blood_type, {values[0]}, {_URGENCY.format(row='requests')}, requesting_doctor
+        ''')
+
+
+def _pick_table(dimension, filters):
+    """Escolhe o nível mais agregado que contém a dimensão e os filtros"""
+    needed = {dimension} | set(filters)
+    for table, columns in (('demand_cube_month', {'month'}), ('demand_cube_week', {'week'})):
+        if needed <= columns | {'blood_type', 'urgency', 'doctor'}:
+            return table
+    return 'demand_cube'
+
+
+def slice_cube(conn, dimension, measure='approved_qty', filters=None):
+    """Agrega a medida pela dimensão pedida, aplicando filtros {dimensão: valor}
+
+    Retorna uma lista de (valor_da_dimensão, rótulo, total) em ordem natural
+    da dimensão. Filtros de médico usam o id do usuário.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Dimensão inválida: {dimension}")
+    if measure not in MEASURES:
+        raise ValueError(f"Medida inválida: {measure}")
+    filters = dict(filters or {})
+
+    table = _pick_table(dimension, filters)
+    column = 'doctor_id' if dimension == 'doctor' else dimension
+
+    conditions = []
+    params = []
+    for key, value in filters.items():
+        if key not in DIMENSIONS:
+            raise ValueError(f"Filtro inválido: {key}")
+        conditions.append(f"c.{'doctor_id' if key == 'doctor' else key} = ?")
+        params.append(value)
+
+    query = f'''
+        SELECT c.{column}, SUM(c.{measure})
+        FROM {table} c
+    '''
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" GROUP BY c.{column} ORDER BY c.{column}"
+
+    rows = conn.execute(query, params).fetchall()
+
+    if dimension == 'doctor':
+        names = dict(conn.execute("SELECT id, name FROM users").fetchall())
+        return [(value, names.get(value, f"#{value}"), total) for value, total in rows]
+    if dimension == 'weekday':
+        return [(value, WEEKDAY_NAMES[value], total) for value, total in rows]
+    return [(value, str(value), total) for value, total in rows]
+
+
+def next_dimension(dimension, filters):
+    """Próxima dimensão do drill-down que ainda não está filtrada"""
+    order = DRILL_ORDER[DRILL_ORDER.index(dimension) + 1:] if dimension in DRILL_ORDER else DRILL_ORDER
+    for candidate in order:
+        if candidate not in filters:
+            return candidate
+    return None
@@ -0,0 +1,132 @@
+"""Conjuntos de dados dos relatórios e das análises, lidos de uma só vez
+
+Cada função abre uma transação de leitura (`read_snapshot`), faz todas as
+consultas de que o relatório precisa e devolve um dicionário já calculado.
+Dentro da transação o SQLite mostra um único estado do banco, então as
+seções de um mesmo relatório sempre batem entre si mesmo com gravações
+acontecendo em paralelo. Os relatórios PDF e a aba de análises consomem os
+mesmos dicionários, inclusive a previsão de demanda (`forecast_demand`).
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from estoque_seguranca import stock_levels, dynamic_thresholds_enabled
+from demanda_diaria import daily_usage, usage_stats, average_daily_usage, since_day
+
+MIN_HISTORY_DAYS = 30  # Dias com consumo necessários para treinar a previsão
+DEMAND_WINDOW_DAYS = 30
+
+
+@contextmanager
+def read_snapshot(conn):
+    """Mantém uma transação de leitura aberta durante o bloco"""
+    if conn.in_transaction:
+        # Já existe uma transação (da própria conexão): ela garante a consistência
+        yield conn
+        return
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    finally:
+        conn.execute("COMMIT")
+
+
+def forecast_demand(dates, usages, days_to_predict):
+    """Prevê o consumo dos próximos dias com uma floresta aleatória
+
+    Retorna (datas_futuras, previsões) ou None se o histórico for curto.
+    """
+    if len(dates) < MIN_HISTORY_DAYS:
+        return None
+
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+
+    # Features: dias desde a primeira data
+    day_numbers = np.array([(d - dates[0]).days for d in dates]).reshape(-1, 1)
+    model = RandomForestRegressor(n_estimators=100, random_state=42)
+    model.fit(day_numbers, usages)
+
+    last_day = day_numbers[-1][0]
+    future_days = np.array([last_day + i for i in range(1, days_to_predict + 1)]).reshape(-1, 1)
+    predictions = [float(value) for value in model.predict(future_days)]
+    future_dates = [dates[-1] + timedelta(days=i) for i in range(1, days_to_predict + 1)]
+    return future_dates, predictions
+
+
+def stock_dataset(conn):
+    """Níveis por tipo e itens que vencem em 7 dias (relatório de estoque)"""
+    with read_snapshot(conn):
+        use_dynamic = dynamic_thresholds_enabled(conn)
+        levels = stock_levels(conn, use_dynamic)
+        expiring = conn.execute('''
+            SELECT blood_type, quantity, expiration_date
+            FROM stock
+            WHERE date(expiration_date) BETWEEN date('now') AND date('now', '+7 days')
+            ORDER BY expiration_date
+        ''').fetchall()
+    return {'use_dynamic': use_dynamic, 'levels': levels, 'expiring': expiring}
+
+
+def stock_demand_dataset(conn):
+    """Estoque, mínimo e demanda média de cada tipo (gráfico estoque vs demanda)"""
+    with read_snapshot(conn):
+        levels = stock_levels(conn, use_dynamic=False)
+        demand = average_daily_usage(conn, since_day(DEMAND_WINDOW_DAYS))
+    return {
+        'types': [row[0] for row in levels],
+        'stock': [row[1] for row in levels],
+        'min_stock': [row[3] for row in levels],
+        'demand': [demand.get(row[0], 0) for row in levels],
+    }
+
+
+def analytics_dataset(conn, blood_type, days_to_predict):
+    """Tudo o que a análise preditiva de um tipo usa, com a previsão já feita"""
+    with read_snapshot(conn):
+        current_stock = conn.execute('''
+            SELECT SUM(quantity) FROM stock WHERE blood_type = ?
+        ''', (blood_type,)).fetchone()[0] or 0
+        min_stock = conn.execute('''
+            SELECT min_stock FROM blood_types WHERE type = ?
+        ''', (blood_type,)).fetchone()[0]
+        recent_usage = usage_stats(conn, blood_type, since_day(DEMAND_WINDOW_DAYS))
+        history = daily_usage(conn, blood_type)
+        eligible_donors = conn.execute('''
+            SELECT COUNT(*)
+            FROM donations
+            WHERE donor_blood_type = ? AND date(next_donation_date) <= date('now')
+        ''', (blood_type,)).fetchone()[0]
+
+    dates = [datetime.strptime(row[0], '%Y-%m-%d') for row in history]
+    usages = [row[1] for row in history]
+
+    dataset = {
+        'blood_type': blood_type,
+        'current_stock': current_stock,
+        'min_stock': min_stock,
+        'recent_usage': recent_usage,  # (média, máximo, mínimo) nos últimos 30 dias
+        'dates': dates,
+        'usages': usages,
+        'eligible_donors': eligible_donors,
+        'days_to_predict': days_to_predict,
+        'future_dates': None,
+        'predictions': None,
+    }
+
+    forecast = forecast_demand(dates, usages, days_to_predict)
+    if forecast:
+        future_dates, predictions = forecast
+        total = sum(predictions)
+        peak = max(range(len(predictions)), key=predictions.__getitem__)
+        dataset.update({
+            'future_dates': future_dates,
+            'predictions': predictions,
+            'total_predicted': total,
+            'avg_predicted': total / days_to_predict,
+            'peak_date': future_dates[peak],
+            'peak_demand': predictions[peak],
+            'required_stock': total + min_stock,
+            'deficit': total + min_stock - current_stock,
+        })
+    return dataset
@@ -0,0 +1,127 @@
+"""Série diária de demanda por tipo sanguíneo, mantida incrementalmente
+
+A tabela daily_demand guarda, por tipo e por dia da requisição, as
+quantidades solicitadas, aprovadas, rejeitadas e de emergência. Gatilhos
+na tabela requests mantêm os totais a cada inserção, aprovação, rejeição
+ou exclusão, de modo que as análises leem uma linha por dia em vez de
+agrupar toda a tabela de requisições.
+"""
+import sqlite3
+from datetime import datetime, timedelta
+
+DB_NAME = 'blood_bank.db'
+
+# Contribuição de uma linha de requests (ROW = NEW ou OLD) para daily_demand
+_APPLY_ROW = '''
+    INSERT OR IGNORE INTO daily_demand (blood_type, day) VALUES ({row}.blood_type, substr({row}.request_date, 1, 10));
+    UPDATE daily_demand SET
+        requested_qty = requested_qty {op} {row}.quantity,
+        approved_qty = approved_qty {op} CASE WHEN {row}.status = 'approved' THEN {row}.quantity ELSE 0 END,
+        rejected_qty = rejected_qty {op} CASE WHEN {row}.status = 'rejected' THEN {row}.quantity ELSE 0 END,
+        emergency_qty = emergency_qty {op} CASE WHEN {row}.urgency = 'Emergência' THEN {row}.quantity ELSE 0 END
+    WHERE blood_type = {row}.blood_type AND day = substr({row}.request_date, 1, 10);
+'''
+
+
+def create_daily_demand_table(conn):
+    """Cria a tabela daily_demand e seus gatilhos, preenchendo-a na primeira vez"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_demand'"
+    ).fetchone()
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_demand (
+            blood_type TEXT NOT NULL,
+            day TEXT NOT NULL,
+            approved_qty INTEGER NOT NULL DEFAULT 0,
+            requested_qty INTEGER NOT NULL DEFAULT 0,
+            rejected_qty INTEGER NOT NULL DEFAULT 0,
+            emergency_qty INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (blood_type, day)
+        )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_demand_day ON daily_demand(day)")
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_demand_insert AFTER INSERT ON requests
+        BEGIN
+            {_APPLY_ROW.format(row='NEW', op='+')}
+        END''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_demand_update
+        AFTER UPDATE OF blood_type, quantity, request_date, status, urgency ON requests
+        BEGIN
+            {_APPLY_ROW.format(row='OLD', op='-')}
+            {_APPLY_ROW.format(row='NEW', op='+')}
+        END''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_demand_delete AFTER DELETE ON requests
+        BEGIN
+            {_APPLY_ROW.format(row='OLD', op='-')}
+        END''')
+
+    if not exists:
+        backfill_daily_demand(conn)
+
+
+def backfill_daily_demand(conn):
+    """Recalcula toda a tabela daily_demand a partir de requests (carga única)"""
+    conn.execute("DELETE FROM daily_demand")
+    conn.execute('''
+        INSERT INTO daily_demand (blood_type, day, approved_qty, requested_qty, rejected_qty, emergency_qty)
+        SELECT blood_type, substr(request_date, 1, 10),
+               SUM(CASE WHEN status = 'approved' THEN quantity ELSE 0 END),
+               SUM(quantity),
+               SUM(CASE WHEN status = 'rejected' THEN quantity ELSE 0 END),
+               SUM(CASE WHEN urgency = 'Emergência' THEN quantity ELSE 0 END)
+        FROM requests
+        GROUP BY blood_type, substr(request_date, 1, 10)
+    ''')
+
+
+def since_day(days, today=None):
+    """Data ISO de `days` dias atrás"""
+    return ((today or datetime.now().date()) - timedelta(days=days)).isoformat()
+
+
+def daily_usage(conn, blood_type, since=None):
+    """Dias com consumo aprovado e a quantidade aprovada, em ordem cronológica"""
+    query = '''
+        SELECT day, approved_qty FROM daily_demand
+        WHERE blood_type = ? AND approved_qty > 0
+    '''
+    params = [blood_type]
+    if since:
+        query += " AND day >= ?"
+        params.append(since)
+    query += " ORDER BY day"
+    return conn.execute(query, params).fetchall()
+
+
+def average_daily_usage(conn, since):
+    """Consumo médio por dia com aprovações, por tipo, desde a data informada"""
+    cursor = conn.execute('''
+        SELECT blood_type, AVG(approved_qty)
+        FROM daily_demand
+        WHERE approved_qty > 0 AND day >= ?
+        GROUP BY blood_type
+    ''', (since,))
+    return {row[0]: row[1] for row in cursor.fetchall() if row[1] is not None}
+
+
+def usage_stats(conn, blood_type, since):
+    """Média, máximo e mínimo do consumo diário aprovado de um tipo"""
+    return conn.execute('''
+        SELECT AVG(approved_qty), MAX(approved_qty), MIN(approved_qty)
+        FROM daily_demand
+        WHERE blood_type = ? AND approved_qty > 0 AND day >= ?
+    ''', (blood_type, since)).fetchone()
+
+
+if __name__ == "__main__":
+    conn = sqlite3.connect(DB_NAME)
+    with conn:
+        create_daily_demand_table(conn)
+        backfill_daily_demand(conn)
+    total = conn.execute("SELECT COUNT(*) FROM daily_demand").fetchone()[0]
+    conn.close()
+    print(f"✅ daily_demand recalculada: {total} linhas (tipo x dia)")
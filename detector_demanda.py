@@ -0,0 +1,130 @@
+"""Detector contínuo de picos de demanda (EWMA + CUSUM por tipo e por hora)
+
+Cada evento (requisição enviada ou aprovada) custa O(1): soma a quantidade
+ao balde da hora corrente e compara com a média/variância exponencial das
+horas anteriores. O estado fica em memória e é gravado em lote na tabela
+demand_monitor por `flush()`, fora do caminho da aprovação.
+"""
+import math
+import time
+
+STREAMS = ('requested', 'approved')
+
+DEFAULT_ALPHA = 0.05       # Peso da hora mais recente na média exponencial
+DEFAULT_K = 0.5            # Folga do CUSUM (em desvios padrão)
+DEFAULT_H = 4.0            # Limiar do CUSUM para disparar alerta
+DEFAULT_SPIKE_Z = 4.0      # Pico isolado numa única hora
+DEFAULT_MIN_STD = 1.0      # Evita alertas por uma única bolsa em tipos de pouca saída
+DEFAULT_WARMUP_HOURS = 24  # Horas observadas antes de começar a alertar
+MAX_IDLE_HOURS = 24 * 7    # Horas vazias aplicadas de uma vez ao retomar
+
+
+def create_monitor_table(conn):
+    """Cria a tabela onde o estado do detector é persistido"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS demand_monitor (
+            blood_type TEXT NOT NULL,
+            stream TEXT NOT NULL CHECK(stream IN ('requested', 'approved')),
+            hour INTEGER NOT NULL,
+            hour_qty REAL NOT NULL,
+            mean REAL NOT NULL,
+            var REAL NOT NULL,
+            cusum REAL NOT NULL,
+            hours_seen INTEGER NOT NULL,
+            last_alert_hour INTEGER,
+            PRIMARY KEY (blood_type, stream)
+        )''')
+
+
+class DemandSurgeDetector:
+    """Mantém estatísticas horárias por tipo sanguíneo e sinaliza picos"""
+
+    def __init__(self, conn, on_alert=None, alpha=DEFAULT_ALPHA, k=DEFAULT_K, h=DEFAULT_H,
+                 spike_z=DEFAULT_SPIKE_Z, min_std=DEFAULT_MIN_STD, warmup_hours=DEFAULT_WARMUP_HOURS):
+        self.conn = conn
+        self.on_alert = on_alert
+        self.alpha = alpha
+        self.k = k
+        self.h = h
+        self.spike_z = spike_z
+        self.min_std = min_std
+        self.warmup_hours = warmup_hours
+        self.state = {}
+        self.dirty = set()
+        self.load()
+
+    def load(self):
+        """Carrega o estado persistido de todos os tipos"""
+        cursor = self.conn.execute('''
+            SELECT blood_type, stream, hour, hour_qty, mean, var, cusum, hours_seen, last_alert_hour
+            FROM demand_monitor
+        ''')
+        for row in cursor:
+            self.state[(row[0], row[1])] = list(row[2:])
+
+    def _close_hours(self, st, hour):
+        """Fecha o balde corrente e as horas vazias até `hour`"""
+        elapsed = min(hour - st[0], MAX_IDLE_HOURS)
+        qty = st[1]
+        for _ in range(elapsed):
+            mean, var = st[2], st[3]
+            std = max(math.sqrt(var), self.min_std)
+            st[4] = max(0.0, st[4] + (qty - mean) / std - self.k)
+            diff = qty - mean
+            st[2] = mean + self.alpha * diff
+            st[3] = (1 - self.alpha) * (var + self.alpha * diff * diff)
+            st[5] += 1
+            qty = 0.0
+        st[0] = hour
+        st[1] = 0.0
+
+    def observe(self, blood_type, quantity, stream='approved', when=None):
+        """Registra um evento de demanda e devolve o alerta gerado (ou None)"""
+        hour = int((when if when is not None else time.time()) // 3600)
+        key = (blood_type, stream)
+        st = self.state.get(key)
+        if st is None:
+            st = self.state[key] = [hour, 0.0, 0.0, 0.0, 0.0, 0, None]
+        elif hour > st[0]:
+            self._close_hours(st, hour)
+
+        st[1] += quantity
+        self.dirty.add(key)
+
+        if st[5] < self.warmup_hours or st[6] == hour:
+            return None
+
+        # Avaliação parcial da hora corrente: a soma só cresce até a hora fechar
+        std = max(math.sqrt(st[3]), self.min_std)
+        z = (st[1] - st[2]) / std
+        cusum = max(0.0, st[4] + z - self.k)
+        if cusum <= self.h and z <= self.spike_z:
+            return None
+
+        st[6] = hour
+        alert = {
+            'blood_type': blood_type,
+            'stream': stream,
+            'hour_qty': st[1],
+            'expected': st[2],
+            'z': z,
+            'cusum': cusum,
+        }
+        if self.on_alert:
+            self.on_alert(alert)
+        return alert
+
+    def flush(self):
+        """Grava em lote o estado dos tipos alterados desde o último flush"""
+        if not self.dirty:
+            return
+        keys = set(self.dirty)
+        rows = [key + tuple(self.state[key]) for key in keys]
+        with self.conn:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO demand_monitor
+                    (blood_type, stream, hour, hour_qty, mean, var, cusum, hours_seen, last_alert_hour)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+        # Só depois do commit: se a gravação falhar, os tipos continuam pendentes
+        self.dirty -= keys
@@ -0,0 +1,110 @@
+"""Esquema do banco do Hemolife Pro
+
+`create_schema` cria o que ainda não existir: as tabelas principais e as de
+cada módulo (configurações, limites de estoque, monitor de demanda, série
+diária, cubo, versões e cache de relatórios, registro de alterações e
+bolsas). A interface, as ferramentas de linha de comando e o serviço HTTP
+chamam a mesma função, então um banco novo fica completo qualquer que seja o
+primeiro programa a abri-lo.
+"""
+from configuracoes import create_settings_table
+from estoque_seguranca import add_threshold_columns
+from detector_demanda import create_monitor_table
+from demanda_diaria import create_daily_demand_table
+from cubo_demanda import create_cube_tables
+from cache_relatorios import create_report_cache_tables
+from alteracoes import create_changes_table
+from unidades import create_units_table
+
+
+def create_schema(conn):
+    """Cria as tabelas, gatilhos e índices que faltarem (sem commit)"""
+    # Tabela de usuários
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin', 'doctor', 'technician')),
+            email TEXT,
+            last_login TEXT,
+            is_active INTEGER DEFAULT 1
+        )''')
+
+    # Tabela de tipos sanguíneos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS blood_types (
+            type TEXT PRIMARY KEY,
+            min_stock INTEGER NOT NULL,
+            description TEXT
+        )''')
+
+    # Tabela de estoque
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS stock (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            blood_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            entry_date TEXT NOT NULL,
+            expiration_date TEXT NOT NULL,
+            donor_id TEXT,
+            FOREIGN KEY (blood_type) REFERENCES blood_types(type)
+        )''')
+
+    # Tabela de requisições
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            blood_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            requesting_doctor INTEGER NOT NULL,
+            request_date TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('pending', 'approved', 'rejected')),
+            response_date TEXT,
+            responding_staff INTEGER,
+            urgency TEXT CHECK(urgency IN ('Normal', 'Urgente', 'Emergência')),
+            patient_info TEXT,
+            FOREIGN KEY (blood_type) REFERENCES blood_types(type),
+            FOREIGN KEY (requesting_doctor) REFERENCES users(id),
+            FOREIGN KEY (responding_staff) REFERENCES users(id)
+        )''')
+
+    # Tabela de alertas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            message TEXT NOT NULL,
+            recipient_id INTEGER NOT NULL,
+            sent_date TEXT NOT NULL,
+            status TEXT NOT NULL CHECK(status IN ('sent', 'read')),
+            FOREIGN KEY (recipient_id) REFERENCES users(id)
+        )''')
+
+    # Tabela de doações
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            donor_name TEXT NOT NULL,
+            donor_cpf TEXT,
+            donor_blood_type TEXT NOT NULL,
+            donation_date TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            next_donation_date TEXT,
+            FOREIGN KEY (donor_blood_type) REFERENCES blood_types(type)
+        )''')
+
+    # Tabelas de cada módulo
+    create_settings_table(conn)
+    add_threshold_columns(conn)
+    create_monitor_table(conn)
+    create_daily_demand_table(conn)
+    create_cube_tables(conn)
+    create_report_cache_tables(conn)
+    create_changes_table(conn)
+    create_units_table(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_status_date ON requests(status, request_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_requests_date ON requests(request_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_donations_date ON donations(donation_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stock_type_quantity ON stock(blood_type, quantity)")
@@ -0,0 +1,196 @@
+"""Motor de estoque de segurança e ponto de reposição por tipo sanguíneo
+
+Substitui o `min_stock` fixo por limites recalculados a partir da demanda
+recente (média e variância diárias), do prazo de reposição de cada tipo e
+de um nível de serviço alvo:
+
+    estoque_seguranca = z * sqrt(L * var_demanda + media_demanda^2 * var_L)
+    ponto_reposicao   = media_demanda * L + estoque_seguranca
+
+O prazo de reposição L é medido no próprio livro do estoque: começa quando
+o saldo do tipo cai abaixo do min_stock (a reposição passa a ser necessária)
+e termina na primeira entrada positiva seguinte (doação ou remessa).
+
+A demanda vem da tabela daily_demand; o cálculo lê a janela com poucas
+consultas e grava tudo com um único `executemany`, para poder rodar em todo
+fechamento do dia.
+"""
+import math
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+from configuracoes import get_setting, get_bool_setting, set_setting
+
+SETTING_USE_DYNAMIC = 'use_dynamic_thresholds'
+SETTING_SERVICE_LEVEL = 'thresholds_service_level'
+SETTING_WINDOW_DAYS = 'thresholds_window_days'
+SETTING_CLOSE_OF_DAY_HOUR = 'close_of_day_hour'
+SETTING_LAST_RUN = 'thresholds_last_run'
+
+DEFAULT_SERVICE_LEVEL = 0.95
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_LEAD_TIME_DAYS = 3  # Usado quando o tipo não teve reposição pendente na janela
+DEFAULT_CLOSE_OF_DAY_HOUR = 20
+
+THRESHOLD_COLUMNS = (
+    ('demand_mean', 'REAL'),
+    ('demand_std', 'REAL'),
+    ('lead_time_days', 'REAL'),
+    ('safety_stock', 'INTEGER'),
+    ('reorder_point', 'INTEGER'),
+    ('thresholds_updated', 'TEXT'),
+)
+
+
+def add_threshold_columns(conn):
+    """Adiciona à tabela blood_types as colunas dos limites calculados"""
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(blood_types)")}
+    for column, column_type in THRESHOLD_COLUMNS:
+        if column not in existing:
+            conn.execute(f"ALTER TABLE blood_types ADD COLUMN {column} {column_type}")
+
+
+def dynamic_thresholds_enabled(conn):
+    """Indica se os limites calculados estão ativos no lugar do min_stock"""
+    return get_bool_setting(conn, SETTING_USE_DYNAMIC, False)
+
+
+def stock_levels(conn, use_dynamic=None):
+    """Retorna (tipo, estoque, limite, min_stock) por tipo sanguíneo
+
+    O limite é o ponto de reposição calculado quando a opção está ativa e
+    o tipo já tem cálculo; caso contrário é o `min_stock` fixo.
+    """
+    if use_dynamic is None:
+        use_dynamic = dynamic_thresholds_enabled(conn)
+    return conn.execute('''
+        SELECT b.type, COALESCE(SUM(s.quantity), 0),
+               CASE WHEN ? THEN COALESCE(b.reorder_point, b.min_stock) ELSE b.min_stock END,
+               b.min_stock
+        FROM blood_types b
+        LEFT JOIN stock s ON b.type = s.blood_type
+        GROUP BY b.type
+        ORDER BY b.type
+    ''', (1 if use_dynamic else 0,)).fetchall()
+
+
+def _daily_demand_moments(conn, since):
+    """Soma e soma dos quadrados da demanda diária aprovada por tipo"""
+    cursor = conn.execute('''
+        SELECT blood_type, SUM(approved_qty), SUM(approved_qty * approved_qty)
+        FROM daily_demand
+        WHERE day >= ?
+        GROUP BY blood_type
+    ''', (since,))
+    return {row[0]: (row[1] or 0, row[2] or 0) for row in cursor}
+
+
+def _replenishment_lead_times(conn, since):
+    """Prazos de reposição observados na janela (em dias), por tipo
+
+    Percorre as movimentações de cada tipo em ordem, acompanhando o saldo:
+    o prazo conta do momento em que o saldo fica abaixo do min_stock até a
+    primeira entrada positiva depois disso.
+    """
+    minimums = dict(conn.execute("SELECT type, min_stock FROM blood_types"))
+    balances = dict(conn.execute(
+        "SELECT blood_type, SUM(quantity) FROM stock WHERE entry_date < ? GROUP BY blood_type", (since,)))
+    # Um tipo que já começa a janela abaixo do mínimo não tem início conhecido e fica de fora
+    pending = {}
+    lead_times = {}
+    cursor = conn.execute('''
+        SELECT blood_type, quantity, entry_date FROM stock
+        WHERE entry_date >= ?
+        ORDER BY entry_date, id
+    ''', (since,))
+    for blood_type, quantity, entry_date in cursor:
+        moment = datetime.fromisoformat(entry_date[:19])
+        balance = (balances.get(blood_type) or 0) + quantity
+        balances[blood_type] = balance
+        if quantity > 0 and blood_type in pending:
+            lead_times.setdefault(blood_type, []).append(
+                (moment - pending.pop(blood_type)).total_seconds() / 86400)
+        if balance < minimums.get(blood_type, 0) and blood_type not in pending:
+            pending[blood_type] = moment
+    return lead_times
+
+
+def _lead_time(samples):
+    """Média e desvio padrão (em dias) dos prazos de reposição observados"""
+    if not samples:
+        return DEFAULT_LEAD_TIME_DAYS, 0.0
+    mean = sum(samples) / len(samples)
+    if len(samples) < 2:
+        return mean, 0.0
+    variance = sum((sample - mean) ** 2 for sample in samples) / (len(samples) - 1)
+    return mean, math.sqrt(variance)
+
+
+def compute_thresholds(conn, service_level=None, window_days=None, today=None):
+    """Calcula os limites de todos os tipos sem gravar nada
+
+    Retorna {tipo: (media, desvio, lead_time, estoque_seguranca, ponto_reposicao)}.
+    Tipos sem nenhuma demanda na janela ficam com estoque de segurança e
+    ponto de reposição None, para que continuem usando o min_stock.
+    """
+    if service_level is None:
+        service_level = float(get_setting(conn, SETTING_SERVICE_LEVEL, DEFAULT_SERVICE_LEVEL))
+    if window_days is None:
+        window_days = int(get_setting(conn, SETTING_WINDOW_DAYS, DEFAULT_WINDOW_DAYS))
+    if not 0 < service_level < 1:
+        raise ValueError("Nível de serviço deve estar entre 0 e 1")
+    if window_days < 2:
+        raise ValueError("A janela deve ter pelo menos 2 dias")
+
+    today = today or datetime.now().date()
+    since = (today - timedelta(days=window_days)).isoformat()
+    z = NormalDist().inv_cdf(service_level)
+
+    moments = _daily_demand_moments(conn, since)
+    lead_times = _replenishment_lead_times(conn, since)
+
+    results = {}
+    for blood_type, in conn.execute("SELECT type FROM blood_types ORDER BY type").fetchall():
+        total, total_sq = moments.get(blood_type, (0, 0))
+        lead_mean, lead_std = _lead_time(lead_times.get(blood_type, []))
+
+        # A janela inclui os dias sem demanda (valor zero)
+        mean = total / window_days
+        variance = max((total_sq - window_days * mean ** 2) / (window_days - 1), 0.0)
+        std = math.sqrt(variance)
+
+        if total == 0:
+            results[blood_type] = (0.0, 0.0, lead_mean, None, None)
+            continue
+
+        safety = z * math.sqrt(lead_mean * variance + (mean * lead_std) ** 2)
+        reorder = mean * lead_mean + safety
+        results[blood_type] = (mean, std, lead_mean, math.ceil(safety), math.ceil(reorder))
+
+    return results
+
+
+def recompute_thresholds(conn, service_level=None, window_days=None, today=None):
+    """Recalcula e grava os limites de todos os tipos numa única transação"""
+    results = compute_thresholds(conn, service_level, window_days, today)
+    now = datetime.now().isoformat()
+
+    with conn:
+        conn.executemany('''
+            UPDATE blood_types
+            SET demand_mean = ?, demand_std = ?, lead_time_days = ?,
+                safety_stock = ?, reorder_point = ?, thresholds_updated = ?
+            WHERE type = ?
+        ''', [(mean, std, lead, safety, reorder, now, blood_type)
+              for blood_type, (mean, std, lead, safety, reorder) in results.items()])
+        set_setting(conn, SETTING_LAST_RUN, (today or datetime.now().date()).isoformat())
+
+    return results
+
+
+def close_of_day_due(conn, now=None):
+    """Indica se o recálculo do fechamento do dia ainda não rodou hoje"""
+    now = now or datetime.now()
+    hour = int(get_setting(conn, SETTING_CLOSE_OF_DAY_HOUR, DEFAULT_CLOSE_OF_DAY_HOUR))
+    last_run = get_setting(conn, SETTING_LAST_RUN)
+    return now.hour >= hour and last_run != now.date().isoformat()
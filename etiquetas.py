@@ -0,0 +1,217 @@
+"""Folhas de etiquetas com código de barras para as bolsas de sangue
+
+Cada bolsa recebe uma etiqueta com o tipo sanguíneo, a origem, as datas e o
+código de barras Code128 no formato de gerar_codigo_barras.py ("{tipo}-{id}"
+para doações; "{tipo}-R{id do estoque}-{n}" para as bolsas de uma remessa).
+As etiquetas saem num PDF pronto para folhas A4 de 3 x 8 etiquetas.
+
+Os símbolos são guardados por código, em memória e em arquivos PNG na pasta
+codigos/ (a mesma do script antigo): reimprimir uma etiqueta não desenha o
+símbolo de novo. Os que faltam são desenhados em paralelo num pool de
+processos, então a folha de uma campanha de centenas de bolsas sai em
+poucos segundos.
+
+Uso: python etiquetas.py (--doacoes ID [ID ...] | --desde AAAA-MM-DD) [--saida ARQUIVO] [--processos N] [--db BANCO]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import barcode
+from barcode.writer import ImageWriter
+from fpdf import FPDF
+
+from unidades import SHELF_LIFE_DAYS, donation_code, shipment_code
+
+DB_NAME = 'blood_bank.db'
+DEFAULT_CACHE_DIR = 'codigos'
+
+# Folha A4 com 3 colunas x 8 linhas de etiquetas de 70 x 37 mm
+LABEL_COLUMNS = 3
+LABEL_ROWS = 8
+LABEL_WIDTH = 70
+LABEL_HEIGHT = 297 / LABEL_ROWS
+LABEL_PADDING = 3
+MIN_POOL_SYMBOLS = 8  # Abaixo disso o custo de subir o pool não compensa
+QUERY_CHUNK = 500
+
+# O código em texto é impresso pela própria etiqueta
+SYMBOL_OPTIONS = {'write_text': False, 'module_height': 8.0, 'quiet_zone': 2.0, 'dpi': 300}
+
+_symbol_cache = {}
+
+
+def _format_date(value):
+    """AAAA-MM-DD[...] -> DD/MM/AAAA"""
+    return datetime.fromisoformat(value[:10]).strftime('%d/%m/%Y')
+
+
+def _chunks(values, size=QUERY_CHUNK):
+    """Divide os ids em blocos para as cláusulas IN"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def donation_labels(conn, donation_ids):
+    """Etiquetas das bolsas das doações indicadas"""
+    labels = []
+    for chunk in _chunks(donation_ids):
+        rows = conn.execute(f'''
+            SELECT id, donor_name, donor_blood_type, donation_date FROM donations
+            WHERE id IN ({', '.join('?' for _ in chunk)}) ORDER BY id
+        ''', chunk).fetchall()
+        for donation_id, donor_name, blood_type, donation_date in rows:
+            expiration = datetime.fromisoformat(donation_date[:10]) + timedelta(days=SHELF_LIFE_DAYS)
+            labels.append({
+                'code': donation_code(blood_type, donation_id),
+                'blood_type': blood_type,
+                'lines': [donor_name, f"Coleta: {_format_date(donation_date)}",
+                          f"Validade: {expiration.strftime('%d/%m/%Y')}"],
+            })
+    return labels
+
+
+def shipment_labels(conn, stock_ids):
+    """Etiquetas das bolsas (uma por unidade) das linhas de estoque indicadas"""
+    labels = []
+    for chunk in _chunks(stock_ids):
+        rows = conn.execute(f'''
+            SELECT id, blood_type, quantity, entry_date, expiration_date, donor_id FROM stock
+            WHERE id IN ({', '.join('?' for _ in chunk)}) AND quantity > 0 ORDER BY id
+        ''', chunk).fetchall()
+        for stock_id, blood_type, quantity, entry_date, expiration_date, donor_id in rows:
+            lines = [donor_id or "Remessa", f"Entrada: {_format_date(entry_date)}",
+                     f"Validade: {_format_date(expiration_date)}"]
+            labels.extend({'code': shipment_code(blood_type, stock_id, unit), 'blood_type': blood_type,
+                           'lines': lines} for unit in range(1, quantity + 1))
+    return labels
+
+
+def render_symbol(code):
+    """PNG do código de barras Code128 (executado nos processos do pool)"""
+    buffer = io.BytesIO()
+    barcode.get('code128', code, writer=ImageWriter()).write(buffer, options=SYMBOL_OPTIONS)
+    return buffer.getvalue()
+
+
+def render_symbols(codes, cache_dir=DEFAULT_CACHE_DIR, max_workers=None):
+    """PNG de cada código, reaproveitando o cache; devolve (símbolos, quantos foram desenhados)"""
+    symbols = {}
+    missing = []
+    for code in dict.fromkeys(codes):
+        if code in _symbol_cache:
+            symbols[code] = _symbol_cache[code]
+            continue
+        path = os.path.join(cache_dir, f"{code}.png")
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                symbols[code] = _symbol_cache[code] = f.read()
+        else:
+            missing.append(code)
+
+    if len(missing) < MIN_POOL_SYMBOLS:
+        rendered = [render_symbol(code) for code in missing]
+    else:
+        context = multiprocessing.get_context('spawn')
+        workers = min(max_workers or os.cpu_count() or 1, len(missing))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            chunksize = max(1, len(missing) // (workers * 4))
+            rendered = list(pool.map(render_symbol, missing, chunksize=chunksize))
+
+    if missing:
+        os.makedirs(cache_dir, exist_ok=True)
+    for code, png in zip(missing, rendered):
+        with open(os.path.join(cache_dir, f"{code}.png"), 'wb') as f:
+            f.write(png)
+        symbols[code] = _symbol_cache[code] = png
+    return symbols, len(missing)
+
+
+def build_label_sheet(labels, symbols, output_path):
+    """Monta o PDF com as etiquetas na grade da folha; devolve o número de páginas"""
+    pdf = FPDF(format='A4')
+    pdf.set_auto_page_break(False)
+    per_page = LABEL_COLUMNS * LABEL_ROWS
+    left = (210 - LABEL_COLUMNS * LABEL_WIDTH) / 2
+
+    for index, label in enumerate(labels):
+        if index % per_page == 0:
+            pdf.add_page()
+        column, row = index % LABEL_COLUMNS, (index % per_page) // LABEL_COLUMNS
+        x = left + column * LABEL_WIDTH + LABEL_PADDING
+        y = row * LABEL_HEIGHT + LABEL_PADDING
+        width = LABEL_WIDTH - 2 * LABEL_PADDING
+
+        # Tipo sanguíneo em destaque e os dados da bolsa ao lado
+        pdf.set_xy(x, y)
+        pdf.set_font('Arial', 'B', 20)
+        pdf.cell(20, 10, label['blood_type'], 0, 0)
+        pdf.set_font('Arial', '', 7)
+        for offset, line in enumerate(label['lines']):
+            pdf.set_xy(x + 20, y + offset * 3.5)
+            pdf.cell(width - 20, 3.5, str(line)[:40], 0, 0)
+
+        pdf.image(io.BytesIO(symbols[label['code']]), x=x, y=y + 12, w=width, h=LABEL_HEIGHT - 2 * LABEL_PADDING - 16)
+        pdf.set_xy(x, y + LABEL_HEIGHT - 2 * LABEL_PADDING - 4)
+        pdf.set_font('Arial', 'B', 8)
+        pdf.cell(width, 4, label['code'], 0, 0, 'C')
+
+    pdf.output(output_path)
+    return pdf.page_no()
+
+
+def render_label_sheet(labels, output_path, cache_dir=DEFAULT_CACHE_DIR, max_workers=None):
+    """Desenha os símbolos que faltam e grava a folha; devolve (páginas, símbolos desenhados)"""
+    if not labels:
+        raise ValueError("Nenhuma etiqueta para gerar")
+    symbols, rendered = render_symbols([label['code'] for label in labels], cache_dir, max_workers)
+    return build_label_sheet(labels, symbols, output_path), rendered
+
+
+def main(argv=None):
+    """Gera a folha de etiquetas das doações pedidas e devolve o código de saída"""
+    parser = argparse.ArgumentParser(description="Gera folhas de etiquetas com código de barras das doações.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--doacoes', nargs='+', type=int, metavar='ID', help="Ids das doações")
+    group.add_argument('--desde', help="Todas as doações a partir da data (AAAA-MM-DD)")
+    parser.add_argument('--saida', default=None, help="Arquivo PDF (padrão: etiquetas_<data>.pdf)")
+    parser.add_argument('--processos', type=int, help="Processos para desenhar os símbolos (padrão: núcleos)")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    output_path = args.saida or f"etiquetas_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.desde:
+            donation_ids = [row[0] for row in conn.execute(
+                "SELECT id FROM donations WHERE donation_date >= ? ORDER BY id", (args.desde,))]
+        else:
+            donation_ids = args.doacoes
+        labels = donation_labels(conn, donation_ids)
+    finally:
+        conn.close()
+
+    if not labels:
+        print("❌ Nenhuma doação encontrada", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    try:
+        pages, rendered = render_label_sheet(labels, output_path, max_workers=args.processos)
+    except OSError as e:
+        print(f"❌ Falha ao gravar {output_path}: {e}", file=sys.stderr)
+        return 1
+    print(f"✅ {len(labels)} etiquetas em {pages} páginas ({rendered} símbolos novos) "
+          f"em {time.perf_counter() - started:.1f} s: {output_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
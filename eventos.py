@@ -0,0 +1,119 @@
+"""Barramento de eventos sobre o registro de alterações
+
+Um único consultor lê a tabela changes (alteracoes.py) a partir da última
+sequência já entregue e avisa os assinantes de cada tabela com a lista de
+linhas alteradas. A consulta só é feita quando `PRAGMA data_version` indica
+que alguma outra conexão gravou no banco — inclusive a conexão principal do
+próprio sistema ou outro posto de trabalho usando o mesmo arquivo —, então
+o custo de um ciclo sem alterações é um único PRAGMA.
+
+O barramento registra a sua posição em change_consumers e a renova a cada
+CONSUMER_SAVE_SECONDS, para a limpeza do registro não apagar o que ele
+ainda não leu. Se mesmo assim a limpeza passar à frente dele (posto parado
+além de CONSUMER_STALE_MINUTES), cada assinante recebe um único evento de
+recarga (OP_RELOAD, sem linha) e deve refazer a sua tela inteira.
+"""
+import os
+import socket
+import sqlite3
+import time
+from collections import namedtuple, OrderedDict
+
+from alteracoes import (
+    changes_since, changes_available, last_change_seq, save_consumer, drop_consumer, CONSUMER_SAVE_SECONDS
+)
+
+ChangeEvent = namedtuple('ChangeEvent', 'table row_id op seq')
+
+OP_INSERT = 'I'
+OP_UPDATE = 'U'
+OP_DELETE = 'D'
+OP_RELOAD = '*'  # Alterações perdidas: a tela inteira deve ser recarregada
+
+
+def is_reload(events):
+    """Se a lista de eventos pede a recarga completa da tela"""
+    return any(event.op == OP_RELOAD for event in events)
+
+
+class ChangeBus:
+    """Entrega as alterações das tabelas capturadas a quem as assinou"""
+
+    def __init__(self, db_path):
+        # Conexão própria: data_version só muda com gravações de outras conexões
+        self.conn = sqlite3.connect(db_path)
+        self.last_seq = last_change_seq(self.conn)
+        self.consumer_name = f"eventos:{socket.gethostname()}:{os.getpid()}"
+        self._data_version = None
+        self._subscribers = {}
+        self._saved_at = None
+        self._save_position()
+
+    def subscribe(self, table, callback):
+        """Registra `callback(eventos)` para as alterações de `table`"""
+        self._subscribers.setdefault(table, []).append(callback)
+
+    def _save_position(self):
+        """Renova a posição do barramento no registro de leitores"""
+        try:
+            save_consumer(self.conn, self.consumer_name, self.last_seq)
+            self.conn.commit()
+        except sqlite3.Error:
+            # Só atrasa a limpeza; tenta de novo na próxima renovação
+            self.conn.rollback()
+        self._saved_at = time.monotonic()
+
+    def poll(self):
+        """Lê as alterações novas e avisa os assinantes; devolve quantas foram lidas
+
+        As alterações de uma mesma linha são agrupadas e só a última operação
+        é entregue (uma inserção seguida de alteração chega como alteração).
+        """
+        if time.monotonic() - self._saved_at >= CONSUMER_SAVE_SECONDS:
+            self._save_position()
+
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return 0
+        self._data_version = version
+
+        if not changes_available(self.conn, self.last_seq):
+            self.reload()
+            return 0
+
+        rows = changes_since(self.conn, self.last_seq)
+        if not rows:
+            return 0
+        self.last_seq = rows[-1][0]
+
+        by_table = {}
+        for seq, table, row_id, op in rows:
+            events = by_table.setdefault(table, OrderedDict())
+            events.pop(row_id, None)
+            events[row_id] = ChangeEvent(table, row_id, op, seq)
+
+        for table, events in by_table.items():
+            for callback in self._subscribers.get(table, ()):
+                callback(list(events.values()))
+        return len(rows)
+
+    def reload(self):
+        """Pula para o fim do registro e pede a todos os assinantes a recarga completa
+
+        Usado quando a limpeza já apagou alterações que o barramento não leu
+        e depois de restaurar um backup.
+        """
+        self.last_seq = last_change_seq(self.conn)
+        self._save_position()
+        for table, callbacks in self._subscribers.items():
+            for callback in callbacks:
+                callback([ChangeEvent(table, None, OP_RELOAD, self.last_seq)])
+
+    def close(self):
+        """Sai do registro de leitores e fecha a conexão do barramento"""
+        try:
+            drop_consumer(self.conn, self.consumer_name)
+            self.conn.commit()
+        except sqlite3.Error:
+            pass
+        self.conn.close()
@@ -0,0 +1,202 @@
+"""Exportação em lote das tabelas operacionais para CSV ou Parquet
+
+Lê requests, donations, stock e alerts em blocos de tamanho fixo
+(`fetchmany`) e grava cada bloco direto no arquivo, então a memória usada
+não cresce com o tamanho da tabela. O formato Parquet usa o pyarrow, se
+estiver instalado.
+
+No modo incremental a exportação guarda, por tabela, a última sequência do
+registro de alterações (alteracoes.py) que já foi entregue e, na próxima
+vez, exporta só as linhas inseridas, alteradas ou excluídas depois dela. A
+coluna `_change` indica 'U' (linha atual) ou 'D' (linha excluída, só o id).
+A primeira exportação incremental de uma tabela é completa, e também a de
+uma tabela cuja marca ficou para trás da limpeza do registro (o que só
+acontece com marcas gravadas antes do registro de leitores).
+
+Uso: python exportacao.py [tabelas ...] [--formato csv|parquet] [--incremental] [--saida PASTA]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from configuracoes import create_settings_table, get_setting, set_setting
+from alteracoes import create_changes_table, last_change_seq, changes_available, save_consumer
+from dados_relatorio import read_snapshot
+
+DB_NAME = 'blood_bank.db'
+EXPORT_TABLES = ('requests', 'donations', 'stock', 'alerts')
+DEFAULT_EXPORT_DIR = 'exportacoes'
+BATCH_SIZE = 5000
+WATERMARK_PREFIX = 'export_watermark_'
+CHANGE_COLUMN = '_change'
+
+
+def _columns(conn, table):
+    """Nomes e tipos declarados das colunas da tabela"""
+    return [(row[1], (row[2] or '').upper()) for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _batches(cursor, size):
+    """Blocos de linhas do cursor, sem carregar o resultado inteiro"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def _full_batches(conn, table, names, size):
+    """Todas as linhas da tabela, em ordem de id"""
+    cursor = conn.execute(f"SELECT {', '.join(names)} FROM {table} ORDER BY id")
+    yield from _batches(cursor, size)
+
+
+def _incremental_batches(conn, table, names, since, upto, size):
+    """Linhas alteradas (estado atual) e, em seguida, as excluídas"""
+    cursor = conn.execute(f'''
+        SELECT {', '.join(names)}, 'U' FROM {table}
+        WHERE id IN (SELECT row_id FROM changes WHERE table_name = ? AND seq > ? AND seq <= ?)
+        ORDER BY id
+    ''', (table, since, upto))
+    yield from _batches(cursor, size)
+
+    padding = (None,) * (len(names) - 1)
+    cursor = conn.execute(f'''
+        SELECT DISTINCT row_id FROM changes
+        WHERE table_name = ? AND op = 'D' AND seq > ? AND seq <= ?
+          AND row_id NOT IN (SELECT id FROM {table})
+        ORDER BY row_id
+    ''', (table, since, upto))
+    for rows in _batches(cursor, size):
+        yield [(row[0],) + padding + ('D',) for row in rows]
+
+
+def _write_csv(path, header, types, batches):
+    """Grava os blocos em CSV (UTF-8) e devolve o número de linhas"""
+    total = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for rows in batches:
+            writer.writerows(rows)
+            total += len(rows)
+    return total
+
+
+def _write_parquet(path, header, types, batches):
+    """Grava os blocos em Parquet (um row group por bloco) e devolve o número de linhas"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("A exportação em Parquet requer o pacote pyarrow (pip install pyarrow)")
+
+    def arrow_type(declared):
+        if 'INT' in declared:
+            return pa.int64()
+        if 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+            return pa.float64()
+        return pa.string()
+
+    schema = pa.schema([(name, arrow_type(declared)) for name, declared in zip(header, types)])
+    total = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            columns = list(zip(*rows))
+            arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    return total
+
+
+WRITERS = {'csv': _write_csv, 'parquet': _write_parquet}
+
+
+def export_table(conn, table, output_dir=DEFAULT_EXPORT_DIR, fmt='csv', incremental=False, batch_size=BATCH_SIZE):
+    """Exporta uma tabela e devolve (caminho, linhas)
+
+    Todas as leituras acontecem numa única transação; no modo incremental a
+    marca d'água só avança depois que o arquivo foi gravado por completo.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Tabela não exportável: {table}")
+    if fmt not in WRITERS:
+        raise ValueError(f"Formato inválido: {fmt}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    watermark_key = WATERMARK_PREFIX + table
+
+    with read_snapshot(conn):
+        columns = _columns(conn, table)
+        names = [name for name, _ in columns]
+        types = [declared for _, declared in columns]
+        upto = last_change_seq(conn)
+        since = int(get_setting(conn, watermark_key, -1)) if incremental else -1
+        if since >= 0 and not changes_available(conn, since):
+            since = -1
+
+        if since >= 0:
+            stem = f"{table}_incremental_{since + 1}_{upto}"
+            header = names + [CHANGE_COLUMN]
+            types = types + ['TEXT']
+            batches = _incremental_batches(conn, table, names, since, upto, batch_size)
+        else:
+            stem = f"{table}_completo_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            header = names
+            batches = _full_batches(conn, table, names, batch_size)
+
+        path = os.path.join(output_dir, f"{stem}.{fmt}")
+        total = WRITERS[fmt](path, header, types, batches)
+
+    if incremental:
+        set_setting(conn, watermark_key, upto)
+        # A limpeza do registro não passa desta marca
+        save_consumer(conn, f"exportacao:{table}", upto, durable=True)
+        conn.commit()
+    return path, total
+
+
+def main(argv=None):
+    """Exporta as tabelas pedidas na linha de comando"""
+    parser = argparse.ArgumentParser(description="Exporta tabelas do Hemolife Pro para CSV ou Parquet.")
+    parser.add_argument('tabelas', nargs='*', metavar='tabela',
+                        help=f"Tabelas a exportar: {', '.join(EXPORT_TABLES)} (padrão: todas)")
+    parser.add_argument('--formato', choices=sorted(WRITERS), default='csv')
+    parser.add_argument('--incremental', action='store_true',
+                        help="Só o que mudou desde a última exportação incremental")
+    parser.add_argument('--saida', default=DEFAULT_EXPORT_DIR, help=f"Pasta de saída (padrão: {DEFAULT_EXPORT_DIR})")
+    parser.add_argument('--lote', type=int, default=BATCH_SIZE, help=f"Linhas por bloco (padrão: {BATCH_SIZE})")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    tables = args.tabelas or list(EXPORT_TABLES)
+    unknown = [table for table in tables if table not in EXPORT_TABLES]
+    if unknown:
+        parser.error(f"Tabela não exportável: {', '.join(unknown)}")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        create_settings_table(conn)
+        create_changes_table(conn)
+        conn.commit()
+
+        for table in tables:
+            started = time.perf_counter()
+            try:
+                path, total = export_table(conn, table, args.saida, args.formato, args.incremental, args.lote)
+            except RuntimeError as e:
+                print(f"❌ {table}: {e}", file=sys.stderr)
+                return 1
+            elapsed = time.perf_counter() - started
+            print(f"✅ {table}: {total} linhas em {elapsed:.2f} s ({total / max(elapsed, 1e-9):.0f} linhas/s) -> {path}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Fila de relatórios PDF renderizados em processos separados
+
+Os relatórios são montados por relatorios_pdf.py num ProcessPoolExecutor,
+então vários PDFs grandes são gerados em paralelo sem travar a interface.
+O andamento chega por uma fila do Manager e é lido por `poll()`, chamado
+periodicamente pelo laço do Tk; o cancelamento retira o trabalho da fila ou,
+se já estiver rodando, sinaliza o processo para parar no próximo passo.
+Antes de renderizar, a fila consulta o cache por conteúdo (cache_relatorios)
+e devolve o PDF existente quando os dados e filtros não mudaram.
+"""
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from relatorios_pdf import RENDERERS, ReportCancelled, report_files
+from cache_relatorios import report_fingerprint, lookup_report, store_report
+
+SETTING_OUTPUT_DIR = 'report_output_dir'
+DEFAULT_OUTPUT_DIR = 'relatorios'
+
+STATUS_LABELS = {
+    'queued': 'Na fila',
+    'running': 'Gerando',
+    'done': 'Concluído',
+    'failed': 'Falhou',
+    'cancelled': 'Cancelado',
+}
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def _run_job(job_id, kind, db_path, output_path, params, progress_queue, cancel_flags):
+    """Executa um relatório dentro do processo de trabalho"""
+    def progress(fraction, message=''):
+        if cancel_flags.get(job_id):
+            raise ReportCancelled()
+        progress_queue.put((job_id, fraction, message))
+
+    try:
+        progress(0.0, 'Iniciando')
+        return RENDERERS[kind](db_path, output_path, progress=progress, **params)
+    except ReportCancelled:
+        for path in report_files(output_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+
+class ReportQueue:
+    """Fila de trabalhos de relatório com status, andamento e cancelamento"""
+
+    def __init__(self, conn, db_path, output_dir=DEFAULT_OUTPUT_DIR, max_workers=None):
+        self.conn = conn
+        self.db_path = os.path.abspath(db_path)
+        self.output_dir = output_dir
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.jobs = {}
+        self._next_id = 1
+        self._executor = None
+        self._manager = None
+        self._progress = None
+        self._cancel_flags = None
+
+    def _start(self):
+        """Sobe o pool de processos na primeira submissão"""
+        if self._executor is not None:
+            return
+        # 'spawn' evita herdar o estado do Tk e funciona igual no Windows
+        context = multiprocessing.get_context('spawn')
+        self._manager = context.Manager()
+        self._progress = self._manager.Queue()
+        self._cancel_flags = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+    def _new_job(self, kind, title, path, fingerprint, **fields):
+        """Registra um trabalho na lista e devolve o seu id"""
+        job_id = self._next_id
+        self._next_id += 1
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'title': title,
+            'path': path,
+            'parts': 1,
+            'fingerprint': fingerprint,
+            'status': 'queued',
+            'progress': 0.0,
+            'message': '',
+            'error': None,
+            'submitted': datetime.now(),
+            'finished': None,
+            'future': None,
+        }
+        job.update(fields)
+        self.jobs[job_id] = job
+        return job_id
+
+    def submit(self, kind, title, stem, **params):
+        """Coloca um relatório na fila e devolve o id do trabalho
+
+        O arquivo se chama `<stem>_<impressão digital>.pdf`. Se o mesmo
+        relatório já está na fila, devolve aquele trabalho; se já foi gerado
+        com os mesmos dados, o trabalho nasce concluído apontando para ele.
+        """
+        if kind not in RENDERERS:
+            raise ValueError(f"Relatório desconhecido: {kind}")
+
+        fingerprint = report_fingerprint(self.conn, kind, params)
+        for job in self.jobs.values():
+            if job['fingerprint'] == fingerprint and job['status'] in ACTIVE_STATUSES:
+                return job['id']
+
+        cached_path = lookup_report(self.conn, fingerprint)
+        self.conn.commit()
+        if cached_path:
+            return self._new_job(kind, title, cached_path, fingerprint, status='done', progress=1.0,
+                                 parts=len(report_files(cached_path)),
+                                 message='Reaproveitado do cache', finished=datetime.now())
+
+        self._start()
+        os.makedirs(self.output_dir, exist_ok=True)
+        output_path = os.path.abspath(os.path.join(self.output_dir, f"{stem}_{fingerprint[:12]}.pdf"))
+
+        job_id = self._new_job(kind, title, output_path, fingerprint)
+        self.jobs[job_id]['future'] = self._executor.submit(
+            _run_job, job_id, kind, self.db_path, output_path, params, self._progress, self._cancel_flags)
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancela um trabalho na fila ou pede a parada de um em andamento"""
+        job = self.jobs.get(job_id)
+        if not job or job['status'] not in ACTIVE_STATUSES:
+            return False
+        if job['future'].cancel():
+            job['status'] = 'cancelled'
+            job['finished'] = datetime.now()
+            return True
+        self._cancel_flags[job_id] = True
+        job['message'] = 'Cancelando...'
+        return True
+
+    def poll(self):
+        """Atualiza andamento e status; devolve os trabalhos encerrados nesta chamada"""
+        if self._executor is None:
+            return []
+
+        while True:
+            try:
+                job_id, fraction, message = self._progress.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs.get(job_id)
+            if job and job['status'] in ACTIVE_STATUSES and job_id not in self._cancel_flags:
+                job['status'] = 'running'
+                job['progress'] = fraction
+                job['message'] = message
+
+        finished = []
+        for job_id, job in self.jobs.items():
+            future = job['future']
+            if job['status'] not in ACTIVE_STATUSES or not future.done():
+                continue
+
+            error = None if future.cancelled() else future.exception()
+            if future.cancelled() or isinstance(error, ReportCancelled):
+                job['status'] = 'cancelled'
+                job['message'] = ''
+            elif error is not None:
+                job['status'] = 'failed'
+                job['error'] = str(error)
+                job['message'] = str(error)
+            else:
+                job['status'] = 'done'
+                job['progress'] = 1.0
+                job['message'] = ''
+                job['parts'] = len(report_files(job['path']))
+                with self.conn:
+                    store_report(self.conn, job['fingerprint'], job['kind'], job['path'])
+
+            self._cancel_flags.pop(job_id, None)
+            job['finished'] = datetime.now()
+            finished.append(job)
+        return finished
+
+    def active_count(self):
+        """Quantidade de trabalhos na fila ou em andamento"""
+        return sum(1 for job in self.jobs.values() if job['status'] in ACTIVE_STATUSES)
+
+    def clear_finished(self):
+        """Remove da lista os trabalhos já encerrados"""
+        self.jobs = {job_id: job for job_id, job in self.jobs.items() if job['status'] in ACTIVE_STATUSES}
+
+    def shutdown(self):
+        """Cancela o que estiver pendente e encerra os processos"""
+        if self._executor is None:
+            return
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
+        self._executor = None
@@ -0,0 +1,151 @@
+"""Geração em lote dos relatórios PDF, sem interface gráfica
+
+Gera os relatórios de estoque, doações, requisições e a análise preditiva de
+cada tipo sanguíneo para um período, distribuindo-os num pool de processos
+(a mesma fila usada pela aba Relatórios, inclusive o cache de PDFs).
+Pensado para ser agendado (cron / Agendador de Tarefas) fora do expediente.
+
+Exemplos:
+    python gerar_relatorios.py --mes 2024-05
+    python gerar_relatorios.py --de 01/05/2024 --ate 31/05/2024 --relatorios doacoes requisicoes
+    python gerar_relatorios.py --tipos A+ O- --dias-previsao 14 --saida relatorios/noturno
+"""
+import argparse
+import calendar
+import sqlite3
+import sys
+import time
+from datetime import datetime, date
+
+from configuracoes import get_setting
+from esquema import create_schema
+from fila_relatorios import ReportQueue, SETTING_OUTPUT_DIR, DEFAULT_OUTPUT_DIR
+
+DB_NAME = 'blood_bank.db'
+POLL_SECONDS = 0.5
+
+REPORT_NAMES = {
+    'estoque': 'stock',
+    'doacoes': 'donations',
+    'requisicoes': 'requests',
+    'analise': 'analytics',
+}
+
+
+def parse_date(value):
+    """Aceita datas AAAA-MM-DD ou DD/MM/AAAA"""
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"Data inválida: {value} (use AAAA-MM-DD ou DD/MM/AAAA)")
+
+
+def month_range(value):
+    """Primeiro e último dia de um mês AAAA-MM"""
+    try:
+        first = datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Mês inválido: {value} (use AAAA-MM)")
+    last = date(first.year, first.month, calendar.monthrange(first.year, first.month)[1])
+    return first.isoformat(), last.isoformat()
+
+
+def build_parser():
+    """Argumentos da linha de comando"""
+    parser = argparse.ArgumentParser(description="Gera o pacote de relatórios PDF do Hemolife Pro sem interface.")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    parser.add_argument('--saida', help="Pasta de saída (padrão: a configurada no sistema)")
+    period = parser.add_mutually_exclusive_group()
+    period.add_argument('--mes', type=month_range, help="Mês inteiro, AAAA-MM")
+    period.add_argument('--de', type=parse_date, help="Data inicial do período")
+    parser.add_argument('--ate', type=parse_date, help="Data final do período")
+    parser.add_argument('--relatorios', nargs='+', choices=sorted(REPORT_NAMES), default=sorted(REPORT_NAMES),
+                        help="Relatórios a gerar (padrão: todos)")
+    parser.add_argument('--tipos', nargs='+', help="Tipos sanguíneos da análise (padrão: todos)")
+    parser.add_argument('--dias-previsao', type=int, default=7, choices=[7, 14, 30],
+                        help="Horizonte da previsão na análise (padrão: 7)")
+    parser.add_argument('--emitido-por', default='Geração automática', help="Nome impresso como emissor")
+    parser.add_argument('--processos', type=int, help="Processos em paralelo (padrão: núcleos da máquina)")
+    return parser
+
+
+def plan_reports(conn, args, date_from, date_to):
+    """Lista (tipo, título, nome base, parâmetros) dos relatórios a gerar"""
+    suffix = '_'.join(filter(None, [date_from, date_to])) or 'completo'
+    kinds = set(args.relatorios)
+    jobs = []
+
+    if 'estoque' in kinds:
+        jobs.append(('stock', 'Estoque', 'relatorio_estoque', {}))
+    if 'doacoes' in kinds:
+        jobs.append(('donations', 'Doações', f'relatorio_doacoes_{suffix}',
+                     {'blood_type': 'Todos', 'date_from': date_from, 'date_to': date_to}))
+    if 'requisicoes' in kinds:
+        jobs.append(('requests', 'Requisições', f'relatorio_requisicoes_{suffix}',
+                     {'filter_status': 'Todas', 'date_from': date_from, 'date_to': date_to}))
+    if 'analise' in kinds:
+        known = [row[0] for row in conn.execute("SELECT type FROM blood_types ORDER BY type")]
+        types = args.tipos or known
+        unknown = sorted(set(types) - set(known))
+        if unknown:
+            raise SystemExit(f"Tipos sanguíneos desconhecidos: {', '.join(unknown)}")
+        for blood_type in types:
+            jobs.append(('analytics', f'Análise {blood_type}', f'relatorio_analise_{blood_type}',
+                         {'blood_type': blood_type, 'days_to_predict': args.dias_previsao}))
+    return jobs
+
+
+def main(argv=None):
+    """Gera os relatórios pedidos e devolve o código de saída do processo"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.mes and args.ate:
+        parser.error("Use --mes ou --de/--ate, não ambos")
+    date_from, date_to = args.mes if args.mes else (args.de, args.ate)
+    if date_from and date_to and date_from > date_to:
+        parser.error("A data inicial deve ser anterior à data final")
+
+    conn = sqlite3.connect(args.db)
+    try:
+        # Mesmo esquema da interface: o banco pode nunca ter sido aberto por ela
+        create_schema(conn)
+        conn.commit()
+
+        output_dir = args.saida or get_setting(conn, SETTING_OUTPUT_DIR, DEFAULT_OUTPUT_DIR)
+        queue = ReportQueue(conn, args.db, output_dir, max_workers=args.processos)
+
+        started = time.perf_counter()
+        try:
+            for kind, title, stem, params in plan_reports(conn, args, date_from, date_to):
+                queue.submit(kind, title, stem, issued_by=args.emitido_por, **params)
+
+            # Relatórios reaproveitados do cache já nascem concluídos
+            pending = list(queue.jobs.values())
+            while queue.active_count():
+                time.sleep(POLL_SECONDS)
+                queue.poll()
+        finally:
+            queue.shutdown()
+
+        failures = 0
+        for job in pending:
+            if job['status'] == 'done':
+                note = ' (cache)' if job['message'] else ''
+                if job['parts'] > 1:
+                    note += f" em {job['parts']} partes"
+                print(f"✅ {job['title']}: {job['path']}{note}")
+            else:
+                failures += 1
+                print(f"❌ {job['title']}: {job['error'] or job['status']}", file=sys.stderr)
+
+        print(f"{len(pending) - failures}/{len(pending)} relatórios em {time.perf_counter() - started:.1f} s")
+        return 1 if failures else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Gráficos dos relatórios PDF renderizados em memória, com cache por conteúdo
+
+Cada gráfico é desenhado numa Figure do matplotlib (sem pyplot) e gravado
+como PNG num buffer em memória. A chave do cache é o hash SHA-256 das séries
+de entrada: gerar de novo um relatório com os mesmos dados reaproveita a
+imagem sem chamar o matplotlib. Os PNGs ficam num diretório de cache ao lado
+dos relatórios (um arquivo por chave), compartilhado por todos os processos
+da fila e pelas execuções seguintes de gerar_relatorios.py; cada processo
+mantém ainda um LRU pequeno em memória na frente dele.
+"""
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+
+CHART_CACHE_SIZE = 32  # Imagens mantidas em memória por processo
+CHART_CACHE_DIRNAME = '.graficos'  # Subdiretório do cache em disco, dentro da pasta dos relatórios
+CHART_CACHE_FILES = 256  # PNGs mantidos no disco (os menos usados saem primeiro)
+
+_chart_cache = OrderedDict()
+_cache_stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+
+
+def series_key(kind, *series):
+    """Hash SHA-256 do tipo de gráfico e das séries que ele desenha"""
+    payload = json.dumps([kind] + [list(values) for values in series], default=str, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def chart_cache_dir(output_path):
+    """Diretório do cache de gráficos dos relatórios gravados em `output_path`"""
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), CHART_CACHE_DIRNAME)
+
+
+def _read_png(cache_dir, key):
+    """PNG guardado no disco, ou None; marca o arquivo como recém-usado"""
+    path = os.path.join(cache_dir, f"{key}.png")
+    try:
+        with open(path, 'rb') as f:
+            png = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return png
+
+
+def _write_png(cache_dir, key, png):
+    """Grava o PNG no disco (troca atômica) e apaga os menos usados além do limite"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, f"{key}.png")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(png)
+        os.replace(temp_path, path)
+
+        entries = [entry for entry in os.scandir(cache_dir) if entry.name.endswith('.png')]
+        if len(entries) > CHART_CACHE_FILES:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - CHART_CACHE_FILES]:
+                os.remove(entry.path)
+    except OSError:
+        # O cache em disco é só atalho: sem ele o gráfico é desenhado de novo
+        pass
+
+
+def cached_chart(key, draw, cache_dir=None, figsize=(8, 4), dpi=100):
+    """Devolve o PNG (bytes) do cache ou o desenha com `draw(fig)` e guarda"""
+    png = _chart_cache.get(key)
+    if png is not None:
+        _chart_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return png
+
+    png = _read_png(cache_dir, key) if cache_dir else None
+    if png is not None:
+        _cache_stats['disk_hits'] += 1
+    else:
+        from matplotlib.figure import Figure
+
+        _cache_stats['misses'] += 1
+        fig = Figure(figsize=figsize, dpi=dpi)
+        draw(fig)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight')
+        png = buffer.getvalue()
+        if cache_dir:
+            _write_png(cache_dir, key, png)
+
+    _chart_cache[key] = png
+    while len(_chart_cache) > CHART_CACHE_SIZE:
+        _chart_cache.popitem(last=False)
+    return png
+
+
+def chart_cache_info():
+    """Acertos (memória e disco), falhas e tamanho atual do cache em memória"""
+    return dict(_cache_stats, size=len(_chart_cache),
+                bytes=sum(len(png) for png in _chart_cache.values()))
+
+
+def forecast_chart_png(blood_type, dates, usages, future_dates, predictions, cache_dir=None):
+    """PNG do gráfico de histórico e previsão de demanda de um tipo"""
+    predictions = [round(float(value), 6) for value in predictions]
+
+    def draw(fig):
+        ax = fig.add_subplot(111)
+        ax.plot(dates, usages, label='Histórico', marker='o')
+        ax.plot(future_dates, predictions, label='Previsão', linestyle='--', marker='o', color='red')
+
+        ax.set_title(f'Previsão de Demanda para {blood_type}')
+        ax.set_xlabel('Data')
+        ax.set_ylabel('Unidades')
+        ax.legend()
+        ax.grid(True)
+        fig.autofmt_xdate()
+
+    key = series_key('forecast', [blood_type], dates, usages, future_dates, predictions)
+    return cached_chart(key, draw, cache_dir)
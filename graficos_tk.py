@@ -0,0 +1,191 @@
+"""Gráficos simples desenhados direto num tk.Canvas
+
+Substitui o matplotlib nas telas abertas logo após o login (dashboard), onde
+só há algumas barras e uma linha de limite. Cada barra, rótulo e ponto é um
+item do Canvas guardado pelo índice; ao receber dados novos com os mesmos
+rótulos e a mesma escala, o gráfico só move os itens que mudaram. A escala
+é arredondada (1, 2 ou 5 × 10ⁿ) e só é trocada quando os valores saem dela.
+"""
+import math
+import tkinter as tk
+
+MARGIN_LEFT = 55
+MARGIN_RIGHT = 20
+MARGIN_TOP = 40
+MARGIN_BOTTOM = 50
+GRID_STEPS = 5
+BAR_FILL = 0.6  # Fração da largura de cada categoria ocupada pela barra
+
+
+def nice_ceiling(value):
+    """Menor valor 1, 2 ou 5 × 10ⁿ maior ou igual a `value`"""
+    if value <= 0:
+        return 1
+    exponent = math.floor(math.log10(value))
+    for factor in (1, 2, 5, 10):
+        candidate = factor * 10 ** exponent
+        if candidate >= value:
+            return candidate
+    return 10 ** (exponent + 1)
+
+
+class CanvasChart(tk.Canvas):
+    """Gráfico de barras com uma linha (ex.: estoque mínimo) por categoria"""
+
+    def __init__(self, master, title='', xlabel='', ylabel='', bar_label='', line_label='',
+                 bar_color='#d90429', line_color='#ef233c', height=320, **kwargs):
+        kwargs.setdefault('background', 'white')
+        kwargs.setdefault('highlightthickness', 0)
+        super().__init__(master, height=height, **kwargs)
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.bar_label = bar_label
+        self.line_label = line_label
+        self.bar_color = bar_color
+        self.line_color = line_color
+
+        self.labels = []
+        self.values = []
+        self.line_values = None
+        self.y_max = None
+        self._bars = []
+        self._points = []
+        self._line = None
+        self._line_legend = None
+        self.redraws = 0  # Redesenhos completos (os incrementais não contam)
+
+        self.bind('<Configure>', lambda e: self.redraw())
+
+    def set_data(self, labels, values, line_values=None, line_label=None):
+        """Atualiza o gráfico, redesenhando só o que mudou quando possível"""
+        labels = list(labels)
+        values = list(values)
+        line_values = list(line_values) if line_values is not None else None
+        if line_label is not None and line_label != self.line_label:
+            self.line_label = line_label
+            if self._line_legend is not None:
+                self.itemconfigure(self._line_legend, text=line_label)
+
+        peak = max(values + (line_values or []) + [0])
+        y_max = self.y_max
+        if y_max is None or peak > y_max or peak < y_max / 2:
+            y_max = nice_ceiling(peak * 1.1)
+
+        same_layout = (labels == self.labels and y_max == self.y_max
+                       and (line_values is None) == (self.line_values is None) and self._bars)
+        old_values, old_line = self.values, self.line_values
+        self.labels, self.values, self.line_values, self.y_max = labels, values, line_values, y_max
+
+        if not same_layout:
+            self.redraw()
+            return
+
+        for index, (old, new) in enumerate(zip(old_values, values)):
+            if old != new:
+                self._move_bar(index)
+        if line_values is not None and line_values != old_line:
+            self._move_line()
+
+    # Geometria
+
+    def _plot_area(self):
+        """Cantos (x0, y0, x1, y1) da área de plotagem"""
+        width = max(self.winfo_width(), MARGIN_LEFT + MARGIN_RIGHT + 1)
+        height = max(self.winfo_height(), MARGIN_TOP + MARGIN_BOTTOM + 1)
+        return MARGIN_LEFT, MARGIN_TOP, width - MARGIN_RIGHT, height - MARGIN_BOTTOM
+
+    def _y(self, value):
+        """Coordenada vertical de um valor na escala atual"""
+        _, y0, _, y1 = self._plot_area()
+        return y1 - (y1 - y0) * min(value, self.y_max) / self.y_max
+
+    def _x_center(self, index):
+        """Centro horizontal da categoria `index`"""
+        x0, _, x1, _ = self._plot_area()
+        slot = (x1 - x0) / max(len(self.labels), 1)
+        return x0 + slot * (index + 0.5), slot
+
+    def _bar_coords(self, index):
+        """Retângulo da barra `index`"""
+        center, slot = self._x_center(index)
+        half = slot * BAR_FILL / 2
+        _, _, _, y1 = self._plot_area()
+        return center - half, self._y(self.values[index]), center + half, y1
+
+    def _line_coords(self):
+        """Pontos da linha, um por categoria"""
+        coords = []
+        for index, value in enumerate(self.line_values):
+            coords.extend((self._x_center(index)[0], self._y(value)))
+        return coords
+
+    # Desenho
+
+    def redraw(self):
+        """Apaga e desenha o gráfico inteiro (tamanho, rótulos ou escala mudaram)"""
+        self.delete('all')
+        self._bars, self._points, self._line, self._line_legend = [], [], None, None
+        self.redraws += 1
+        if not self.labels or self.y_max is None:
+            return
+
+        x0, y0, x1, y1 = self._plot_area()
+        self.create_text((x0 + x1) / 2, 15, text=self.title, font=('Arial', 11, 'bold'))
+        self.create_text((x0 + x1) / 2, y1 + 35, text=self.xlabel, font=('Arial', 9))
+        self.create_text(12, (y0 + y1) / 2, text=self.ylabel, angle=90, font=('Arial', 9))
+
+        # Grade e eixo Y
+        for step in range(GRID_STEPS + 1):
+            value = self.y_max * step / GRID_STEPS
+            y = self._y(value)
+            self.create_line(x0, y, x1, y, fill='#dddddd', dash=(4, 3))
+            self.create_text(x0 - 6, y, text=f"{value:g}", anchor='e', font=('Arial', 8))
+        self.create_line(x0, y1, x1, y1, fill='#333333')
+        self.create_line(x0, y0, x0, y1, fill='#333333')
+
+        for index, label in enumerate(self.labels):
+            self._bars.append(self.create_rectangle(*self._bar_coords(index), fill=self.bar_color, outline=''))
+            self.create_text(self._x_center(index)[0], y1 + 12, text=label, font=('Arial', 9))
+
+        if self.line_values is not None:
+            if len(self.labels) > 1:
+                self._line = self.create_line(*self._line_coords(), fill=self.line_color, width=2, dash=(6, 4))
+            for index in range(len(self.labels)):
+                self._points.append(self.create_oval(*self._point_coords(index), fill=self.line_color, outline=''))
+
+        self._draw_legend(x1, y0)
+
+    def _point_coords(self, index):
+        """Círculo do marcador da linha na categoria `index`"""
+        x = self._x_center(index)[0]
+        y = self._y(self.line_values[index])
+        return x - 4, y - 4, x + 4, y + 4
+
+    def _draw_legend(self, right, top):
+        """Legenda no canto superior direito"""
+        entries = [(self.bar_label, self.bar_color, False)]
+        if self.line_values is not None:
+            entries.append((self.line_label, self.line_color, True))
+        y = top + 8
+        for text, color, is_line in entries:
+            if not text:
+                continue
+            if is_line:
+                self.create_line(right - 190, y, right - 170, y, fill=color, width=2, dash=(6, 4))
+                self._line_legend = self.create_text(right - 164, y, text=text, anchor='w', font=('Arial', 8))
+            else:
+                self.create_rectangle(right - 188, y - 5, right - 172, y + 5, fill=color, outline='')
+                self.create_text(right - 164, y, text=text, anchor='w', font=('Arial', 8))
+            y += 16
+
+    def _move_bar(self, index):
+        """Ajusta só a altura de uma barra"""
+        self.coords(self._bars[index], *self._bar_coords(index))
+
+    def _move_line(self):
+        """Ajusta a linha e seus pontos"""
+        if self._line is not None:
+            self.coords(self._line, *self._line_coords())
+        for index, point in enumerate(self._points):
+            self.coords(point, *self._point_coords(index))
@@ -0,0 +1,268 @@
+"""Importação em lote de doações de campanha e de remessas de estoque
+
+Depois de uma campanha de doação (ou ao receber uma remessa do centro
+regional), as linhas chegam numa planilha CSV ou Excel (.xlsx) em vez de
+serem digitadas uma a uma:
+
+- doações: nome, cpf, tipo, data, quantidade
+- remessa: tipo, quantidade, validade, doador (opcional: doador ou lote)
+
+A validação é feita por coluna: cada data, tipo e quantidade distinta é
+conferida uma vez só, e as linhas apenas consultam o resultado, o que mantém
+planilhas de milhares de linhas rápidas. Os erros voltam com o número da
+linha para a pré-visualização; as linhas válidas entram todas numa única
+transação, com executemany.
+
+Uso: python importar_doacoes.py ARQUIVO [--remessa] [--simular] [--db BANCO]
+"""
+import argparse
+import csv
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from operacoes import DONATION_INTERVAL_DAYS
+from unidades import SHELF_LIFE_DAYS, donation_code, register_units, shipment_units
+
+DB_NAME = 'blood_bank.db'
+KINDS = ('donations', 'shipment')
+REQUIRED_FIELDS = {
+    'donations': ('name', 'cpf', 'blood_type', 'date', 'quantity'),
+    'shipment': ('blood_type', 'quantity', 'expiration'),
+}
+DATE_FORMATS = ('%d/%m/%Y', '%Y-%m-%d')
+
+# Cabeçalhos aceitos (em português ou com os nomes das colunas)
+FIELD_ALIASES = {
+    'nome': 'name',
+    'doador': 'donor',
+    'lote': 'donor',
+    'tipo': 'blood_type',
+    'tipo sanguíneo': 'blood_type',
+    'tipo sanguineo': 'blood_type',
+    'data': 'date',
+    'data da doação': 'date',
+    'data da doacao': 'date',
+    'quantidade': 'quantity',
+    'qtd': 'quantity',
+    'validade': 'expiration',
+    'data de validade': 'expiration',
+}
+
+
+def _read_excel(path):
+    """Linhas de uma planilha .xlsx (primeira aba, primeira linha é o cabeçalho)"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise RuntimeError("A importação de Excel requer o pacote openpyxl (pip install openpyxl)")
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell or '') for cell in next(rows, ())]
+        return [(line, dict(zip(header, values))) for line, values in enumerate(rows, start=2)
+                if any(value not in (None, '') for value in values)]
+    finally:
+        workbook.close()
+
+
+def _read_csv(path):
+    """Linhas de um CSV com cabeçalho (separado por vírgula ou ponto e vírgula)"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;')
+        except csv.Error:
+            dialect = csv.excel
+        # Linha 1 é o cabeçalho
+        return [(line, record) for line, record in enumerate(csv.DictReader(f, dialect=dialect), start=2)]
+
+
+def read_rows(path):
+    """Lê o arquivo e devolve [(número da linha, campos)] com nomes de campo normalizados"""
+    numbered = _read_excel(path) if path.lower().endswith(('.xlsx', '.xlsm')) else _read_csv(path)
+    rows = []
+    for line, record in numbered:
+        fields = {}
+        for key, value in record.items():
+            key = (key or '').strip().lower()
+            if isinstance(value, str):
+                value = value.strip()
+            fields[FIELD_ALIASES.get(key, key)] = value
+        rows.append((line, fields))
+    return rows
+
+
+def _parse_date(value):
+    """Data de uma célula (texto DD/MM/AAAA ou AAAA-MM-DD, ou data do Excel)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _parse_quantity(value):
+    """Quantidade inteira positiva, ou None"""
+    try:
+        quantity = int(float(value)) if isinstance(value, float) else int(str(value))
+    except ValueError:
+        return None
+    return quantity if quantity > 0 else None
+
+
+def _column(rows, field, parse):
+    """Converte cada valor distinto da coluna uma única vez"""
+    distinct = {value for _, fields in rows for value in [fields.get(field)]
+                if value not in (None, '') and not isinstance(value, (dict, list))}
+    return {value: parse(value) for value in distinct}
+
+
+def validate_rows(conn, rows, kind, today=None):
+    """Separa as linhas válidas (tuplas prontas para gravar) dos erros por linha"""
+    if kind not in KINDS:
+        raise ValueError(f"Tipo de importação inválido: {kind}")
+    today = today or date.today()
+    blood_types = {row[0] for row in conn.execute("SELECT type FROM blood_types")}
+    date_field = 'date' if kind == 'donations' else 'expiration'
+    dates = _column(rows, date_field, _parse_date)
+    quantities = _column(rows, 'quantity', _parse_quantity)
+
+    valid, errors = [], []
+    seen = {}
+    for line, fields in rows:
+        missing = [field for field in REQUIRED_FIELDS[kind] if fields.get(field) in (None, '')]
+        if missing:
+            errors.append((line, f"Campos obrigatórios vazios: {', '.join(missing)}"))
+            continue
+
+        blood_type = str(fields['blood_type']).upper()
+        day = dates.get(fields[date_field])
+        quantity = quantities.get(fields['quantity'])
+
+        if blood_type not in blood_types:
+            errors.append((line, f"Tipo sanguíneo inválido: {fields['blood_type']}"))
+        elif quantity is None:
+            errors.append((line, f"Quantidade inválida: {fields['quantity']}"))
+        elif day is None:
+            errors.append((line, f"Data inválida (use DD/MM/AAAA): {fields[date_field]}"))
+        elif kind == 'donations':
+            cpf = str(fields['cpf'])
+            key = (cpf, day)
+            if day > today:
+                errors.append((line, f"Data da doação no futuro: {day.strftime('%d/%m/%Y')}"))
+            elif key in seen:
+                errors.append((line, f"Doação repetida no arquivo (linha {seen[key]}): CPF {cpf}"))
+            else:
+                seen[key] = line
+                valid.append((line, (str(fields['name']), cpf, blood_type, day, quantity)))
+        else:
+            if day < today:
+                errors.append((line, f"Bolsa vencida: {day.strftime('%d/%m/%Y')}"))
+            else:
+                donor = fields.get('donor')
+                valid.append((line, (blood_type, quantity, day, str(donor) if donor not in (None, '') else None)))
+    return valid, errors
+
+
+def _last_ids(conn, table, count):
+    """Ids das `count` últimas linhas inseridas na tabela (na transação corrente)"""
+    last_id = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+    return list(range(last_id - count + 1, last_id + 1))
+
+
+def insert_rows(conn, valid, kind):
+    """Grava as linhas validadas numa única transação; devolve os ids criados
+
+    Para doações são os ids das doações; para remessas, das linhas de estoque.
+    A transação mantém a escrita reservada, então os ids são consecutivos.
+    """
+    if not valid:
+        return []
+    with conn:
+        if kind == 'donations':
+            conn.executemany('''
+                INSERT INTO donations (donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(name, cpf, blood_type, day.isoformat(), quantity,
+                   (day + timedelta(days=DONATION_INTERVAL_DAYS)).isoformat())
+                  for _, (name, cpf, blood_type, day, quantity) in valid])
+            ids = _last_ids(conn, 'donations', len(valid))
+            # Entrada no estoque
+            conn.executemany('''
+                INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(blood_type, quantity, day.isoformat(), (day + timedelta(days=SHELF_LIFE_DAYS)).isoformat(),
+                   f"{name} (CPF: {cpf})")
+                  for _, (name, cpf, blood_type, day, quantity) in valid])
+            stock_ids = _last_ids(conn, 'stock', len(valid))
+            # Cadastro das bolsas pelo código da etiqueta
+            register_units(conn, [
+                (donation_code(blood_type, donation_id), blood_type, quantity, stock_id, donation_id,
+                 (day + timedelta(days=SHELF_LIFE_DAYS)).isoformat())
+                for (_, (_, _, blood_type, day, quantity)), donation_id, stock_id in zip(valid, ids, stock_ids)])
+        else:
+            now = datetime.now().isoformat()
+            conn.executemany('''
+                INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(blood_type, quantity, now, day.isoformat(), donor)
+                  for _, (blood_type, quantity, day, donor) in valid])
+            ids = _last_ids(conn, 'stock', len(valid))
+            register_units(conn, [unit for (_, (blood_type, quantity, day, _)), stock_id in zip(valid, ids)
+                                  for unit in shipment_units(stock_id, blood_type, quantity, day.isoformat())])
+    return ids
+
+
+def import_file(conn, path, kind, dry_run=False):
+    """Lê, valida e grava; devolve (gravadas, erros por linha)"""
+    valid, errors = validate_rows(conn, read_rows(path), kind)
+    if dry_run or not valid:
+        return len(valid), errors
+    return len(insert_rows(conn, valid, kind)), errors
+
+
+def main(argv=None):
+    """Importa o arquivo indicado e devolve o código de saída do processo"""
+    parser = argparse.ArgumentParser(description="Importa doações de campanha ou remessas de estoque (CSV ou Excel).")
+    parser.add_argument('arquivo', help="CSV com cabeçalho ou planilha .xlsx")
+    parser.add_argument('--remessa', action='store_true',
+                        help="Remessa de estoque (tipo,quantidade,validade,doador) em vez de doações")
+    parser.add_argument('--simular', action='store_true', help="Só valida, sem gravar nada")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    kind = 'shipment' if args.remessa else 'donations'
+    conn = sqlite3.connect(args.db)
+    try:
+        started = time.perf_counter()
+        try:
+            imported, errors = import_file(conn, args.arquivo, kind, args.simular)
+        except (OSError, ValueError, RuntimeError, csv.Error) as e:
+            print(f"❌ Falha ao ler {args.arquivo}: {e}", file=sys.stderr)
+            return 1
+        except sqlite3.Error as e:
+            print(f"❌ Nenhuma linha gravada: {e}", file=sys.stderr)
+            return 1
+        elapsed = time.perf_counter() - started
+
+        for line, message in errors:
+            print(f"❌ Linha {line}: {message}", file=sys.stderr)
+        action = "validadas" if args.simular else "importadas"
+        rate = f" ({imported / elapsed:.0f} linhas/s)" if imported and elapsed > 0 else ""
+        print(f"✅ {imported} linhas {action}, {len(errors)} com erro em {elapsed:.2f} s{rate}")
+        return 1 if errors else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+"""Cadastro em lote de usuários a partir de CSV ou JSON
+
+O arquivo traz nome, usuário, senha, perfil e e-mail de cada pessoa (CSV com
+cabeçalho ou JSON com uma lista de objetos). As linhas são validadas antes de
+qualquer gravação; as senhas das linhas válidas são codificadas com bcrypt
+num pool de processos, um por núcleo, e todos os usuários válidos entram numa
+única transação, que confere de novo os nomes de usuário já cadastrados. As
+linhas com problema são devolvidas com o número da linha e o motivo, sem
+impedir a importação das demais.
+
+Uso: python importar_usuarios.py ARQUIVO [--simular] [--processos N] [--db BANCO]
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from configuracoes import create_settings_table
+from senhas import hash_password, bcrypt_rounds
+
+DB_NAME = 'blood_bank.db'
+REQUIRED_FIELDS = ('name', 'username', 'password', 'role')
+
+# Cabeçalhos aceitos em português, além dos nomes das colunas
+FIELD_ALIASES = {
+    'nome': 'name',
+    'usuario': 'username',
+    'usuário': 'username',
+    'senha': 'password',
+    'perfil': 'role',
+    'e-mail': 'email',
+}
+ROLE_ALIASES = {
+    'admin': 'admin',
+    'administrador': 'admin',
+    'doctor': 'doctor',
+    'medico': 'doctor',
+    'médico': 'doctor',
+    'technician': 'technician',
+    'tecnico': 'technician',
+    'técnico': 'technician',
+}
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def read_users(path):
+    """Lê o arquivo e devolve [(número da linha, campos)] com nomes de campo normalizados"""
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            records = json.load(f)
+        if not isinstance(records, list):
+            raise ValueError("O JSON deve conter uma lista de usuários")
+        numbered = [(index, record) for index, record in enumerate(records, start=1)]
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            # Linha 1 é o cabeçalho
+            numbered = [(index, record) for index, record in enumerate(csv.DictReader(f), start=2)]
+
+    rows = []
+    for line, record in numbered:
+        if not isinstance(record, dict):
+            rows.append((line, None))
+            continue
+        fields = {}
+        for key, value in record.items():
+            key = (key or '').strip().lower()
+            fields[FIELD_ALIASES.get(key, key)] = str(value).strip() if value is not None else ''
+        rows.append((line, fields))
+    return rows
+
+
+def validate_users(conn, rows):
+    """Separa as linhas válidas (prontas para gravar) dos erros por linha"""
+    existing = {row[0].lower() for row in conn.execute("SELECT username FROM users")}
+    seen = {}
+    valid, errors = [], []
+
+    for line, fields in rows:
+        if fields is None:
+            errors.append((line, "Registro em formato inválido"))
+            continue
+
+        missing = [field for field in REQUIRED_FIELDS if not fields.get(field)]
+        if missing:
+            errors.append((line, f"Campos obrigatórios vazios: {', '.join(missing)}"))
+            continue
+
+        username = fields['username']
+        role = ROLE_ALIASES.get(fields['role'].lower())
+        email = fields.get('email') or None
+
+        if role is None:
+            errors.append((line, f"Perfil inválido: {fields['role']}"))
+        elif email and not EMAIL_PATTERN.match(email):
+            errors.append((line, f"E-mail inválido: {email}"))
+        elif username.lower() in existing:
+            errors.append((line, f"Usuário já cadastrado: {username}"))
+        elif username.lower() in seen:
+            errors.append((line, f"Usuário repetido no arquivo (linha {seen[username.lower()]}): {username}"))
+        else:
+            seen[username.lower()] = line
+            valid.append((line, {'name': fields['name'], 'username': username, 'password': fields['password'],
+                                 'role': role, 'email': email}))
+    return valid, errors
+
+
+def _hash_one(args):
+    """Codifica uma senha (executado nos processos do pool)"""
+    password, rounds = args
+    return hash_password(password, rounds)
+
+
+def hash_passwords(passwords, rounds, max_workers=None):
+    """Codifica as senhas em paralelo, na mesma ordem da entrada"""
+    if len(passwords) < 2:
+        return [hash_password(password, rounds) for password in passwords]
+    context = multiprocessing.get_context('spawn')
+    workers = min(max_workers or os.cpu_count() or 1, len(passwords))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(_hash_one, [(password, rounds) for password in passwords], chunksize=chunksize))
+
+
+def insert_users(conn, valid, hashes):
+    """Grava os usuários validados numa única transação; devolve (criados, erros por linha)
+
+    A validação roda antes de codificar as senhas, o que leva segundos; os
+    nomes de usuário são conferidos de novo já com o banco reservado para
+    gravação, e quem foi cadastrado nesse meio tempo volta como erro da linha.
+    """
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {row[0].lower() for row in conn.execute("SELECT username FROM users")}
+        users, skipped = [], []
+        for (line, user), hashed in zip(valid, hashes):
+            if user['username'].lower() in existing:
+                skipped.append((line, f"Usuário já cadastrado: {user['username']}"))
+            else:
+                users.append((user['name'], user['username'], hashed, user['role'], user['email']))
+        conn.executemany(
+            "INSERT INTO users (name, username, password, role, email) VALUES (?, ?, ?, ?, ?)", users)
+    return len(users), skipped
+
+
+def import_users(conn, path, max_workers=None, dry_run=False):
+    """Lê, valida, codifica e grava; devolve (criados, erros por linha)"""
+    valid, errors = validate_users(conn, read_users(path))
+    if dry_run:
+        return len(valid), errors
+    if not valid:
+        return 0, errors
+    hashes = hash_passwords([user['password'] for _, user in valid], bcrypt_rounds(conn), max_workers)
+    created, skipped = insert_users(conn, valid, hashes)
+    return created, sorted(errors + skipped)
+
+
+def main(argv=None):
+    """Importa o arquivo indicado e devolve o código de saída do processo"""
+    parser = argparse.ArgumentParser(description="Cadastra usuários do Hemolife Pro em lote (CSV ou JSON).")
+    parser.add_argument('arquivo', help="CSV com cabeçalho (nome,usuario,senha,perfil,email) ou JSON")
+    parser.add_argument('--simular', action='store_true', help="Só valida, sem gravar nada")
+    parser.add_argument('--processos', type=int, help="Processos para codificar as senhas (padrão: núcleos)")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        create_settings_table(conn)
+        started = time.perf_counter()
+        try:
+            created, errors = import_users(conn, args.arquivo, args.processos, args.simular)
+        except (OSError, ValueError, csv.Error) as e:
+            print(f"❌ Falha ao ler {args.arquivo}: {e}", file=sys.stderr)
+            return 1
+        except sqlite3.Error as e:
+            print(f"❌ Nenhum usuário gravado: {e}", file=sys.stderr)
+            return 1
+
+        for line, message in errors:
+            print(f"❌ Linha {line}: {message}", file=sys.stderr)
+        action = "validados" if args.simular else "cadastrados"
+        print(f"✅ {created} usuários {action}, {len(errors)} linhas com erro "
+              f"em {time.perf_counter() - started:.1f} s")
+        return 1 if errors else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
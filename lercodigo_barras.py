@@ -1,21 +1,335 @@
+"""Leitura de códigos de barras pela câmera, por arquivo de vídeo ou por pasta de imagens
+
+A leitura é um pipeline em threads:
+
+- uma thread de captura lê os quadros e os coloca numa fila limitada; com a
+  câmera, se a decodificação não acompanha, quadros são pulados (e o número
+  de quadros pulados se ajusta à folga da fila), em vez de acumular atraso;
+- threads de decodificação (cv2 e zbar liberam o GIL) procuram o código
+  primeiro no recorte em volta do último código achado, em resolução cheia,
+  e depois no quadro reduzido em tons de cinza;
+- os códigos saem numa fila de resultados sem repetição: o mesmo código
+  visto de novo dentro de alguns segundos é ignorado.
+
+Com vídeo ou pasta de imagens nenhum quadro é pulado (salvo com --pular), o
+que permite medir a vazão e testar a leitura sem câmera.
+
+Com --entrada os códigos lidos dão entrada das bolsas no estoque numa sessão
+de entrada (unidades.ScanSession), gravada em grupo no banco.
+
+Uso: python lercodigo_barras.py [--video ARQUIVO | --imagens PASTA] [--trabalhadores N] [--largura PX] [--pular] [--sem-janela] [--entrada [--db BANCO]]
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
 import cv2
 from pyzbar.pyzbar import decode
 
-def ler_codigo():
-    cap = cv2.VideoCapture(0)
-    while True:
-        _, frame = cap.read()
-        for barcode in decode(frame):
-            dados = barcode.data.decode("utf-8")
-            print(f"📦 Código Lido: {dados}")
-            cap.release()
+from unidades import ScanSession
+
+DB_NAME = 'blood_bank.db'
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+FRAME_QUEUE_SIZE = 4
+DEFAULT_WORKERS = 2
+DECODE_WIDTH = 640  # Largura do quadro reduzido usado na decodificação
+ROI_MARGIN = 0.5  # Folga em volta do último código achado (fração do tamanho dele)
+DEDUP_SECONDS = 2.0  # Janela em que o mesmo código lido de novo é ignorado
+MAX_SKIP = 8  # Máximo de quadros pulados entre dois decodificados
+RESULT_POLL_SECONDS = 0.03
+
+Scan = namedtuple('Scan', 'code symbology frame_index seen_at')
+
+
+def _capture_frames(capture):
+    """Quadros de uma câmera ou arquivo de vídeo"""
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                return
+            yield frame
+    finally:
+        capture.release()
+
+
+def _image_frames(folder):
+    """Quadros de uma pasta de imagens, em ordem alfabética"""
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(os.path.join(folder, name))
+            if frame is not None:
+                yield frame
+
+
+def open_source(source):
+    """Iterador de quadros: índice da câmera, arquivo de vídeo ou pasta de imagens"""
+    if isinstance(source, str) and os.path.isdir(source):
+        return _image_frames(source)
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise OSError(f"Não foi possível abrir a fonte de vídeo: {source}")
+    return _capture_frames(capture)
+
+
+class ScanPipeline:
+    """Captura, decodificação em paralelo e fila de códigos sem repetição"""
+
+    def __init__(self, source=0, workers=DEFAULT_WORKERS, decode_width=DECODE_WIDTH,
+                 dedup_seconds=DEDUP_SECONDS, skip_frames=None):
+        self.source = source
+        self.workers = workers
+        self.decode_width = decode_width
+        self.dedup_seconds = dedup_seconds
+        # Só a câmera pula quadros por padrão (vídeo e imagens são lidos inteiros)
+        self.skip_frames = isinstance(source, int) if skip_frames is None else skip_frames
+        self.frames = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.results = queue.Queue()
+        self.latest_frame = None
+        self.stats = {'read': 0, 'skipped': 0, 'decoded': 0, 'scans': 0, 'duplicates': 0, 'decode_seconds': 0.0}
+        self._roi = None
+        self._skip = 0
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._workers_done = 0
+        self._started = None
+        self._finished = None
+
+    def start(self):
+        """Abre a fonte e sobe as threads de captura e decodificação"""
+        frames = open_source(self.source)
+        self._started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._capture, args=(frames,), daemon=True)]
+        self._threads += [threading.Thread(target=self._decode_worker, daemon=True) for _ in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Interrompe a leitura e espera as threads terminarem"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    def scans(self, timeout=None):
+        """Códigos lidos, à medida que aparecem, até a fonte acabar (ou `timeout` sem leituras)"""
+        while True:
+            try:
+                scan = self.results.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if scan is None:
+                return
+            yield scan
+
+    def elapsed(self):
+        """Segundos desde o início (até o fim, se a fonte já acabou)"""
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    def _capture(self, frames):
+        """Thread de captura: enfileira quadros, pulando os que a decodificação não acompanha"""
+        pending = 0
+        try:
+            for frame in frames:
+                if self._stop.is_set():
+                    break
+                self.stats['read'] += 1
+                self.latest_frame = frame
+                if pending > 0:
+                    pending -= 1
+                    self.stats['skipped'] += 1
+                    continue
+
+                if not self.skip_frames:
+                    self.frames.put(frame)
+                    continue
+                try:
+                    self.frames.put_nowait(frame)
+                    # Fila com folga: pula menos
+                    if self.frames.qsize() <= 1:
+                        self._skip = max(self._skip - 1, 0)
+                except queue.Full:
+                    self.stats['skipped'] += 1
+                    self._skip = min(self._skip + 1, MAX_SKIP)
+                pending = self._skip
+        finally:
+            for _ in range(self.workers):
+                self.frames.put(None)
+
+    def _decode_worker(self):
+        """Thread de decodificação: lê quadros da fila até o fim da fonte"""
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self._stop.is_set():
+                continue
+            started = time.perf_counter()
+            found = self._decode_frame(frame)
+            with self._lock:
+                self.stats['decoded'] += 1
+                self.stats['decode_seconds'] += time.perf_counter() - started
+                index = self.stats['decoded']
+            for code, symbology in found:
+                self._emit(code, symbology, index)
+
+        with self._lock:
+            self._workers_done += 1
+            last = self._workers_done == self.workers
+        if last:
+            self._finished = time.perf_counter()
+            self.results.put(None)
+
+    def _decode_frame(self, frame):
+        """Procura códigos no recorte do último achado e, se preciso, no quadro reduzido"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        height, width = gray.shape[:2]
+
+        roi = self._roi
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            found = decode(gray[y0:y1, x0:x1])
+            if found:
+                return [(item.data.decode('utf-8', 'replace'), item.type) for item in found]
+
+        scale = min(1.0, self.decode_width / width)
+        small = gray if scale == 1.0 else cv2.resize(
+            gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        found = decode(small)
+        if not found:
+            self._roi = None
+            return []
+
+        # Recorte (em resolução cheia) em volta do código para os próximos quadros
+        left, top, rect_width, rect_height = found[0].rect
+        margin_x, margin_y = rect_width * ROI_MARGIN, rect_height * ROI_MARGIN
+        self._roi = (max(int((left - margin_x) / scale), 0), max(int((top - margin_y) / scale), 0),
+                     min(int((left + rect_width + margin_x) / scale), width),
+                     min(int((top + rect_height + margin_y) / scale), height))
+        return [(item.data.decode('utf-8', 'replace'), item.type) for item in found]
+
+    def _emit(self, code, symbology, index):
+        """Entrega o código na fila de resultados, exceto se acabou de ser lido"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_seen.get(code)
+            self._last_seen[code] = now
+            if last is not None and now - last < self.dedup_seconds:
+                self.stats['duplicates'] += 1
+                return
+            self.stats['scans'] += 1
+        self.results.put(Scan(code, symbology, index, now))
+
+
+def ler_codigo(source=0, mostrar=True):
+    """Lê um código (da câmera, por padrão) e o devolve; Esc cancela"""
+    pipeline = ScanPipeline(source).start()
+    try:
+        while True:
+            try:
+                scan = pipeline.results.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                scan = False
+            if scan is None:
+                return None
+            if scan:
+                print(f"📦 Código Lido: {scan.code}")
+                return scan.code
+            if mostrar and pipeline.latest_frame is not None:
+                cv2.imshow("Leitor de Código", pipeline.latest_frame)
+                if cv2.waitKey(1) == 27:
+                    return None
+    finally:
+        pipeline.stop()
+        if mostrar:
             cv2.destroyAllWindows()
-            return dados
-        cv2.imshow("Leitor de Código", frame)
-        if cv2.waitKey(1) == 27:
-            break
-    cap.release()
-    cv2.destroyAllWindows()
+
+
+def main(argv=None):
+    """Lê códigos continuamente e imprime cada um, com a vazão ao final"""
+    parser = argparse.ArgumentParser(description="Leitor de códigos de barras (câmera, vídeo ou pasta de imagens).")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--video', help="Arquivo de vídeo em vez da câmera")
+    group.add_argument('--imagens', help="Pasta de imagens em vez da câmera")
+    parser.add_argument('--camera', type=int, default=0, help="Índice da câmera (padrão: 0)")
+    parser.add_argument('--trabalhadores', type=int, default=DEFAULT_WORKERS,
+                        help=f"Threads de decodificação (padrão: {DEFAULT_WORKERS})")
+    parser.add_argument('--largura', type=int, default=DECODE_WIDTH,
+                        help=f"Largura do quadro reduzido (padrão: {DECODE_WIDTH})")
+    parser.add_argument('--pular', action='store_true', help="Pula quadros também com vídeo ou imagens")
+    parser.add_argument('--sem-janela', action='store_true', help="Não mostra a imagem da câmera")
+    parser.add_argument('--entrada', action='store_true', help="Dá entrada no estoque das bolsas lidas")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados da entrada (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    source = args.video or args.imagens or args.camera
+    pipeline = ScanPipeline(source, args.trabalhadores, args.largura, skip_frames=True if args.pular else None)
+    try:
+        pipeline.start()
+    except OSError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+
+    conn = sqlite3.connect(args.db) if args.entrada else None
+    session = ScanSession(conn) if args.entrada else None
+    show = isinstance(source, int) and not args.sem_janela
+    try:
+        while True:
+            try:
+                scan = pipeline.results.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                scan = False
+            if scan is None:
+                break
+            if scan:
+                print(f"📦 Código Lido: {scan.code}")
+                if session is not None:
+                    accepted, message = session.add(scan.code)
+                    if not accepted:
+                        print(f"❌ {message}", file=sys.stderr)
+            if session is not None:
+                session.flush_if_due()
+            if show and pipeline.latest_frame is not None:
+                cv2.imshow("Leitor de Código", pipeline.latest_frame)
+                if cv2.waitKey(1) == 27:
+                    break
+    except KeyboardInterrupt:
+        pass
+    except sqlite3.Error as e:
+        print(f"❌ Falha ao gravar a entrada: {e}", file=sys.stderr)
+        return 1
+    finally:
+        pipeline.stop()
+        if show:
+            cv2.destroyAllWindows()
+        if session is not None:
+            try:
+                session.close()
+            except sqlite3.Error as e:
+                print(f"❌ {len(session.pending)} leituras não gravadas: {e}", file=sys.stderr)
+            finally:
+                conn.close()
+
+    stats = pipeline.stats
+    elapsed = pipeline.elapsed()
+    rate = stats['decoded'] / elapsed if elapsed else 0
+    print(f"✅ {stats['read']} quadros lidos, {stats['decoded']} decodificados, {stats['skipped']} pulados "
+          f"em {elapsed:.1f} s ({rate:.0f} quadros/s); {stats['scans']} códigos, {stats['duplicates']} repetidos")
+    if session is not None:
+        tally = ", ".join(f"{blood_type} {quantity}" for blood_type, quantity in sorted(session.tally.items()))
+        print(f"✅ Entrada de {session.stored} bolsas ({tally or 'nenhuma'}) em {session.flushes} gravações; "
+              f"{len(session.rejected)} recusadas")
+    return 0
+
 
 if __name__ == "__main__":
-    ler_codigo()
+    sys.exit(main())
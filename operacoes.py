@@ -0,0 +1,349 @@
+"""Operações do banco de sangue, sem interface
+
+Aprovação e rejeição de requisições, envio de requisições, registro de
+doações e as consultas de estoque, requisições, doações e alertas. A
+interface Tk e o serviço HTTP (servidor_api.py) usam as mesmas funções, então
+as regras (estoque suficiente, requisição ainda pendente, validade da bolsa)
+ficam num lugar só. As funções de gravação fazem o commit; quando uma regra
+impede a operação, levantam OperationError com a mensagem para o usuário.
+
+A aprovação baixa o estoque dentro de uma transação BEGIN IMMEDIATE e com
+UPDATE condicional (requisição ainda pendente e saldo suficiente), então dois
+postos aprovando ao mesmo tempo nunca deixam o estoque negativo. Na mesma
+transação as bolsas que atendem a requisição saem do cadastro de bolsas
+(unidades.reserve_units), para a leitura da saída não baixar o estoque de novo. Se o banco
+estiver ocupado por outro gravador, a aprovação é tentada de novo algumas
+vezes, com espera curta em cada tentativa, antes de desistir. Várias requisições podem ser aprovadas ou
+rejeitadas de uma vez, numa única transação, das mais urgentes para as menos
+urgentes.
+"""
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from estoque_seguranca import stock_levels
+from unidades import SHELF_LIFE_DAYS, donation_code, register_units, reserve_units
+
+DONATION_INTERVAL_DAYS = 90  # Intervalo mínimo entre doações
+URGENCY_LEVELS = ('Normal', 'Urgente', 'Emergência')
+REQUEST_STATUSES = ('pending', 'approved', 'rejected')
+URGENCY_RANK = {level: rank for rank, level in enumerate(reversed(URGENCY_LEVELS))}  # Emergência primeiro
+BUSY_RETRIES = 5  # Tentativas quando outro gravador segura o banco
+BUSY_BACKOFF_SECONDS = 0.05  # Espera base entre tentativas (dobra a cada uma)
+BUSY_TIMEOUT_MS = 250  # Espera do próprio SQLite em cada tentativa (no lugar dos 5 s padrão)
+
+
+class OperationError(Exception):
+    """Operação recusada por uma regra do negócio"""
+
+
+def available_stock(conn, blood_type):
+    """Unidades disponíveis de um tipo sanguíneo"""
+    return conn.execute("SELECT SUM(quantity) FROM stock WHERE blood_type = ?", (blood_type,)).fetchone()[0] or 0
+
+
+def _is_busy(error):
+    """Erro de banco ocupado/travado por outra conexão"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _retry_busy(func, conn, *args):
+    """Executa `func(conn, *args)`, tentando de novo enquanto o banco estiver ocupado
+
+    Durante as tentativas o busy_timeout da conexão cai para BUSY_TIMEOUT_MS,
+    então a espera total fica em poucos segundos mesmo quando a chamada vem
+    da thread da interface.
+    """
+    previous = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    try:
+        for attempt in range(BUSY_RETRIES):
+            try:
+                return func(conn, *args)
+            except sqlite3.OperationalError as e:
+                if not _is_busy(e) or attempt == BUSY_RETRIES - 1:
+                    raise
+                time.sleep(BUSY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+    finally:
+        conn.execute(f"PRAGMA busy_timeout = {previous}")
+
+
+def _begin_immediate(conn):
+    """Abre uma transação que já reserva a escrita no banco
+
+    BEGIN não pode ser aninhado; gravar aqui o que a conexão tinha pendente
+    misturaria trabalho alheio com a operação, então a operação é recusada.
+    """
+    if conn.in_transaction:
+        raise OperationError("Há alterações não gravadas nesta conexão; a operação não foi iniciada.")
+    conn.execute("BEGIN IMMEDIATE")
+
+
+def _placeholders(values):
+    """Marcadores "?, ?, ..." para uma cláusula IN"""
+    return ', '.join('?' for _ in values)
+
+
+def _approve_once(conn, request_id, staff_id):
+    """Uma tentativa de aprovação, numa transação que já reserva a escrita"""
+    _begin_immediate(conn)
+    try:
+        now = datetime.now().isoformat()
+        # Só aprova se ainda estiver pendente e o saldo cobrir a quantidade
+        cursor = conn.execute('''
+            UPDATE requests
+            SET status = 'approved',
+                responding_staff = ?,
+                response_date = ?
+            WHERE id = ? AND status = 'pending'
+              AND quantity <= (SELECT COALESCE(SUM(quantity), 0) FROM stock
+                               WHERE stock.blood_type = requests.blood_type)
+        ''', (staff_id, now, request_id))
+
+        if cursor.rowcount == 0:
+            request_data = conn.execute(
+                "SELECT blood_type FROM requests WHERE id = ? AND status = 'pending'", (request_id,)).fetchone()
+            if not request_data:
+                raise OperationError("Requisição já processada ou não encontrada!")
+            raise OperationError(f"Estoque insuficiente! Disponível: {available_stock(conn, request_data[0])}")
+
+        # Saída do estoque
+        conn.execute('''
+            INSERT INTO stock (blood_type, quantity, entry_date, expiration_date)
+            SELECT blood_type, -quantity, ?, ? FROM requests WHERE id = ?
+        ''', (now, now, request_id))
+        blood_type, quantity = conn.execute(
+            "SELECT blood_type, quantity FROM requests WHERE id = ?", (request_id,)).fetchone()
+        reserve_units(conn, request_id, blood_type, quantity)
+        conn.commit()
+        return blood_type, quantity
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def approve_request(conn, request_id, staff_id):
+    """Aprova uma requisição pendente e baixa o estoque; devolve (tipo, quantidade)"""
+    return _retry_busy(_approve_once, conn, request_id, staff_id)
+
+
+def _approve_batch_once(conn, request_ids, staff_id):
+    """Uma tentativa de aprovação em lote, numa única transação"""
+    _begin_immediate(conn)
+    try:
+        rows = conn.execute(f'''
+            SELECT id, blood_type, quantity, urgency, request_date FROM requests
+            WHERE id IN ({_placeholders(request_ids)}) AND status = 'pending'
+        ''', request_ids).fetchall()
+        found = {row[0] for row in rows}
+        skipped = [(request_id, "Requisição já processada ou não encontrada!")
+                   for request_id in request_ids if request_id not in found]
+
+        blood_types = sorted({row[1] for row in rows})
+        balances = dict(conn.execute(f'''
+            SELECT blood_type, SUM(quantity) FROM stock
+            WHERE blood_type IN ({_placeholders(blood_types)}) GROUP BY blood_type
+        ''', blood_types).fetchall())
+
+        # Mais urgentes primeiro; no mesmo nível, as mais antigas
+        approved = []
+        for request_id, blood_type, quantity, urgency, _ in sorted(
+                rows, key=lambda row: (URGENCY_RANK.get(row[3], len(URGENCY_RANK)), row[4], row[0])):
+            available = balances.get(blood_type) or 0
+            if available < quantity:
+                skipped.append((request_id, f"Estoque insuficiente! Disponível: {available}"))
+                continue
+            balances[blood_type] = available - quantity
+            approved.append((request_id, blood_type, quantity))
+
+        now = datetime.now().isoformat()
+        conn.executemany('''
+            UPDATE requests
+            SET status = 'approved',
+                responding_staff = ?,
+                response_date = ?
+            WHERE id = ? AND status = 'pending'
+        ''', [(staff_id, now, request_id) for request_id, _, _ in approved])
+        # Saída do estoque
+        conn.executemany('''
+            INSERT INTO stock (blood_type, quantity, entry_date, expiration_date)
+            VALUES (?, ?, ?, ?)
+        ''', [(blood_type, -quantity, now, now) for _, blood_type, quantity in approved])
+        for request_id, blood_type, quantity in approved:
+            reserve_units(conn, request_id, blood_type, quantity)
+        conn.commit()
+        return approved, skipped
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def approve_requests(conn, request_ids, staff_id):
+    """Aprova várias requisições numa transação, por ordem de urgência
+
+    Devolve (aprovadas, ignoradas): aprovadas é [(id, tipo, quantidade)] e
+    ignoradas é [(id, motivo)] para as que já tinham sido processadas ou que
+    o estoque não cobriu depois das mais urgentes.
+    """
+    request_ids = list(dict.fromkeys(request_ids))
+    if not request_ids:
+        return [], []
+    return _retry_busy(_approve_batch_once, conn, request_ids, staff_id)
+
+
+def _reject_batch_once(conn, request_ids, staff_id, reason):
+    """Uma tentativa de rejeição em lote, numa única transação"""
+    _begin_immediate(conn)
+    try:
+        pending = {row[0] for row in conn.execute(
+            f"SELECT id FROM requests WHERE id IN ({_placeholders(request_ids)}) AND status = 'pending'",
+            request_ids)}
+        rejected = [request_id for request_id in request_ids if request_id in pending]
+        conn.executemany('''
+            UPDATE requests
+            SET status = 'rejected',
+                responding_staff = ?,
+                response_date = ?,
+                patient_info = COALESCE(patient_info, '') || '\nMotivo da rejeição: ' || ?
+            WHERE id = ? AND status = 'pending'
+        ''', [(staff_id, datetime.now().isoformat(), reason, request_id) for request_id in rejected])
+        conn.commit()
+        skipped = [(request_id, "Requisição já processada ou não encontrada!")
+                   for request_id in request_ids if request_id not in pending]
+        return rejected, skipped
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def reject_requests(conn, request_ids, staff_id, reason):
+    """Rejeita várias requisições pendentes numa transação; devolve (rejeitadas, ignoradas)"""
+    request_ids = list(dict.fromkeys(request_ids))
+    if not request_ids:
+        return [], []
+    return _retry_busy(_reject_batch_once, conn, request_ids, staff_id, reason)
+
+
+def reject_request(conn, request_id, staff_id, reason):
+    """Rejeita uma requisição pendente, registrando o motivo (mesma transação do lote)"""
+    _, skipped = reject_requests(conn, [request_id], staff_id, reason)
+    if skipped:
+        raise OperationError(skipped[0][1])
+
+
+def submit_request(conn, doctor_id, blood_type, quantity, urgency='Normal', patient_info=''):
+    """Registra uma requisição pendente; devolve o id"""
+    if quantity <= 0:
+        raise OperationError("Quantidade deve ser um número positivo!")
+    if urgency not in URGENCY_LEVELS:
+        raise OperationError(f"Urgência inválida: {urgency}")
+    if not conn.execute("SELECT 1 FROM blood_types WHERE type = ?", (blood_type,)).fetchone():
+        raise OperationError(f"Tipo sanguíneo inválido: {blood_type}")
+
+    cursor = conn.execute('''
+        INSERT INTO requests (blood_type, quantity, requesting_doctor, request_date, status, urgency, patient_info)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (blood_type, quantity, doctor_id, datetime.now().isoformat(), 'pending', urgency, patient_info))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def register_donation(conn, donor_name, donor_cpf, blood_type, donation_date, quantity):
+    """Registra a doação e a entrada da bolsa no estoque; devolve o id da doação
+
+    `donation_date` é um `date`; a próxima doação e a validade da bolsa são
+    calculadas a partir dele.
+    """
+    if quantity <= 0:
+        raise OperationError("Quantidade deve ser um número positivo!")
+
+    next_donation_date = (donation_date + timedelta(days=DONATION_INTERVAL_DAYS)).isoformat()
+    expiration_date = (donation_date + timedelta(days=SHELF_LIFE_DAYS)).isoformat()
+
+    cursor = conn.execute('''
+        INSERT INTO donations (donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (donor_name, donor_cpf, blood_type, donation_date.isoformat(), quantity, next_donation_date))
+    donation_id = cursor.lastrowid
+
+    # Entrada no estoque e cadastro da bolsa pelo código da etiqueta
+    stock_id = conn.execute('''
+        INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (blood_type, quantity, donation_date.isoformat(), expiration_date, f"{donor_name} (CPF: {donor_cpf})")).lastrowid
+    register_units(conn, [(donation_code(blood_type, donation_id), blood_type, quantity, stock_id, donation_id,
+                           expiration_date)])
+
+    conn.commit()
+    return donation_id
+
+
+def stock_summary(conn):
+    """Estoque, mínimo vigente e situação de cada tipo sanguíneo"""
+    return [
+        {'blood_type': row[0], 'quantity': row[1], 'min_stock': row[2], 'low': row[1] < row[2]}
+        for row in stock_levels(conn)
+    ]
+
+
+def list_requests(conn, status=None, doctor_id=None, limit=200):
+    """Requisições mais recentes, opcionalmente filtradas por status ou médico"""
+    query = '''
+        SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status, r.urgency, r.response_date
+        FROM requests r
+        JOIN users u ON r.requesting_doctor = u.id
+    '''
+    conditions, params = [], []
+    if status:
+        conditions.append("r.status = ?")
+        params.append(status)
+    if doctor_id:
+        conditions.append("r.requesting_doctor = ?")
+        params.append(doctor_id)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.request_date DESC LIMIT ?"
+    params.append(limit)
+
+    keys = ('id', 'blood_type', 'quantity', 'doctor', 'request_date', 'status', 'urgency', 'response_date')
+    return [dict(zip(keys, row)) for row in conn.execute(query, params)]
+
+
+def list_donations(conn, blood_type=None, limit=200):
+    """Doações mais recentes, opcionalmente de um tipo sanguíneo"""
+    query = '''
+        SELECT id, donor_name, donor_blood_type, donation_date, quantity, next_donation_date
+        FROM donations
+    '''
+    params = []
+    if blood_type:
+        query += " WHERE donor_blood_type = ?"
+        params.append(blood_type)
+    query += " ORDER BY donation_date DESC LIMIT ?"
+    params.append(limit)
+
+    keys = ('id', 'donor_name', 'blood_type', 'donation_date', 'quantity', 'next_donation_date')
+    return [dict(zip(keys, row)) for row in conn.execute(query, params)]
+
+
+def list_alerts(conn, recipient_id, unread_only=True):
+    """Alertas de um usuário, do mais recente para o mais antigo"""
+    query = "SELECT id, type, message, sent_date, status FROM alerts WHERE recipient_id = ?"
+    if unread_only:
+        query += " AND status = 'sent'"
+    query += " ORDER BY sent_date DESC"
+
+    keys = ('id', 'type', 'message', 'sent_date', 'status')
+    return [dict(zip(keys, row)) for row in conn.execute(query, (recipient_id,))]
+
+
+def mark_alert_read(conn, alert_id, recipient_id):
+    """Marca como lido um alerta do próprio usuário"""
+    cursor = conn.execute(
+        "UPDATE alerts SET status = 'read' WHERE id = ? AND recipient_id = ?", (alert_id, recipient_id))
+    if cursor.rowcount == 0:
+        conn.rollback()
+        raise OperationError("Alerta não encontrado!")
+    conn.commit()
@@ -4,18 +4,12 @@ import matplotlib.pyplot as plt
 from sklearn.linear_model import LinearRegression
 import numpy as np
 import datetime
+from demanda_diaria import DB_NAME, daily_usage, since_day
 
 def obter_dados(tipo, dias=30):
-    conn = sqlite3.connect("banco.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT data, COUNT(*) 
-        FROM requisicoes 
-        WHERE tipo_sangue=? AND status='aprovada' 
-        AND DATE(data) >= DATE('now', ?)
-        GROUP BY DATE(data)
-    """, (tipo, f"-{dias} day"))
-    dados = cursor.fetchall()
+    # Série diária pré-calculada (uma linha por dia, sem varrer as requisições)
+    conn = sqlite3.connect(DB_NAME)
+    dados = daily_usage(conn, tipo, since_day(dias))
     conn.close()
 
     if not dados:
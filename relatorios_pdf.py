@@ -0,0 +1,626 @@
+"""Geração dos relatórios PDF do Hemolife Pro, independente da interface
+
+Cada função `render_*` abre sua própria conexão com o banco, monta o PDF e
+grava em `output_path`. Elas rodam nos processos da fila de relatórios
+(fila_relatorios.py) e informam o andamento por `progress(fração, texto)`,
+que pode lançar ReportCancelled para interromper o trabalho.
+
+O FPDF guarda todas as páginas em memória até `output()`; por isso as
+listagens longas (doações e requisições) saem em partes de ROWS_PER_PART
+linhas: cada parte é gravada e liberada antes da seguinte, e a memória fica
+limitada ao tamanho de uma parte. A primeira parte é o próprio
+`output_path`; as seguintes ganham o sufixo "_parteN" (ver report_files).
+"""
+import io
+import os
+import sqlite3
+from datetime import datetime
+
+from fpdf import FPDF
+
+from dados_relatorio import stock_dataset, analytics_dataset
+from graficos_relatorio import forecast_chart_png, chart_cache_dir
+
+TEMPLATE_VERSION = 2  # Incrementar ao mudar o layout, para invalidar o cache de PDFs
+PROGRESS_EVERY_ROWS = 200
+FETCH_CHUNK = 500  # Linhas lidas do cursor por vez nas listagens longas
+ROWS_PER_PART = 5000  # Linhas por arquivo PDF nas listagens longas
+DATE_CACHE_LIMIT = 4096
+
+
+class ReportCancelled(Exception):
+    """Sinaliza que o usuário cancelou o relatório em andamento"""
+
+
+def _no_progress(fraction, message=''):
+    pass
+
+
+def _connect(db_path):
+    """Abre uma conexão só de leitura, já dentro de uma transação de leitura
+
+    Todas as consultas do relatório veem o mesmo estado do banco; a
+    transação termina quando a conexão é fechada.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.execute("BEGIN")
+    return conn
+
+
+def _header(pdf, title, issued_by, subtitle=None):
+    """Título padrão dos relatórios"""
+    pdf.add_page()
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(0, 10, title, 0, 1, 'C')
+    pdf.set_font('Arial', '', 12)
+    if subtitle:
+        pdf.cell(0, 10, subtitle, 0, 1, 'C')
+    pdf.cell(0, 10, f'Emitido em: {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 1, 'C')
+    pdf.cell(0, 10, f'Emitido por: {issued_by}', 0, 1, 'C')
+    pdf.ln(10)
+
+
+def render_stock_report(db_path, output_path, issued_by, progress=_no_progress):
+    """Gera relatório PDF do estoque atual"""
+    conn = _connect(db_path)
+    try:
+        data = stock_dataset(conn)
+    finally:
+        conn.close()
+
+    pdf = FPDF()
+    _header(pdf, 'Relatório de Estoque de Sangue', issued_by)
+    progress(0.1, 'Níveis de estoque')
+
+    # Dados do estoque
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, 'Níveis de Estoque por Tipo Sanguíneo', 0, 1)
+    pdf.set_font('Arial', '', 10)
+
+    # Cabeçalho da tabela
+    pdf.set_fill_color(200, 220, 255)
+    pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
+    pdf.cell(40, 10, 'Quantidade', 1, 0, 'C', 1)
+    pdf.cell(40, 10, 'Ponto Reposição' if data['use_dynamic'] else 'Estoque Mínimo', 1, 0, 'C', 1)
+    pdf.cell(70, 10, 'Status', 1, 1, 'C', 1)
+
+    pdf.set_fill_color(255, 255, 255)
+
+    for row in data['levels']:
+        blood_type = row[0]
+        stock = row[1]
+        min_stock = row[2]
+
+        if stock < min_stock:
+            status = f"ESTOQUE BAIXO (faltam {min_stock - stock} unidades)"
+            pdf.set_text_color(255, 0, 0)  # Vermelho
+        else:
+            status = "OK"
+            pdf.set_text_color(0, 0, 0)  # Preto
+
+        pdf.cell(40, 10, blood_type, 1, 0, 'C')
+        pdf.cell(40, 10, str(stock), 1, 0, 'C')
+        pdf.cell(40, 10, str(min_stock), 1, 0, 'C')
+        pdf.cell(70, 10, status, 1, 1, 'C')
+
+    progress(0.5, 'Itens próximos do vencimento')
+
+    # Itens próximos a vencer
+    pdf.ln(10)
+    pdf.set_font('Arial', 'B', 12)
+    pdf.set_text_color(0, 0, 0)
+    pdf.cell(0, 10, 'Itens Próximos do Vencimento (7 dias)', 0, 1)
+    pdf.set_font('Arial', '', 10)
+
+    # Cabeçalho da tabela
+    pdf.set_fill_color(200, 220, 255)
+    pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
+    pdf.cell(40, 10, 'Quantidade', 1, 0, 'C', 1)
+    pdf.cell(40, 10, 'Data Validade', 1, 0, 'C', 1)
+    pdf.cell(70, 10, 'Dias Restantes', 1, 1, 'C', 1)
+
+    pdf.set_fill_color(255, 255, 255)
+
+    today = datetime.now().date()
+    has_expiring = False
+
+    for row in data['expiring']:
+        has_expiring = True
+        expiry_date = datetime.strptime(row[2], '%Y-%m-%d').date()
+        days_left = (expiry_date - today).days
+
+        pdf.cell(40, 10, row[0], 1, 0, 'C')
+        pdf.cell(40, 10, str(row[1]), 1, 0, 'C')
+        pdf.cell(40, 10, expiry_date.strftime('%d/%m/%Y'), 1, 0, 'C')
+
+        if days_left <= 0:
+            pdf.set_text_color(255, 0, 0)
+            status = "VENCIDO"
+        else:
+            pdf.set_text_color(255, 165, 0)  # Laranja
+            status = f"{days_left} dias"
+
+        pdf.cell(70, 10, status, 1, 1, 'C')
+        pdf.set_text_color(0, 0, 0)
+
+    if not has_expiring:
+        pdf.cell(0, 10, 'Nenhum item próximo do vencimento', 1, 1, 'C')
+
+    progress(0.9, 'Gravando arquivo')
+    pdf.output(output_path)
+    return output_path
+
+
+def part_path(output_path, part):
+    """Caminho de uma parte do relatório (a primeira é o próprio output_path)"""
+    if part == 1:
+        return output_path
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_parte{part}{ext}"
+
+
+def report_files(output_path):
+    """Arquivos gravados de um relatório: a primeira parte e as seguintes"""
+    files = [output_path]
+    part = 2
+    while os.path.exists(part_path(output_path, part)):
+        files.append(part_path(output_path, part))
+        part += 1
+    return files
+
+
+class _PartedReport:
+    """Listagem gravada em arquivos de até ROWS_PER_PART linhas
+
+    `start_part(pdf, parte)` escreve o cabeçalho de cada parte. `row()` é
+    chamado antes de cada linha e devolve o FPDF da parte corrente, gravando
+    e trocando de parte quando a atual enche.
+    """
+
+    def __init__(self, output_path, start_part, rows_per_part=ROWS_PER_PART):
+        self.output_path = output_path
+        self.start_part = start_part
+        self.rows_per_part = rows_per_part
+        self.part = 0
+        self.rows = 0
+        self.pdf = None
+        # Partes de uma geração anterior com o mesmo nome
+        for stale in report_files(output_path)[1:]:
+            os.remove(stale)
+        self._new_part()
+
+    def _new_part(self):
+        self.part += 1
+        self.rows = 0
+        self.pdf = FPDF()
+        self.start_part(self.pdf, self.part)
+
+    def row(self):
+        """FPDF onde vai a próxima linha"""
+        if self.rows == self.rows_per_part:
+            self.pdf.output(part_path(self.output_path, self.part))
+            self.pdf = None
+            self._new_part()
+        self.rows += 1
+        return self.pdf
+
+    def close(self):
+        """Grava a última parte; devolve o número de partes"""
+        self.pdf.output(part_path(self.output_path, self.part))
+        self.pdf = None
+        return self.part
+
+
+def _period_conditions(column, date_from=None, date_to=None):
+    """Condições SQL e parâmetros para um período (datas ISO, inclusivas)"""
+    conditions = []
+    params = []
+    if date_from:
+        conditions.append(f"{column} >= ?")
+        params.append(date_from)
+    if date_to:
+        conditions.append(f"{column} < date(?, '+1 day')")
+        params.append(date_to)
+    return conditions, params
+
+
+def _period_label(date_from=None, date_to=None):
+    """Texto do período filtrado para o cabeçalho do relatório"""
+    def fmt(day):
+        return datetime.strptime(day, '%Y-%m-%d').strftime('%d/%m/%Y')
+
+    if date_from and date_to:
+        return f'Período: {fmt(date_from)} a {fmt(date_to)}'
+    if date_from:
+        return f'Período: a partir de {fmt(date_from)}'
+    if date_to:
+        return f'Período: até {fmt(date_to)}'
+    return None
+
+
+def _iter_rows(cursor, size=FETCH_CHUNK):
+    """Percorre o cursor em blocos, sem carregar o resultado inteiro"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
+
+
+def render_donation_report(db_path, output_path, issued_by, blood_type='Todos', date_from=None, date_to=None,
+                           progress=_no_progress):
+    """Gera relatório PDF das doações"""
+    conn = _connect(db_path)
+    try:
+        conditions, params = _period_conditions('donation_date', date_from, date_to)
+        if blood_type != 'Todos':
+            conditions.append("donor_blood_type = ?")
+            params.append(blood_type)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        period = _period_label(date_from, date_to)
+
+        def start_part(pdf, part):
+            if part == 1:
+                _header(pdf, 'Relatório de Doações de Sangue', issued_by)
+
+                # Filtros aplicados
+                if blood_type != 'Todos':
+                    pdf.cell(0, 10, f'Filtro: Tipo Sanguíneo {blood_type}', 0, 1)
+                if period:
+                    pdf.cell(0, 10, period, 0, 1)
+                if blood_type != 'Todos' or period:
+                    pdf.ln(5)
+            else:
+                _header(pdf, 'Relatório de Doações de Sangue', issued_by, subtitle=f'Parte {part} (continuação)')
+
+            # Dados das doações
+            pdf.set_font('Arial', 'B', 12)
+            pdf.cell(0, 10, 'Registro de Doações', 0, 1)
+            pdf.set_font('Arial', '', 10)
+
+            # Cabeçalho da tabela
+            pdf.set_fill_color(200, 220, 255)
+            pdf.cell(15, 10, 'ID', 1, 0, 'C', 1)
+            pdf.cell(50, 10, 'Doador', 1, 0, 'C', 1)
+            pdf.cell(30, 10, 'CPF', 1, 0, 'C', 1)
+            pdf.cell(20, 10, 'Tipo', 1, 0, 'C', 1)
+            pdf.cell(30, 10, 'Data', 1, 0, 'C', 1)
+            pdf.cell(20, 10, 'Qtd (ml)', 1, 0, 'C', 1)
+            pdf.cell(30, 10, 'Próxima Doação', 1, 1, 'C', 1)
+
+            pdf.set_fill_color(255, 255, 255)
+
+        parts = _PartedReport(output_path, start_part)
+
+        # Total de doações (também usado para o andamento)
+        total_count, total_ml = conn.execute(f"SELECT COUNT(*), SUM(quantity) FROM donations {where}", params).fetchone()
+        total_ml = total_ml or 0
+
+        # Doações em blocos, mais recentes primeiro
+        cursor = conn.execute(f'''
+            SELECT id, donor_name, donor_cpf, donor_blood_type, donation_date, quantity, next_donation_date
+            FROM donations
+            {where}
+            ORDER BY donation_date DESC
+        ''', params)
+
+        today = datetime.now().date()
+        date_cache = {}
+
+        def display_date(value):
+            # Muitas linhas repetem a mesma data; converte cada uma só uma vez
+            if value not in date_cache:
+                day = datetime.strptime(value, '%Y-%m-%d').date()
+                date_cache[value] = (day, day.strftime('%d/%m/%Y'))
+            return date_cache[value]
+
+        for index, row in enumerate(_iter_rows(cursor)):
+            if index % PROGRESS_EVERY_ROWS == 0:
+                progress(0.8 * index / max(total_count, 1), f'Doações: {index}/{total_count}')
+
+            donation_text = display_date(row[4])[1]
+            next_donation = display_date(row[6]) if row[6] else None
+
+            pdf = parts.row()
+            pdf.cell(15, 10, str(row[0]), 1, 0, 'C')
+            pdf.cell(50, 10, row[1], 1, 0)
+            pdf.cell(30, 10, row[2] or 'N/A', 1, 0)
+            pdf.cell(20, 10, row[3], 1, 0, 'C')
+            pdf.cell(30, 10, donation_text, 1, 0, 'C')
+            pdf.cell(20, 10, str(row[5]), 1, 0, 'C')
+
+            if next_donation:
+                if next_donation[0] <= today:
+                    pdf.set_text_color(0, 128, 0)  # Verde
+                    next_text = "PODE DOAR"
+                else:
+                    pdf.set_text_color(0, 0, 0)  # Preto
+                    next_text = next_donation[1]
+            else:
+                next_text = "N/A"
+
+            pdf.cell(30, 10, next_text, 1, 1, 'C')
+            pdf.set_text_color(0, 0, 0)
+
+            if len(date_cache) > DATE_CACHE_LIMIT:
+                date_cache.clear()
+
+        progress(0.8, 'Estatísticas')
+
+        # Estatísticas (na última parte)
+        pdf = parts.pdf
+        pdf.ln(10)
+        pdf.set_font('Arial', 'B', 12)
+        pdf.cell(0, 10, 'Estatísticas', 0, 1)
+        pdf.set_font('Arial', '', 10)
+
+        pdf.cell(0, 10, f'Total de Doações: {total_count}', 0, 1)
+        pdf.cell(0, 10, f'Volume Total Coletado: {total_ml} ml', 0, 1)
+
+        # Doações por tipo (se não estiver filtrado)
+        if blood_type == 'Todos':
+            pdf.ln(5)
+            pdf.cell(0, 10, 'Doações por Tipo Sanguíneo:', 0, 1)
+
+            cursor = conn.execute(f'''
+                SELECT donor_blood_type, COUNT(*), SUM(quantity)
+                FROM donations
+                {where}
+                GROUP BY donor_blood_type
+                ORDER BY COUNT(*) DESC
+            ''', params)
+
+            pdf.set_fill_color(200, 220, 255)
+            pdf.cell(40, 10, 'Tipo Sanguíneo', 1, 0, 'C', 1)
+            pdf.cell(30, 10, 'Doações', 1, 0, 'C', 1)
+            pdf.cell(40, 10, 'Volume Total (ml)', 1, 1, 'C', 1)
+
+            pdf.set_fill_color(255, 255, 255)
+
+            for row in cursor:
+                pdf.cell(40, 10, row[0], 1, 0, 'C')
+                pdf.cell(30, 10, str(row[1]), 1, 0, 'C')
+                pdf.cell(40, 10, str(row[2]), 1, 1, 'C')
+
+        progress(0.9, 'Gravando arquivo')
+        parts.close()
+        return output_path
+    finally:
+        conn.close()
+
+
+REQUEST_STATUS_FILTERS = {"Todas": None, "Pendentes": "pending", "Aprovadas": "approved", "Rejeitadas": "rejected"}
+
+STATUS_LABELS = {
+    'pending': 'Pendente',
+    'approved': 'Aprovada',
+    'rejected': 'Rejeitada'
+}
+
+
+def render_request_report(db_path, output_path, issued_by, filter_status='Todas', request_id=None,
+                          blood_type='Todos', date_from=None, date_to=None, progress=_no_progress):
+    """Gera relatório PDF das requisições (individual ou lista filtrada)"""
+    conn = _connect(db_path)
+    try:
+        # Título
+        title = 'Relatório de Requisições de Sangue'
+        if filter_status != 'Todas':
+            title += f' ({filter_status})'
+
+        if request_id is not None:
+            pdf = FPDF()
+            _header(pdf, title, issued_by)
+
+            # Relatório individual
+            request_data = conn.execute('''
+                SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status,
+                       r.urgency, r.patient_info, r.response_date, u2.name
+                FROM requests r
+                JOIN users u ON r.requesting_doctor = u.id
+                LEFT JOIN users u2 ON r.responding_staff = u2.id
+                WHERE r.id = ?
+            ''', (request_id,)).fetchone()
+
+            if request_data:
+                pdf.set_font('Arial', 'B', 14)
+                pdf.cell(0, 10, f'Requisição #{request_id}', 0, 1)
+                pdf.set_font('Arial', '', 12)
+
+                fields = [
+                    ("Tipo Sanguíneo:", request_data[1]),
+                    ("Quantidade:", str(request_data[2])),
+                    ("Médico Solicitante:", request_data[3]),
+                    ("Data da Requisição:", request_data[4]),
+                    ("Status:", STATUS_LABELS.get(request_data[5], request_data[5])),
+                    ("Urgência:", request_data[6] or "Normal"),
+                    ("Informações do Paciente:", request_data[7] or "Não informado"),
+                    ("Data da Resposta:", request_data[8] or "N/A"),
+                    ("Responsável pela Resposta:", request_data[9] or "N/A")
+                ]
+
+                for label, value in fields:
+                    pdf.cell(50, 10, label, 0, 0)
+                    pdf.cell(0, 10, value, 0, 1)
+
+            progress(0.95, 'Gravando arquivo')
+            pdf.output(output_path)
+        else:
+            # Relatório múltiplo
+            conditions, params = _period_conditions('r.request_date', date_from, date_to)
+            status = REQUEST_STATUS_FILTERS[filter_status]
+            if status:
+                conditions.append("r.status = ?")
+                params.append(status)
+            if blood_type != 'Todos':
+                conditions.append("r.blood_type = ?")
+                params.append(blood_type)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            period = _period_label(date_from, date_to)
+
+            def start_part(pdf, part):
+                if part == 1:
+                    _header(pdf, title, issued_by)
+                    if blood_type != 'Todos':
+                        pdf.cell(0, 10, f'Filtro: Tipo Sanguíneo {blood_type}', 0, 1)
+                    if period:
+                        pdf.cell(0, 10, period, 0, 1)
+                else:
+                    _header(pdf, title, issued_by, subtitle=f'Parte {part} (continuação)')
+
+                pdf.set_font('Arial', 'B', 12)
+                pdf.cell(15, 10, 'ID', 1, 0, 'C', 1)
+                pdf.cell(30, 10, 'Tipo', 1, 0, 'C', 1)
+                pdf.cell(25, 10, 'Qtd', 1, 0, 'C', 1)
+                pdf.cell(60, 10, 'Médico', 1, 0, 'C', 1)
+                pdf.cell(40, 10, 'Data', 1, 0, 'C', 1)
+                pdf.cell(20, 10, 'Status', 1, 1, 'C', 1)
+
+                pdf.set_font('Arial', '', 10)
+
+            parts = _PartedReport(output_path, start_part)
+
+            total = conn.execute(f"SELECT COUNT(*) FROM requests r {where}", params).fetchone()[0]
+            cursor = conn.execute(f'''
+                SELECT r.id, r.blood_type, r.quantity, u.name, r.request_date, r.status
+                FROM requests r
+                JOIN users u ON r.requesting_doctor = u.id
+                {where}
+                ORDER BY r.request_date DESC
+            ''', params)
+
+            for index, row in enumerate(_iter_rows(cursor)):
+                if index % PROGRESS_EVERY_ROWS == 0:
+                    progress(0.9 * index / max(total, 1), f'Requisições: {index}/{total}')
+
+                pdf = parts.row()
+                pdf.cell(15, 10, str(row[0]), 1, 0, 'C')
+                pdf.cell(30, 10, row[1], 1, 0, 'C')
+                pdf.cell(25, 10, str(row[2]), 1, 0, 'C')
+                pdf.cell(60, 10, row[3], 1, 0)
+                pdf.cell(40, 10, row[4], 1, 0, 'C')
+
+                status_text = STATUS_LABELS.get(row[5], row[5])
+
+                # Cores para status
+                if status_text == 'Aprovada':
+                    pdf.set_text_color(0, 128, 0)  # Verde
+                elif status_text == 'Rejeitada':
+                    pdf.set_text_color(255, 0, 0)  # Vermelho
+
+                pdf.cell(20, 10, status_text, 1, 1, 'C')
+                pdf.set_text_color(0, 0, 0)  # Volta ao preto
+
+            progress(0.95, 'Gravando arquivo')
+            parts.close()
+        return output_path
+    finally:
+        conn.close()
+
+
+def render_analytics_report(db_path, output_path, issued_by, blood_type, days_to_predict=7,
+                            progress=_no_progress):
+    """Gera relatório PDF completo de análises"""
+    conn = _connect(db_path)
+    try:
+        progress(0.1, 'Consultando dados')
+        data = analytics_dataset(conn, blood_type, days_to_predict)
+    finally:
+        conn.close()
+
+    current_stock = data['current_stock']
+    min_stock = data['min_stock']
+
+    pdf = FPDF()
+    _header(pdf, 'Relatório de Análise Preditiva', issued_by, subtitle=f'Tipo Sanguíneo: {blood_type}')
+
+    # Seção 1: Estoque Atual
+    progress(0.5, 'Situação do estoque')
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, '1. Situação Atual do Estoque', 0, 1)
+    pdf.set_font('Arial', '', 12)
+
+    pdf.cell(0, 10, f'- Estoque atual: {current_stock} unidades', 0, 1)
+    pdf.cell(0, 10, f'- Estoque mínimo recomendado: {min_stock} unidades', 0, 1)
+
+    status = "✅ Suficiente" if current_stock >= min_stock else "⚠️ Abaixo do mínimo"
+    pdf.cell(0, 10, f'- Status: {status}', 0, 1)
+    pdf.ln(5)
+
+    # Seção 2: Análise de Demanda
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, '2. Análise de Demanda', 0, 1)
+    pdf.set_font('Arial', '', 12)
+
+    # Demanda dos últimos 30 dias
+    avg_demand, max_demand, min_demand = data['recent_usage']
+
+    if avg_demand:
+        pdf.cell(0, 10, f'- Demanda média (últimos 30 dias): {avg_demand:.1f} unidades/dia', 0, 1)
+        pdf.cell(0, 10, f'- Máxima diária: {max_demand:.1f} unidades', 0, 1)
+        pdf.cell(0, 10, f'- Mínima diária: {min_demand:.1f} unidades', 0, 1)
+    else:
+        pdf.cell(0, 10, '- Sem dados de demanda nos últimos 30 dias', 0, 1)
+
+    pdf.ln(5)
+
+    # Seção 3: Previsão
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, '3. Previsão de Demanda', 0, 1)
+    pdf.set_font('Arial', '', 12)
+
+    has_forecast = data['predictions'] is not None
+
+    if has_forecast:
+        pdf.cell(0, 10, f'- Período de previsão: {days_to_predict} dias', 0, 1)
+        pdf.cell(0, 10, f'- Demanda total prevista: {data["total_predicted"]:.1f} unidades', 0, 1)
+        pdf.cell(0, 10, f'- Demanda média prevista: {data["avg_predicted"]:.1f} unidades/dia', 0, 1)
+        pdf.cell(0, 10, f'- Pico de demanda previsto: {data["peak_demand"]:.1f} unidades', 0, 1)
+
+        # Adicionar gráfico de previsão
+        progress(0.6, 'Gráfico de previsão')
+        pdf.ln(10)
+        pdf.set_font('Arial', 'B', 12)
+        pdf.cell(0, 10, 'Gráfico de Previsão de Demanda', 0, 1)
+
+        # Gráfico renderizado em memória (reaproveitado do cache em disco se as séries não mudaram)
+        png = forecast_chart_png(blood_type, data['dates'], data['usages'],
+                                 data['future_dates'], data['predictions'],
+                                 cache_dir=chart_cache_dir(output_path))
+        pdf.image(io.BytesIO(png), x=10, w=190)
+    else:
+        pdf.cell(0, 10, '- Dados insuficientes para previsão (mínimo 30 dias de histórico)', 0, 1)
+
+    pdf.ln(10)
+
+    # Seção 4: Recomendações
+    progress(0.8, 'Recomendações')
+    pdf.set_font('Arial', 'B', 14)
+    pdf.cell(0, 10, '4. Recomendações', 0, 1)
+    pdf.set_font('Arial', '', 12)
+
+    if has_forecast:
+        deficit = data['deficit']
+
+        if deficit <= 0:
+            pdf.cell(0, 10, '- Estoque suficiente para atender à demanda prevista e manter o mínimo recomendado.', 0, 1)
+        else:
+            pdf.cell(0, 10, f'- Estoque insuficiente. Déficit previsto: {deficit:.1f} unidades', 0, 1)
+            pdf.cell(0, 10, f'- Recomendação: Obter pelo menos {max(deficit, min_stock)} unidades adicionais', 0, 1)
+
+            if data['eligible_donors'] > 0:
+                pdf.cell(0, 10, f'- {data["eligible_donors"]} doadores deste tipo podem doar novamente. Considere contatá-los.', 0, 1)
+    else:
+        pdf.cell(0, 10, '- Coletar mais dados históricos para gerar recomendações precisas.', 0, 1)
+
+    progress(0.95, 'Gravando arquivo')
+    pdf.output(output_path)
+    return output_path
+
+RENDERERS = {
+    'stock': render_stock_report,
+    'donations': render_donation_report,
+    'requests': render_request_report,
+    'analytics': render_analytics_report,
+}
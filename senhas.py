@@ -0,0 +1,65 @@
+"""Hash e verificação de senhas (bcrypt) com custo configurável
+
+O custo do bcrypt (2^rounds iterações) fica na configuração bcrypt_rounds.
+Ao entrar no sistema, se o hash gravado usa um custo diferente do atual, a
+senha recém-verificada é recodificada com o custo novo (`check_login`),
+então mudar a política não exige redefinir as senhas de ninguém.
+
+A verificação é lenta de propósito; a interface a executa fora da thread do
+Tk. O bcrypt libera o GIL durante o cálculo, então a tela continua
+respondendo enquanto a senha é conferida.
+"""
+import bcrypt
+
+from configuracoes import get_setting
+
+SETTING_BCRYPT_ROUNDS = 'bcrypt_rounds'
+DEFAULT_BCRYPT_ROUNDS = 12
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+
+# Hashes fictícios por custo, conferidos quando o usuário não existe para
+# que a resposta demore o mesmo que a de um usuário real
+_dummy_hashes = {}
+
+
+def bcrypt_rounds(conn):
+    """Custo configurado, limitado à faixa aceita pela política"""
+    try:
+        rounds = int(get_setting(conn, SETTING_BCRYPT_ROUNDS, DEFAULT_BCRYPT_ROUNDS))
+    except ValueError:
+        return DEFAULT_BCRYPT_ROUNDS
+    return min(max(rounds, MIN_BCRYPT_ROUNDS), MAX_BCRYPT_ROUNDS)
+
+
+def hash_password(password, rounds=DEFAULT_BCRYPT_ROUNDS):
+    """Gera o hash bcrypt da senha com o custo indicado"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def verify_password(hashed_password, password):
+    """Confere a senha com o hash gravado"""
+    return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+
+def hash_rounds(hashed_password):
+    """Custo com que o hash foi gerado ($2b$<custo>$...)"""
+    return int(hashed_password.split('$')[2])
+
+
+def check_login(hashed_password, password, rounds):
+    """Confere a senha e, se o custo do hash mudou, gera o hash novo
+
+    Retorna (senha_correta, hash_novo_ou_None). Com `hashed_password` None
+    (usuário inexistente) confere um hash fictício e retorna (False, None).
+    """
+    if hashed_password is None:
+        if rounds not in _dummy_hashes:
+            _dummy_hashes[rounds] = bcrypt.hashpw(b'hemolife', bcrypt.gensalt(rounds))
+        bcrypt.checkpw(password.encode('utf-8'), _dummy_hashes[rounds])
+        return False, None
+    if not verify_password(hashed_password, password):
+        return False, None
+    if hash_rounds(hashed_password) != rounds:
+        return True, hash_password(password, rounds)
+    return True, None
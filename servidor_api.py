@@ -0,0 +1,420 @@
+"""Serviço HTTP/JSON local que centraliza o acesso ao banco
+
+Um único processo abre o banco e atende os postos de trabalho pela rede, em
+vez de cada máquina gravar direto no arquivo compartilhado. Feito só com a
+biblioteca padrão (asyncio):
+
+- gravações passam por uma única thread com a única conexão de escrita,
+  então nunca disputam o bloqueio do banco;
+- leituras usam um pool de threads, cada uma com sua conexão somente
+  leitura (o banco fica em modo WAL, leitores não esperam o gravador);
+- respostas GET levam um ETag calculado a partir dos contadores de versão
+  das tabelas envolvidas (table_versions) e do registro de alterações;
+  se o cliente manda If-None-Match com o mesmo valor, a resposta é 304 sem
+  nenhuma consulta aos dados.
+
+Autenticação: POST /login com usuário e senha devolve um token, enviado
+depois no cabeçalho "Authorization: Bearer <token>".
+
+Rotas:
+    POST /login                       {"username", "password"}
+    GET  /estoque
+    GET  /requisicoes?status=&limite= (médicos veem só as próprias)
+    POST /requisicoes                 {"blood_type", "quantity", "urgency", "patient_info"}
+    POST /requisicoes/<id>/aprovar
+    POST /requisicoes/<id>/rejeitar   {"reason"}
+    GET  /doacoes?tipo=&limite=
+    POST /doacoes                     {"donor_name", "donor_cpf", "blood_type", "donation_date", "quantity"}
+    GET  /alertas
+    POST /alertas/<id>/lido
+
+Uso: python servidor_api.py [--host 0.0.0.0] [--porta 8080] [--leitores 4] [--db BANCO]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+import operacoes
+from operacoes import OperationError
+from esquema import create_schema
+from alteracoes import last_change_seq, REPORT_TABLES
+from copia_leitura import enable_wal
+from senhas import check_login, bcrypt_rounds
+
+DB_NAME = 'blood_bank.db'
+DEFAULT_PORT = 8080
+DEFAULT_READERS = 4
+TOKEN_TTL_SECONDS = 12 * 60 * 60
+MAX_BODY_BYTES = 1024 * 1024
+RESPONSE_CACHE_SIZE = 256
+DEFAULT_LIMIT = 200
+MAX_LIMIT = 5000
+
+STAFF_ROLES = ('admin', 'technician')
+ALL_ROLES = ('admin', 'technician', 'doctor')
+
+
+class HTTPError(Exception):
+    """Erro devolvido ao cliente com o status indicado"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Database:
+    """Uma conexão de escrita numa thread dedicada e um pool de conexões de leitura"""
+
+    def __init__(self, db_path, readers=DEFAULT_READERS):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gravador')
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix='leitor')
+
+    def _write_conn(self):
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(self.db_path)
+        return self._local.conn
+
+    def _read_conn(self):
+        if not hasattr(self._local, 'conn'):
+            self._local.conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        return self._local.conn
+
+    async def write(self, func, *args):
+        """Executa `func(conn, *args)` na thread de escrita"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, lambda: func(self._write_conn(), *args))
+
+    async def read(self, func, *args):
+        """Executa `func(conn, *args)` numa das threads de leitura"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: func(self._read_conn(), *args))
+
+    def prepare(self):
+        """Garante o modo WAL e o esquema completo (inclusive versões e alterações usadas pelo ETag)"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            enable_wal(conn)
+            create_schema(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def close(self):
+        """Encerra as threads (as conexões fecham com elas)"""
+        self._writer.shutdown()
+        self._readers.shutdown()
+
+
+def _watermark(conn, tables, user_id=None):
+    """Versões das tabelas lidas por uma rota (base do ETag)"""
+    versions = dict(conn.execute(
+        f"SELECT table_name, version FROM table_versions WHERE table_name IN ({', '.join('?' for _ in tables)})",
+        tables).fetchall()) if tables else {}
+    if user_id is not None:
+        # Alertas não têm contador próprio: vale a última alteração registrada
+        versions['alerts'] = last_change_seq(conn, 'alerts')
+    return versions
+
+
+def _int_param(query, name, default, maximum):
+    """Parâmetro inteiro da query string"""
+    value = query.get(name, [default])[0]
+    try:
+        return min(int(value), maximum)
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Parâmetro inválido: {name}")
+
+
+class ApiServer:
+    """Rotas, autenticação e cache de respostas do serviço"""
+
+    def __init__(self, db):
+        self.db = db
+        self.tokens = {}
+        self._responses = OrderedDict()
+        self._login_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='login')
+        self.routes = [
+            ('POST', re.compile(r'^/login$'), self.login, None),
+            ('GET', re.compile(r'^/estoque$'), self.get_stock, ALL_ROLES),
+            ('GET', re.compile(r'^/requisicoes$'), self.get_requests, ALL_ROLES),
+            ('POST', re.compile(r'^/requisicoes$'), self.post_request, ('admin', 'doctor')),
+            ('POST', re.compile(r'^/requisicoes/(\d+)/aprovar$'), self.approve, STAFF_ROLES),
+            ('POST', re.compile(r'^/requisicoes/(\d+)/rejeitar$'), self.reject, STAFF_ROLES),
+            ('GET', re.compile(r'^/doacoes$'), self.get_donations, STAFF_ROLES),
+            ('POST', re.compile(r'^/doacoes$'), self.post_donation, STAFF_ROLES),
+            ('GET', re.compile(r'^/alertas$'), self.get_alerts, ALL_ROLES),
+            ('POST', re.compile(r'^/alertas/(\d+)/lido$'), self.read_alert, ALL_ROLES),
+        ]
+
+    # Autenticação
+
+    def _user_for(self, headers):
+        """Usuário dono do token do cabeçalho Authorization"""
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        session = self.tokens.get(token.strip()) if scheme.lower() == 'bearer' else None
+        if not session or session['expires'] < time.monotonic():
+            self.tokens.pop(token.strip(), None)
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Token ausente ou expirado")
+        return session['user']
+
+    async def login(self, user, match, query, body):
+        username = str(body.get('username', ''))
+        password = str(body.get('password', ''))
+        if not username or not password:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Informe usuário e senha")
+
+        def load(conn):
+            row = conn.execute(
+                "SELECT id, name, role, password, is_active FROM users WHERE username = ?", (username,)).fetchone()
+            return row, bcrypt_rounds(conn)
+
+        row, rounds = await self.db.read(load)
+        loop = asyncio.get_running_loop()
+        valid, new_hash = await loop.run_in_executor(
+            self._login_executor, check_login, row[3] if row else None, password, rounds)
+        if not valid or not row[4]:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Credenciais inválidas")
+
+        def record_login(conn):
+            if new_hash:
+                conn.execute("UPDATE users SET password = ? WHERE id = ?", (new_hash, row[0]))
+            conn.execute("UPDATE users SET last_login = ? WHERE id = ?", (datetime.now().isoformat(), row[0]))
+            conn.commit()
+
+        await self.db.write(record_login)
+        token = secrets.token_urlsafe(32)
+        session_user = {'id': row[0], 'name': row[1], 'role': row[2]}
+        self.tokens[token] = {'user': session_user, 'expires': time.monotonic() + TOKEN_TTL_SECONDS}
+        return HTTPStatus.OK, {'token': token, 'user': session_user, 'expires_in': TOKEN_TTL_SECONDS}
+
+    # Leituras com ETag
+
+    async def cached_get(self, headers, key, tables, fetch, user_id=None):
+        """Responde 304 se o ETag do cliente ainda vale, senão consulta (ou usa o cache)"""
+        watermark = await self.db.read(_watermark, tables, user_id)
+        etag = '"' + hashlib.sha1(json.dumps([key, watermark], sort_keys=True, default=str)
+                                  .encode('utf-8')).hexdigest() + '"'
+        if headers.get('if-none-match') == etag:
+            return HTTPStatus.NOT_MODIFIED, None, etag
+
+        payload = self._responses.get(etag)
+        if payload is None:
+            payload = await self.db.read(fetch)
+            self._responses[etag] = payload
+            if len(self._responses) > RESPONSE_CACHE_SIZE:
+                self._responses.popitem(last=False)
+        else:
+            self._responses.move_to_end(etag)
+        return HTTPStatus.OK, payload, etag
+
+    async def get_stock(self, user, match, query, body, headers=None):
+        return await self.cached_get(headers, ['estoque'], REPORT_TABLES['stock'],
+                                     operacoes.stock_summary)
+
+    async def get_requests(self, user, match, query, body, headers=None):
+        status = query.get('status', [None])[0]
+        if status and status not in operacoes.REQUEST_STATUSES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Status inválido: {status}")
+        limit = _int_param(query, 'limite', DEFAULT_LIMIT, MAX_LIMIT)
+        doctor_id = user['id'] if user['role'] == 'doctor' else None
+        return await self.cached_get(
+            headers, ['requisicoes', status, doctor_id, limit], REPORT_TABLES['requests'],
+            lambda conn: operacoes.list_requests(conn, status, doctor_id, limit))
+
+    async def get_donations(self, user, match, query, body, headers=None):
+        blood_type = query.get('tipo', [None])[0]
+        limit = _int_param(query, 'limite', DEFAULT_LIMIT, MAX_LIMIT)
+        return await self.cached_get(
+            headers, ['doacoes', blood_type, limit], REPORT_TABLES['donations'],
+            lambda conn: operacoes.list_donations(conn, blood_type, limit))
+
+    async def get_alerts(self, user, match, query, body, headers=None):
+        return await self.cached_get(
+            headers, ['alertas', user['id']], (),
+            lambda conn: operacoes.list_alerts(conn, user['id']), user_id=user['id'])
+
+    # Gravações (serializadas na thread de escrita)
+
+    async def post_request(self, user, match, query, body):
+        try:
+            quantity = int(body.get('quantity'))
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Quantidade inválida")
+        request_id = await self.db.write(
+            operacoes.submit_request, user['id'], str(body.get('blood_type', '')), quantity,
+            body.get('urgency') or 'Normal', str(body.get('patient_info', '')))
+        return HTTPStatus.CREATED, {'id': request_id}
+
+    async def approve(self, user, match, query, body):
+        request_id = int(match.group(1))
+        blood_type, quantity = await self.db.write(operacoes.approve_request, request_id, user['id'])
+        return HTTPStatus.OK, {'id': request_id, 'status': 'approved', 'blood_type': blood_type, 'quantity': quantity}
+
+    async def reject(self, user, match, query, body):
+        request_id = int(match.group(1))
+        reason = str(body.get('reason', '')).strip()
+        if not reason:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Informe o motivo da rejeição")
+        await self.db.write(operacoes.reject_request, request_id, user['id'], reason)
+        return HTTPStatus.OK, {'id': request_id, 'status': 'rejected'}
+
+    async def post_donation(self, user, match, query, body):
+        try:
+            quantity = int(body.get('quantity'))
+            donation_date = datetime.strptime(str(body.get('donation_date')), '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Quantidade ou data (AAAA-MM-DD) inválida")
+        fields = [str(body.get(key, '')).strip() for key in ('donor_name', 'donor_cpf', 'blood_type')]
+        if not all(fields):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Informe nome, CPF e tipo sanguíneo do doador")
+        donation_id = await self.db.write(operacoes.register_donation, *fields, donation_date, quantity)
+        return HTTPStatus.CREATED, {'id': donation_id}
+
+    async def read_alert(self, user, match, query, body):
+        alert_id = int(match.group(1))
+        await self.db.write(operacoes.mark_alert_read, alert_id, user['id'])
+        return HTTPStatus.OK, {'id': alert_id, 'status': 'read'}
+
+    # HTTP
+
+    async def dispatch(self, method, target, headers, raw_body):
+        """Encaminha a requisição para a rota; devolve (status, corpo, etag)"""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        for route_method, pattern, handler, roles in self.routes:
+            match = pattern.match(url.path)
+            if not match or route_method != method:
+                continue
+
+            body = {}
+            if method == 'POST' and raw_body:
+                try:
+                    body = json.loads(raw_body.decode('utf-8'))
+                except (UnicodeDecodeError, ValueError):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Corpo JSON inválido")
+                if not isinstance(body, dict):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "O corpo deve ser um objeto JSON")
+
+            user = None
+            if roles is not None:
+                user = self._user_for(headers)
+                if user['role'] not in roles:
+                    raise HTTPError(HTTPStatus.FORBIDDEN, "Perfil sem permissão para esta operação")
+
+            if method == 'GET':
+                return await handler(user, match, query, body, headers=headers)
+            status, payload = await handler(user, match, query, body)
+            return status, payload, None
+
+        if any(pattern.match(url.path) for _, pattern, _, _ in self.routes):
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Método não permitido")
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Rota não encontrada")
+
+    async def handle_connection(self, reader, writer):
+        """Atende as requisições de uma conexão (com keep-alive)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        {'error': "Corpo grande demais"}, keep_alive=False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b''
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    status, payload, etag = await self.dispatch(method.upper(), target, headers, raw_body)
+                except HTTPError as e:
+                    status, payload, etag = e.status, {'error': e.message}, None
+                except OperationError as e:
+                    status, payload, etag = HTTPStatus.CONFLICT, {'error': str(e)}, None
+                except sqlite3.Error as e:
+                    status, payload, etag = HTTPStatus.SERVICE_UNAVAILABLE, {'error': f"Falha no banco: {e}"}, None
+
+                await self._respond(writer, status, payload, etag, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, etag=None, keep_alive=True):
+        """Grava a resposta HTTP com corpo JSON"""
+        body = b'' if payload is None else json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        lines = [f"HTTP/1.1 {status.value} {status.phrase}"]
+        if payload is not None:
+            lines.append("Content-Type: application/json; charset=utf-8")
+        lines.append(f"Content-Length: {len(body)}")
+        if etag:
+            lines.append(f"ETag: {etag}")
+            lines.append("Cache-Control: no-cache")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(host, port, db_path, readers):
+    """Sobe o serviço e atende até ser interrompido"""
+    db = Database(db_path, readers)
+    db.prepare()
+    api = ApiServer(db)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    print(f"✅ Hemolife Pro API em http://{host}:{port} (banco: {db_path})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    """Lê os argumentos e inicia o serviço"""
+    parser = argparse.ArgumentParser(description="Serviço HTTP/JSON do Hemolife Pro.")
+    parser.add_argument('--host', default='127.0.0.1', help="Endereço de escuta (padrão: 127.0.0.1)")
+    parser.add_argument('--porta', type=int, default=DEFAULT_PORT, help=f"Porta (padrão: {DEFAULT_PORT})")
+    parser.add_argument('--leitores', type=int, default=DEFAULT_READERS,
+                        help=f"Conexões de leitura em paralelo (padrão: {DEFAULT_READERS})")
+    parser.add_argument('--db', default=DB_NAME, help=f"Banco de dados (padrão: {DB_NAME})")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.porta, args.db, args.leitores))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,469 @@
+"""Cadastro das bolsas (unidades) pelo código de barras da etiqueta
+
+Cada bolsa tem uma linha em units com o código impresso na etiqueta
+("{tipo}-{id}" das doações, como em gerar_codigo_barras.py, ou
+"{tipo}-R{id do estoque}-{n}" das bolsas de uma remessa), sob um índice
+único. Doações e remessas registram as bolsas ao entrar no estoque; a
+leitura do código no posto resolve a bolsa direto pelo índice, ou por um
+cache em memória carregado uma vez (UnitCache).
+
+Entrada (scan_in): uma bolsa que saiu volta ao estoque; um código ainda
+desconhecido (bolsa vinda de outro hemocentro) é cadastrado na hora, com o
+tipo sanguíneo tirado do próprio código. Saída (scan_out): a bolsa deixa o
+estoque. As duas gravam o movimento correspondente em stock, então o saldo
+por tipo continua vindo só de stock.
+
+A aprovação de uma requisição grava a saída em stock e dá baixa nas bolsas
+que a atendem (reserve_units), marcadas com o id da requisição e ainda sem
+leitura. A leitura da saída dessas bolsas só registra a hora, sem outro
+movimento: cada bolsa sai do saldo uma vez só.
+
+Para receber uma entrega inteira há a sessão de entrada (ScanSession): os
+códigos lidos em sequência (leitor USB ou câmera) passam por um conjunto dos
+já lidos, ficam num buffer e são gravados em grupo, numa transação a cada
+SESSION_BATCH_SIZE leituras ou SESSION_FLUSH_MS milissegundos.
+"""
+import re
+import sqlite3
+import time
+from collections import Counter, namedtuple
+from datetime import date, datetime, timedelta
+
+UNIT_STATUSES = ('in_stock', 'out')
+CODE_PATTERN = re.compile(r'^(?:AB|A|B|O)[+-]')
+SHELF_LIFE_DAYS = 42  # Validade de uma bolsa a partir da coleta
+SESSION_BATCH_SIZE = 50  # Leituras gravadas por transação na sessão de entrada
+SESSION_FLUSH_MS = 500  # Tempo máximo de uma leitura no buffer antes de ser gravada
+
+UNIT_COLUMNS = 'id, code, blood_type, quantity, status, stock_id, donation_id, expiration_date'
+Unit = namedtuple('Unit', 'id code blood_type quantity status stock_id donation_id expiration_date')
+
+
+class UnitError(Exception):
+    """Leitura recusada (código inválido, bolsa já no estoque ou já retirada)"""
+
+
+def create_units_table(conn):
+    """Cria a tabela units e, na primeira vez, registra as bolsas das doações já existentes"""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'units'"
+    ).fetchone()
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS units (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT NOT NULL,
+            blood_type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'in_stock' CHECK(status IN ('in_stock', 'out')),
+            stock_id INTEGER,
+            donation_id INTEGER,
+            expiration_date TEXT,
+            scanned_in TEXT,
+            scanned_out TEXT,
+            out_reason TEXT,
+            request_id INTEGER,
+            FOREIGN KEY (stock_id) REFERENCES stock(id),
+            FOREIGN KEY (donation_id) REFERENCES donations(id),
+            FOREIGN KEY (request_id) REFERENCES requests(id)
+        )''')
+    if 'request_id' not in {row[1] for row in conn.execute("PRAGMA table_info(units)")}:
+        conn.execute("ALTER TABLE units ADD COLUMN request_id INTEGER REFERENCES requests(id)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_units_code ON units(code)")
+
+    if not exists:
+        backfill_units(conn)
+
+
+def backfill_units(conn):
+    """Registra as bolsas das doações anteriores ao cadastro (carga única, sem commit)
+
+    As etiquetas antigas já usavam "{tipo}-{id}". As aprovações antigas
+    baixaram o estoque sem dizer quais bolsas saíram, então só ficam no
+    estoque as bolsas dentro da validade que o saldo atual do tipo cobre,
+    das mais novas para as mais antigas (as mais antigas saíram primeiro);
+    as demais entram como já retiradas.
+    """
+    conn.execute(f'''
+        INSERT OR IGNORE INTO units (code, blood_type, quantity, status, donation_id, expiration_date)
+        SELECT donor_blood_type || '-' || id, donor_blood_type, quantity, 'out',
+               id, date(donation_date, '+{SHELF_LIFE_DAYS} days')
+        FROM donations
+    ''')
+
+    balances = dict(conn.execute("SELECT blood_type, SUM(quantity) FROM stock GROUP BY blood_type"))
+    in_stock = []
+    for unit_id, blood_type, quantity in conn.execute('''
+        SELECT id, blood_type, quantity FROM units
+        WHERE expiration_date >= date('now', 'localtime')
+        ORDER BY expiration_date DESC, id DESC
+    ''').fetchall():
+        if quantity <= (balances.get(blood_type) or 0):
+            balances[blood_type] -= quantity
+            in_stock.append((unit_id,))
+    conn.executemany("UPDATE units SET status = 'in_stock' WHERE id = ?", in_stock)
+
+
+def donation_code(blood_type, donation_id):
+    """Código da bolsa de uma doação (mesmo formato de gerar_codigo_barras.py)"""
+    return f"{blood_type}-{donation_id}"
+
+
+def shipment_code(blood_type, stock_id, unit):
+    """Código de uma bolsa de uma linha de remessa"""
+    return f"{blood_type}-R{stock_id}-{unit}"
+
+
+def code_blood_type(code):
+    """Tipo sanguíneo no início do código, ou None"""
+    match = CODE_PATTERN.match(code)
+    return match.group(0) if match else None
+
+
+def shipment_units(stock_id, blood_type, quantity, expiration_date):
+    """Linhas de units (uma por bolsa) de uma entrada de remessa"""
+    return [(shipment_code(blood_type, stock_id, unit), blood_type, 1, stock_id, None, expiration_date)
+            for unit in range(1, quantity + 1)]
+
+
+def register_units(conn, units):
+    """Cadastra bolsas que acabaram de entrar no estoque (sem commit)
+
+    `units` são tuplas (código, tipo, quantidade, id do estoque, id da doação, validade).
+    """
+    conn.executemany('''
+        INSERT INTO units (code, blood_type, quantity, stock_id, donation_id, expiration_date)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', units)
+
+
+def reserve_units(conn, request_id, blood_type, quantity):
+    """Dá baixa nas bolsas que atendem uma requisição aprovada (sem commit); devolve os códigos
+
+    As bolsas que vencem primeiro saem primeiro, até cobrir a quantidade.
+    Ficam com status 'out', o id da requisição e sem hora de leitura; o
+    movimento em stock é o da própria aprovação.
+    """
+    rows = conn.execute('''
+        SELECT id, code, quantity FROM units
+        WHERE blood_type = ? AND status = 'in_stock'
+        ORDER BY expiration_date IS NULL, expiration_date, id
+    ''', (blood_type,)).fetchall()
+    chosen, covered = [], 0
+    for unit_id, code, unit_quantity in rows:
+        if covered >= quantity:
+            break
+        chosen.append((unit_id, code))
+        covered += unit_quantity
+
+    conn.executemany('''
+        UPDATE units SET status = 'out', request_id = ?, out_reason = ?, scanned_out = NULL
+        WHERE id = ? AND status = 'in_stock'
+    ''', [(request_id, f"Requisição #{request_id}", unit_id) for unit_id, _ in chosen])
+    return [code for _, code in chosen]
+
+
+def find_unit(conn, code):
+    """Bolsa pelo código (busca pelo índice único), ou None"""
+    row = conn.execute(f"SELECT {UNIT_COLUMNS} FROM units WHERE code = ?", (code,)).fetchone()
+    return Unit(*row) if row else None
+
+
+class UnitCache:
+    """Índice em memória código -> bolsa, carregado uma vez pelo posto de leitura
+
+    O banco continua sendo a referência: uma leitura que o cache recusaria
+    relê a bolsa do banco antes de recusar, e as gravações conferem o status
+    com um UPDATE condicional (se outro posto mexeu na bolsa nesse meio
+    tempo, a entrada do cache é recarregada).
+    """
+
+    def __init__(self, conn):
+        self.units = {}
+        self.reload(conn)
+
+    def reload(self, conn):
+        """Carrega todas as bolsas do banco"""
+        self.units = {row[1]: Unit(*row) for row in conn.execute(f"SELECT {UNIT_COLUMNS} FROM units")}
+
+    def get(self, conn, code):
+        """Bolsa pelo código; consulta o banco só quando o código não está no cache"""
+        unit = self.units.get(code)
+        if unit is None:
+            unit = find_unit(conn, code)
+            if unit is not None:
+                self.units[code] = unit
+        return unit
+
+    def refresh(self, conn, code):
+        """Relê uma bolsa do banco"""
+        unit = find_unit(conn, code)
+        if unit is None:
+            self.units.pop(code, None)
+        else:
+            self.units[code] = unit
+        return unit
+
+    def __len__(self):
+        return len(self.units)
+
+
+def _is_busy(error):
+    """Erro de banco ocupado/travado por outra conexão"""
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _lookup(conn, code, cache, rejected_status=None):
+    """Bolsa pelo código, pelo cache quando houver
+
+    Se o cache diz que a bolsa está em `rejected_status` (a leitura seria
+    recusada), a bolsa é relida do banco: outro posto pode ter mudado o
+    status depois que o cache foi carregado.
+    """
+    if cache is None:
+        return find_unit(conn, code)
+    unit = cache.get(conn, code)
+    if unit is not None and unit.status == rejected_status:
+        unit = cache.refresh(conn, code)
+    return unit
+
+
+def scan_in(conn, code, cache=None, commit=True):
+    """Entrada de uma bolsa lida; devolve a bolsa atualizada
+
+    Bolsas desconhecidas são cadastradas (uma unidade, validade padrão).
+    """
+    code = code.strip()
+    now = datetime.now().isoformat()
+    unit = _lookup(conn, code, cache, rejected_status='in_stock')
+
+    if unit is None:
+        blood_type = code_blood_type(code)
+        if blood_type is None:
+            raise UnitError(f"Código não reconhecido: {code}")
+        expiration_date = (date.today() + timedelta(days=SHELF_LIFE_DAYS)).isoformat()
+        stock_id = conn.execute('''
+            INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
+            VALUES (?, 1, ?, ?, ?)
+        ''', (blood_type, now, expiration_date, f"Bolsa {code}")).lastrowid
+        unit_id = conn.execute('''
+            INSERT INTO units (code, blood_type, quantity, stock_id, expiration_date, scanned_in)
+            VALUES (?, ?, 1, ?, ?, ?)
+        ''', (code, blood_type, stock_id, expiration_date, now)).lastrowid
+        unit = Unit(unit_id, code, blood_type, 1, 'in_stock', stock_id, None, expiration_date)
+    else:
+        if unit.status == 'in_stock':
+            raise UnitError(f"Bolsa {code} já está no estoque")
+        # Bolsa baixada por requisição e ainda não lida na saída continua fora:
+        # o movimento da aprovação não seria desfeito
+        updated = conn.execute(
+            "UPDATE units SET status = 'in_stock', scanned_in = ?, scanned_out = NULL, out_reason = NULL, "
+            "request_id = NULL WHERE id = ? AND status = 'out' AND (request_id IS NULL OR scanned_out IS NOT NULL)",
+            (now, unit.id)).rowcount
+        if not updated:
+            row = conn.execute("SELECT status, request_id FROM units WHERE id = ?", (unit.id,)).fetchone()
+            if cache is not None:
+                cache.refresh(conn, code)
+            if row and row[0] == 'out':
+                raise UnitError(f"Bolsa {code} reservada para a requisição #{row[1]}")
+            raise UnitError(f"Bolsa {code} já está no estoque")
+        conn.execute('''
+            INSERT INTO stock (blood_type, quantity, entry_date, expiration_date, donor_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (unit.blood_type, unit.quantity, now, unit.expiration_date or now, f"Bolsa {code}"))
+        unit = unit._replace(status='in_stock')
+
+    if commit:
+        conn.commit()
+    if cache is not None:
+        cache.units[code] = unit
+    return unit
+
+
+def _dispatch_reserved(conn, unit, now):
+    """Registra a leitura de uma bolsa já baixada por requisição; False se ela já tinha saído"""
+    return conn.execute('''
+        UPDATE units SET scanned_out = ?
+        WHERE id = ? AND status = 'out' AND request_id IS NOT NULL AND scanned_out IS NULL
+    ''', (now, unit.id)).rowcount > 0
+
+
+def scan_out(conn, code, reason='', cache=None, commit=True):
+    """Saída de uma bolsa lida; devolve a bolsa atualizada
+
+    Uma bolsa já baixada por uma requisição aprovada só tem a leitura
+    registrada. Uma bolsa ainda no estoque toma o lugar da bolsa do mesmo
+    tipo baixada por requisição há mais tempo e ainda não lida (o técnico
+    pegou outra da prateleira), que volta ao estoque; sem requisição à
+    espera, a saída grava o movimento negativo em stock.
+    """
+    code = code.strip()
+    unit = _lookup(conn, code, cache, rejected_status='out')
+    if unit is None:
+        raise UnitError(f"Bolsa não cadastrada: {code}")
+
+    now = datetime.now().isoformat()
+    if unit.status == 'in_stock':
+        updated = conn.execute(
+            "UPDATE units SET status = 'out', scanned_out = ?, out_reason = ? WHERE id = ? AND status = 'in_stock'",
+            (now, reason or None, unit.id)).rowcount
+        if not updated:
+            # Outro posto ou uma aprovação mudou a bolsa depois do cache
+            unit = cache.refresh(conn, code) if cache is not None else find_unit(conn, code)
+            if unit is None or not _dispatch_reserved(conn, unit, now):
+                raise UnitError(f"Bolsa {code} já saiu do estoque")
+        else:
+            reserved = conn.execute('''
+                SELECT id, code, request_id FROM units
+                WHERE blood_type = ? AND quantity = ? AND status = 'out'
+                  AND request_id IS NOT NULL AND scanned_out IS NULL
+                ORDER BY request_id, id LIMIT 1
+            ''', (unit.blood_type, unit.quantity)).fetchone()
+            if reserved:
+                reserved_id, reserved_code, request_id = reserved
+                conn.execute("UPDATE units SET request_id = ?, out_reason = ? WHERE id = ?",
+                             (request_id, f"Requisição #{request_id}", unit.id))
+                conn.execute('''
+                    UPDATE units SET status = 'in_stock', request_id = NULL, out_reason = NULL WHERE id = ?
+                ''', (reserved_id,))
+                if cache is not None:
+                    cache.refresh(conn, reserved_code)
+            else:
+                # Saída do estoque
+                conn.execute('''
+                    INSERT INTO stock (blood_type, quantity, entry_date, expiration_date)
+                    VALUES (?, ?, ?, ?)
+                ''', (unit.blood_type, -unit.quantity, now, now))
+    elif not _dispatch_reserved(conn, unit, now):
+        raise UnitError(f"Bolsa {code} já saiu do estoque")
+    unit = unit._replace(status='out')
+
+    if commit:
+        conn.commit()
+    if cache is not None:
+        cache.units[code] = unit
+    return unit
+
+
+class ScanSession:
+    """Sessão de entrada contínua de bolsas, com gravação em grupo
+
+    `add` confere o código em memória (repetido na sessão, já no estoque
+    pelo cache, formato inválido) e o põe no buffer, então o leitor não
+    espera pelo banco; só uma bolsa que o cache dá como já no estoque é
+    relida do banco antes de ser recusada. `flush` grava o buffer numa transação; quem conduz a
+    sessão chama `flush_if_due` periodicamente para o prazo de
+    SESSION_FLUSH_MS valer também quando as leituras param.
+    """
+
+    def __init__(self, conn, cache=None, batch_size=SESSION_BATCH_SIZE, flush_ms=SESSION_FLUSH_MS):
+        self.conn = conn
+        self.cache = cache if cache is not None else UnitCache(conn)
+        self.batch_size = batch_size
+        self.flush_ms = flush_ms
+        self.seen = set()
+        self.pending = []
+        self.tally = Counter()  # Bolsas gravadas por tipo sanguíneo
+        self.stored = 0
+        self.duplicates = 0
+        self.rejected = []  # (código, motivo)
+        self.flushes = 0
+        self._pending_since = None
+
+    def add(self, code):
+        """Enfileira um código lido; devolve (aceito, mensagem)"""
+        code = code.strip()
+        if not code:
+            return False, "Código vazio"
+        if code in self.seen:
+            self.duplicates += 1
+            return False, f"Bolsa {code} já lida nesta sessão"
+
+        unit = self.cache.units.get(code)
+        if unit is not None and unit.status == 'in_stock':
+            # Confere no banco antes de recusar: outro posto pode ter dado saída na bolsa
+            unit = self.cache.refresh(self.conn, code)
+        if unit is not None and unit.status == 'in_stock':
+            message = f"Bolsa {code} já está no estoque"
+        elif unit is None and code_blood_type(code) is None:
+            message = f"Código não reconhecido: {code}"
+        else:
+            message = None
+        self.seen.add(code)
+        if message:
+            self.rejected.append((code, message))
+            return False, message
+
+        self.pending.append(code)
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True, code
+
+    def due(self):
+        """Se há leituras no buffer há mais de flush_ms"""
+        return (self._pending_since is not None
+                and (time.monotonic() - self._pending_since) * 1000 >= self.flush_ms)
+
+    def flush_if_due(self):
+        """Grava o buffer se o prazo venceu; devolve as bolsas gravadas"""
+        return self.flush() if self.due() else []
+
+    def flush(self):
+        """Grava as leituras do buffer numa única transação; devolve as bolsas gravadas
+
+        Cada leitura roda num SAVEPOINT: uma bolsa que o banco recusa (código
+        já cadastrado por outro posto, restrição violada) é desfeita sozinha e
+        vai para as recusadas, sem derrubar o lote. Só banco ocupado/travado
+        desfaz o lote inteiro e devolve as leituras ao buffer para a próxima
+        tentativa; outros erros recusam o lote, para ele não voltar ao buffer
+        para sempre.
+        """
+        codes, self.pending = self.pending, []
+        self._pending_since = None
+        if not codes:
+            return []
+
+        units, rejected = [], []
+        try:
+            if not self.conn.in_transaction:
+                # Sem transação aberta, o RELEASE do primeiro SAVEPOINT já gravaria a leitura
+                self.conn.execute("BEGIN")
+            for code in codes:
+                self.conn.execute("SAVEPOINT scan")
+                try:
+                    units.append(scan_in(self.conn, code, cache=self.cache, commit=False))
+                except UnitError as e:
+                    rejected.append((code, str(e)))
+                except sqlite3.Error as e:
+                    if isinstance(e, sqlite3.OperationalError) and _is_busy(e):
+                        raise
+                    self.conn.execute("ROLLBACK TO scan")
+                    self.cache.refresh(self.conn, code)
+                    rejected.append((code, f"Bolsa {code} recusada pelo banco: {e}"))
+                self.conn.execute("RELEASE scan")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            # O cache já tinha as bolsas do lote como gravadas
+            for code in codes:
+                self.cache.refresh(self.conn, code)
+            if isinstance(e, sqlite3.OperationalError) and _is_busy(e):
+                self.pending = codes + self.pending
+                self._pending_since = time.monotonic()
+            else:
+                self.rejected.extend((code, f"Lote não gravado: {e}") for code in codes)
+            raise
+
+        self.flushes += 1
+        self.rejected.extend(rejected)
+        self.stored += len(units)
+        for unit in units:
+            self.tally[unit.blood_type] += unit.quantity
+        return units
+
+    def close(self):
+        """Grava o que ainda está no buffer"""
+        return self.flush()